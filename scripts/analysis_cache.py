@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# analysis_cache.py
+# Cache of requirements analysis results keyed by normalized requirements content and extractor version
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requirements_analysis
+from pipeline_metrics import get_metrics
+from stage1_manifest import hash_file, hash_value
+
+DEFAULT_ANALYSIS_CACHE_DIR = os.environ.get(
+    'EFTDM_ANALYSIS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'eftdm', 'requirements-analysis')
+)
+DEFAULT_ANALYSIS_CACHE_MB = 64
+DEFAULT_ANALYSIS_CACHE_DAYS = 30
+
+# Any change to the extraction code invalidates every cached result
+EXTRACTOR_FINGERPRINT = hash_file(requirements_analysis.__file__)
+
+def _hash_lines(lines):
+    """Hash text lines ignoring trailing whitespace (CRLF line ends included), which no extracted item depends on"""
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.rstrip().encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+def hash_requirements_text(text):
+    """Return the hash of normalized requirements text"""
+    return _hash_lines(io.StringIO(text, newline='\n'))
+
+def hash_requirements_file(file_path):
+    """Return the hash of a requirements file's normalized text, read line by line"""
+    with open(file_path, 'r', encoding='utf-8', errors='replace', newline='\n') as f:
+        return _hash_lines(f)
+
+class AnalysisCache:
+    """Stored analysis results (the analysis_results.json payload) with age and size eviction
+
+    An entry is one JSON file named by its key, so a lookup is a single file
+    open. Keys combine the normalized requirements hash, the extractor
+    fingerprint, the rules and any options that shape the result. An entry's
+    mtime is its last use: entries unused for max_age_days are dropped, then
+    the least recently used ones until the cache fits max_mb.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_ANALYSIS_CACHE_DIR, max_mb=DEFAULT_ANALYSIS_CACHE_MB,
+                 max_age_days=DEFAULT_ANALYSIS_CACHE_DAYS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_age = max_age_days * 24 * 60 * 60
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(content_hash, rules, *options):
+        """Return the cache key of one analysis"""
+        return hash_value([EXTRACTOR_FINGERPRINT, rules, list(options), content_hash])
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def fetch(self, key):
+        """Return the cached analysis for key, or None on a miss"""
+        entry = self._entry_path(key)
+        try:
+            with open(entry, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            os.utime(entry)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return payload
+
+    def store(self, key, payload):
+        """Save an analysis under key, then enforce the age and size limits"""
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(temp_path, self._entry_path(key))
+        except (OSError, TypeError, ValueError):
+            _remove_file(temp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        """Remove entries unused for max_age, then least recently used ones until the cache fits its cap"""
+        with self._lock:
+            cutoff = time.time() - self.max_age
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as scan:
+                for item in scan:
+                    if not item.is_file() or not item.name.endswith('.json'):
+                        continue
+                    stat = item.stat()
+                    if stat.st_mtime < cutoff:
+                        _remove_file(item.path)
+                        self.evictions += 1
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                _remove_file(path)
+                self.evictions += 1
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def summary(self):
+        """Return a one-line hit/miss summary for the run"""
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evicted"
+
+def cached_analysis(cache, make_key, analyze):
+    """Return the cached analysis for make_key(), or run analyze() and cache its result
+
+    With no cache this is just analyze(). A hit skips the analysis entirely.
+    """
+    if cache is None:
+        return analyze()
+    key = make_key()
+    payload = cache.fetch(key)
+    if payload is not None:
+        print("🗄️  Analysis cache hit: requirements unchanged, analysis skipped")
+        get_metrics().count('analysis.cache_hits')
+        return payload
+    payload = analyze()
+    cache.store(key, payload)
+    return payload
+
+def _remove_file(path):
+    """Remove a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
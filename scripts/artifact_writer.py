@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# artifact_writer.py
+# Atomic, change-aware writes of generated artifacts with one batched fsync per run
+
+import atexit
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+def _current_umask():
+    """Return the process umask (read once, at import time)"""
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+NEW_FILE_MODE = 0o666 & ~_current_umask()
+CHUNK_SIZE = 1024 * 1024
+
+def files_identical(first_path, second_path):
+    """Whether two files have the same bytes, compared in bounded chunks"""
+    try:
+        if os.path.getsize(first_path) != os.path.getsize(second_path):
+            return False
+        with open(first_path, 'rb') as first, open(second_path, 'rb') as second:
+            while True:
+                first_chunk = first.read(CHUNK_SIZE)
+                if first_chunk != second.read(CHUNK_SIZE):
+                    return False
+                if not first_chunk:
+                    return True
+    except OSError:
+        return False
+
+class ArtifactStream:
+    """Text stream into an artifact's temp file; changed is set once the stream is committed"""
+
+    __slots__ = ('file', 'changed')
+
+    def __init__(self, file):
+        self.file = file
+        self.changed = None
+
+    def write(self, text):
+        return self.file.write(text)
+
+class ArtifactWriter:
+    """Writes files through a temp file in the same directory and an atomic rename
+
+    A file whose content is already identical is left untouched, so its mtime
+    (and any watcher or downstream rebuild keyed on it) does not change. Readers
+    never observe a partially written file. Durability is batched: sync() fsyncs
+    every file written since the last sync and each of their directories once,
+    instead of paying an fsync per artifact.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.written = 0
+        self.unchanged = 0
+        self.bytes_written = 0
+
+    def is_unchanged(self, path, data):
+        """Whether path already holds exactly data"""
+        try:
+            if os.path.getsize(path) != len(data):
+                return False
+            with open(path, 'rb') as f:
+                return f.read() == data
+        except OSError:
+            return False
+
+    def write_bytes(self, path, data):
+        """Atomically replace path with data; return False if the content was already identical"""
+        path = os.path.abspath(path)
+        if self.is_unchanged(path, data):
+            with self.lock:
+                self.unchanged += 1
+            return False
+
+        fd, tmp_path = self._temp_file(path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self._replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        return True
+
+    def copy_file(self, source_path, path):
+        """Atomically replace path with a copy of source_path; return False if the content was already identical"""
+        path = os.path.abspath(path)
+        if files_identical(source_path, path):
+            with self.lock:
+                self.unchanged += 1
+            return False
+
+        fd, tmp_path = self._temp_file(path)
+        try:
+            os.close(fd)
+            shutil.copyfile(source_path, tmp_path)
+            self._replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+        return True
+
+    @contextlib.contextmanager
+    def open_text(self, path, encoding='utf-8'):
+        """Stream text into path without holding it in memory
+
+        The content goes to a temp file; on a clean exit it atomically replaces
+        path, or is dropped if path already holds the same bytes. The yielded
+        stream's changed attribute tells which happened.
+        """
+        path = os.path.abspath(path)
+        fd, tmp_path = self._temp_file(path)
+        try:
+            with os.fdopen(fd, 'w', encoding=encoding, newline='') as f:
+                stream = ArtifactStream(f)
+                yield stream
+            if files_identical(tmp_path, path):
+                _remove_quietly(tmp_path)
+                with self.lock:
+                    self.unchanged += 1
+                stream.changed = False
+            else:
+                self._replace(tmp_path, path)
+                stream.changed = True
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+
+    def write_spliced(self, path, edits):
+        """Atomically replace path with a copy of itself in which each (start, end, data) byte range is replaced
+
+        Edits must be sorted and must not overlap. The unchanged ranges are
+        copied file to file (in the kernel where os.copy_file_range exists), so
+        only the replacement data passes through Python.
+        """
+        path = os.path.abspath(path)
+        fd, tmp_path = self._temp_file(path)
+        try:
+            with open(path, 'rb') as source:
+                position = 0
+                for start, end, data in edits:
+                    _copy_range(source, fd, position, start)
+                    _write_all(fd, data)
+                    position = end
+                _copy_range(source, fd, position, os.fstat(source.fileno()).st_size)
+            os.close(fd)
+            fd = None
+            self._replace(tmp_path, path)
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            _remove_quietly(tmp_path)
+            raise
+        return True
+
+    def _temp_file(self, path):
+        """Create a temp file next to path; return (fd, tmp_path)"""
+        return tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.", suffix='.tmp')
+
+    def _replace(self, tmp_path, path):
+        """Move a finished temp file over path, keeping path's permissions, and queue it for sync"""
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = NEW_FILE_MODE
+        os.chmod(tmp_path, mode)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.pending[path] = os.path.dirname(path)
+            self.written += 1
+            self.bytes_written += size
+
+    def write_text(self, path, text, encoding='utf-8'):
+        """Atomically replace path with text; return False if the content was already identical"""
+        return self.write_bytes(path, text.encode(encoding))
+
+    def write_json(self, path, value, indent=2):
+        """Atomically replace path with value as JSON; return False if the content was already identical"""
+        return self.write_text(path, json.dumps(value, indent=indent))
+
+    def sync(self):
+        """fsync every file written since the last sync, then each of their directories once"""
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+        for path in pending:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for directory in set(pending.values()):
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+            except OSError:
+                continue  # Directories cannot be opened for fsync on Windows
+            try:
+                os.fsync(fd)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+        return len(pending)
+
+    def summary(self):
+        """Return a one-line summary of this writer's activity"""
+        return f"{self.written} written, {self.unchanged} unchanged"
+
+def _write_all(fd, data):
+    """Write all of data to a raw file descriptor"""
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _copy_range(source, fd, start, end):
+    """Append bytes start..end of the open file source to the raw file descriptor fd"""
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while start < end:
+                copied = os.copy_file_range(source.fileno(), fd, end - start, start)
+                if not copied:
+                    break
+                start += copied
+        except OSError:
+            pass  # Not supported between these files; finish in user space
+    source.seek(start)
+    while start < end:
+        chunk = source.read(min(CHUNK_SIZE, end - start))
+        if not chunk:
+            break
+        _write_all(fd, chunk)
+        start += len(chunk)
+
+def _remove_quietly(path):
+    """Remove a file, ignoring errors"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_artifact_writer():
+    """Return the shared writer for this run; pending writes are synced at exit"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ArtifactWriter()
+            atexit.register(_writer.sync)
+        return _writer
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# benchmark-pipeline.py
+# Benchmarks for the Stage 1 Mermaid generation hot paths
+
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from artifact_writer import ArtifactWriter, get_artifact_writer
+from mermaid_diagrams import Chain, Flowchart
+from mermaid_pagination import DEFAULT_PAGE_BUDGET, paginate_diagrams
+from mermaid_rendering import MermaidRenderWorker
+from mermaid_validation import filter_valid_diagrams
+from online_rendering import render_files_online
+from requirements_analysis import (
+    BASIC_RULES, ENHANCED_RULES, ITERATIVE_RULES,
+    extract_requirements, extract_requirements_corpus, extract_requirements_multipass, get_scanner
+)
+from synthetic_corpus import DEFAULT_DENSITY, format_size, parse_density, parse_size, write_requirements_corpus
+
+SAMPLE_REQUIREMENTS = """
+User can login to the system with email and password.
+If the credentials are invalid, the system should display an error message.
+User can upload timesheet files, when the file is larger than 10MB the app must reject it.
+The application should validate the uploaded file format, check the column headers and ensure dates are present.
+System should store timesheet entries, update the approval status and delete draft entries after submission.
+The approval workflow sends the timesheet to the manager, each step is logged.
+Integrate with the payroll service through the HR api for employee records.
+User should review extracted data before submitting.
+"""
+
+def time_call(func, *args, repeat=3):
+    """Return the best wall time of several calls"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def benchmark_analysis(size_mb, repeat):
+    """Compare single-pass extraction against one re.findall pass per category, and time ranked extraction"""
+    copies = max(1, int(size_mb * 1024 * 1024 / len(SAMPLE_REQUIREMENTS)))
+    text = SAMPLE_REQUIREMENTS * copies
+    size = len(text.encode('utf-8'))
+
+    print(f"📋 Requirements analysis on {size / (1024 * 1024):.1f} MB of text")
+    results = {'bytes': size, 'rule_sets': {}}
+    for name, rules in (('basic', BASIC_RULES), ('enhanced', ENHANCED_RULES), ('iterative', ITERATIVE_RULES)):
+        scanner = get_scanner(rules)
+        if scanner.extract(text) != extract_requirements_multipass(text, rules):
+            print(f"❌ {name}: single-pass results differ from multi-pass results")
+            results['rule_sets'][name] = {'error': 'single-pass results differ from multi-pass results'}
+            continue
+        multipass = time_call(extract_requirements_multipass, text, rules, repeat=repeat)
+        single_pass = time_call(scanner.extract, text, repeat=repeat)
+        ranked = time_call(extract_requirements, text, rules, repeat=repeat)
+        results['rule_sets'][name] = {
+            'multipass_seconds': multipass, 'single_pass_seconds': single_pass, 'ranked_seconds': ranked
+        }
+        print(
+            f"   {name:<10} {len(rules)} categories | "
+            f"multi-pass {multipass:.3f}s ({size / multipass / 1e6:.1f} MB/s) | "
+            f"single-pass {single_pass:.3f}s ({size / single_pass / 1e6:.1f} MB/s) | "
+            f"ranked {ranked:.3f}s | speedup {multipass / single_pass:.2f}x"
+        )
+    return results
+
+def benchmark_corpus(size_mb, documents, repeat):
+    """Measure corpus analysis throughput for increasing worker counts"""
+    copies = max(1, int(size_mb * 1024 * 1024 / documents / len(SAMPLE_REQUIREMENTS)))
+    corpus_dir = tempfile.mkdtemp(prefix='requirements-corpus-')
+    try:
+        file_paths = []
+        for index in range(documents):
+            file_path = os.path.join(corpus_dir, f"requirements_{index:03d}.md")
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(SAMPLE_REQUIREMENTS * copies)
+            file_paths.append(file_path)
+        size = sum(os.path.getsize(file_path) for file_path in file_paths)
+
+        print(f"📚 Corpus analysis on {documents} documents, {size / (1024 * 1024):.1f} MB ({os.cpu_count()} CPUs)")
+        results = {'bytes': size, 'documents': documents, 'runs': []}
+        baseline = None
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            elapsed = time_call(extract_requirements_corpus, file_paths, ITERATIVE_RULES, workers, repeat=repeat)
+            baseline = baseline or elapsed
+            print(
+                f"   {workers:>3} workers | {elapsed:.3f}s ({size / elapsed / 1e6:.1f} MB/s) | "
+                f"scaling {baseline / elapsed:.2f}x"
+            )
+            results['runs'].append({'workers': workers, 'seconds': elapsed})
+            workers *= 2
+        return results
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+def write_sample_diagrams(directory, count):
+    """Write count .mmd files built by the enhanced generator; return their paths"""
+    generator = importlib.import_module('enhanced-mermaid-generator')
+    requirements = generator.get_default_requirements()
+    sources = [
+        generator.generate_user_journey_diagram(requirements['user_actions']),
+        generator.generate_system_architecture_diagram(),
+        generator.generate_business_process_diagram(requirements['decision_points']),
+        generator.generate_data_flow_diagram(requirements['data_entities']),
+        generator.generate_decision_tree_diagram(requirements['decision_points']),
+        generator.generate_gantt_chart()
+    ]
+    paths = []
+    for index in range(count):
+        file_path = os.path.join(directory, f"diagram_{index:03d}.mmd")
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(sources[index % len(sources)])
+        paths.append(file_path)
+    return paths
+
+def benchmark_render(diagrams):
+    """Compare one mmdc process per diagram against the persistent render worker"""
+    generator = importlib.import_module('enhanced-mermaid-generator')
+    cli_available, cli_type = generator.check_mermaid_cli()
+    if not cli_available:
+        print("⚠️  Render benchmark skipped: Mermaid CLI not available")
+        return {'skipped': 'Mermaid CLI not available'}
+
+    work_dir = tempfile.mkdtemp(prefix='mermaid-render-')
+    try:
+        paths = write_sample_diagrams(work_dir, diagrams)
+        print(f"🖼️  Rendering {diagrams} diagrams ({cli_type} CLI)")
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rendered = sum(generator.generate_image_from_mmd(path, work_dir, cli_type) for path in paths)
+        per_process = time.perf_counter() - start
+        print(f"   one process per diagram | {per_process:.2f}s ({rendered}/{diagrams} rendered)")
+
+        # Worker startup is included: it is paid once per pipeline run
+        start = time.perf_counter()
+        with MermaidRenderWorker() as worker:
+            if not worker.alive:
+                print(f"⚠️  Render worker unavailable: {worker.error}")
+                return {'diagrams': diagrams, 'per_process_seconds': per_process, 'worker_error': str(worker.error)}
+            rendered = 0
+            for path in paths:
+                worker.render_file(path, work_dir)
+                rendered += 1
+        persistent = time.perf_counter() - start
+        print(
+            f"   persistent worker       | {persistent:.2f}s ({rendered}/{diagrams} rendered) | "
+            f"speedup {per_process / persistent:.2f}x"
+        )
+        return {'diagrams': diagrams, 'per_process_seconds': per_process, 'persistent_seconds': persistent}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def build_diagram_concatenated(labels):
+    """Build a journey flowchart over the step labels with repeated string +="""
+    diagram = "graph TD\n"
+    diagram += f"    N0[{labels[0]}]\n"
+    for i in range(1, len(labels)):
+        diagram += f"    N{i - 1} --> N{i}[{labels[i]}]\n"
+    return diagram
+
+def build_diagram_model(labels):
+    """Build the same flowchart through the diagram model and serialize it"""
+    diagram = Flowchart()
+    diagram.add(Chain([f"N{i}" for i in range(len(labels))], labels))
+    return diagram.to_mermaid()
+
+def benchmark_diagrams(node_counts, repeat):
+    """Compare string += diagram building against the diagram model serializer
+
+    Both builders get the same step labels, as the generators get their
+    actions from the analysis, and make their own node IDs.
+    """
+    print("🧩 Diagram building")
+    results = []
+    for nodes in node_counts:
+        labels = [f"Step {i}" for i in range(nodes)]
+        if build_diagram_concatenated(labels) != build_diagram_model(labels):
+            print(f"❌ {nodes} nodes: model output differs from concatenated output")
+            results.append({'nodes': nodes, 'error': 'model output differs from concatenated output'})
+            continue
+        concatenated = time_call(build_diagram_concatenated, labels, repeat=repeat)
+        model = time_call(build_diagram_model, labels, repeat=repeat)
+        print(
+            f"   {nodes:>7} nodes | string += {concatenated:.3f}s | "
+            f"model + join {model:.3f}s | ratio {concatenated / model:.2f}x"
+        )
+        results.append({'nodes': nodes, 'concatenated_seconds': concatenated, 'model_seconds': model})
+    return results
+
+def reset_peak_rss():
+    """Reset the kernel's peak RSS mark for this process; return False where that is unsupported (non-Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_bytes():
+    """Return the peak resident set size in bytes: since the last reset on Linux, for the whole process elsewhere"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+def run_stage(stages, name, func, *args):
+    """Run one pipeline stage quietly, recording its wall time and peak RSS; return its result"""
+    reset_peak_rss()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args)
+    stages[name] = {'seconds': time.perf_counter() - start, 'peak_rss_bytes': peak_rss_bytes()}
+    return result
+
+def format_stage(name, stage):
+    """Return one report line for a stage"""
+    parts = [f"   {name:<12} {stage['seconds']:.3f}s"]
+    if stage.get('bytes') is not None and stage['seconds'] > 0:
+        parts.append(f"{stage['bytes'] / stage['seconds'] / 1e6:.1f} MB/s")
+    if stage.get('items') is not None and stage['seconds'] > 0:
+        parts.append(f"{stage['items'] / stage['seconds']:.0f} {stage.get('unit', 'items')}/s")
+    if stage.get('peak_rss_bytes'):
+        parts.append(f"peak RSS {stage['peak_rss_bytes'] / (1024 * 1024):.1f} MB")
+    return ' | '.join(parts)
+
+def run_pipeline_once(requirements_file, work_dir, base_url):
+    """Run Stage 1 and Stage 2 end to end on one requirements file; return the per-stage measurements"""
+    generator = importlib.import_module('enhanced-mermaid-generator')
+    fsd = importlib.import_module('create-enhanced-fsd')
+    diagrams_dir = os.path.join(work_dir, 'diagrams')
+    images_dir = os.path.join(diagrams_dir, 'images')
+    os.makedirs(images_dir, exist_ok=True)
+    stages = {}
+    start = time.perf_counter()
+
+    requirements = run_stage(stages, 'analysis', generator.analyze_requirements, requirements_file)
+    stages['analysis']['bytes'] = os.path.getsize(requirements_file)
+
+    diagrams = run_stage(stages, 'generation', lambda: paginate_diagrams({
+        'user_journey.mmd': generator.build_user_journey_diagram(requirements['user_actions']),
+        'system_architecture.mmd': generator.generate_system_architecture_diagram(),
+        'business_process.mmd': generator.build_business_process_diagram(requirements['decision_points']),
+        'data_flow.mmd': generator.generate_data_flow_diagram(requirements['data_entities']),
+        'decision_tree.mmd': generator.build_decision_tree_diagram(requirements['decision_points']),
+        'gantt_chart.mmd': generator.generate_gantt_chart()
+    }, DEFAULT_PAGE_BUDGET))
+    stages['generation'].update(items=len(diagrams), unit='diagrams')
+
+    def save():
+        for filename, content in diagrams.items():
+            generator.save_diagram(diagrams_dir, filename, content)
+        get_artifact_writer().sync()
+
+    run_stage(stages, 'save', save)
+    stages['save']['bytes'] = sum(len(content.encode('utf-8')) for content in diagrams.values())
+
+    mmd_paths = [os.path.join(diagrams_dir, filename) for filename in diagrams]
+    valid_paths = run_stage(stages, 'validation', filter_valid_diagrams, mmd_paths)
+    stages['validation'].update(items=len(mmd_paths), unit='diagrams', invalid=len(mmd_paths) - len(valid_paths))
+
+    results = run_stage(stages, 'render', lambda: render_files_online(valid_paths, images_dir, base_url=base_url))
+    stages['render'].update(
+        items=len(valid_paths), unit='diagrams', failed=sum(1 for result in results if not result['success'])
+    )
+
+    fsd_file = os.path.join(work_dir, 'enhanced_fsd.md')
+    run_stage(stages, 'fsd', fsd.write_enhanced_fsd, requirements_file, diagrams_dir, fsd_file,
+              fsd.DEFAULT_TEMPLATE, ArtifactWriter())
+    stages['fsd']['bytes'] = os.path.getsize(fsd_file)
+
+    stages['end_to_end'] = {
+        'seconds': time.perf_counter() - start,
+        'bytes': stages['analysis']['bytes'],
+        'peak_rss_bytes': max(stage['peak_rss_bytes'] or 0 for stage in stages.values()) or None
+    }
+    return stages
+
+def benchmark_pipeline(sizes, density, seed, stub_latency):
+    """Time every Stage 1/2 hot path on synthetic corpora, rendering against the local stub renderer"""
+    stub = importlib.import_module('mermaid-ink-stub-server')
+    server, base_url = stub.start_stub_server(latency=stub_latency)
+    results = []
+    try:
+        for size in sizes:
+            work_dir = tempfile.mkdtemp(prefix='pipeline-benchmark-')
+            try:
+                requirements_file = os.path.join(work_dir, 'raw_requirements.txt')
+                start = time.perf_counter()
+                corpus = write_requirements_corpus(requirements_file, size, density, seed)
+                corpus['seconds'] = time.perf_counter() - start
+                print(f"🏭 Pipeline on a {format_size(size)} synthetic corpus ({corpus['lines']})")
+
+                stages = run_pipeline_once(requirements_file, work_dir, base_url)
+                for name, stage in stages.items():
+                    print(format_stage(name, stage))
+                results.append({'size': format_size(size), 'corpus': corpus, 'stages': stages})
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+    finally:
+        server.shutdown()
+    return results
+
+def git_commit():
+    """Return the commit of the checked-out tree, or None outside a git work tree"""
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+def write_results(file_path, results, label=None):
+    """Save benchmark results with the environment they were measured in, for comparison across commits"""
+    report = {
+        'label': label,
+        'commit': git_commit(),
+        'created': datetime.now().astimezone().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'results': results
+    }
+    writer = ArtifactWriter()
+    writer.write_json(file_path, report)
+    writer.sync()
+
+BENCHMARKS = ['analysis', 'corpus', 'render', 'diagrams', 'pipeline']
+
+def main():
+    """Run the requested benchmarks"""
+    parser = argparse.ArgumentParser(description='Stage 1 Mermaid pipeline benchmarks')
+    parser.add_argument('--size-mb', type=float, default=10, help='Size of the synthetic requirements text')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per measurement (best is reported)')
+    parser.add_argument('--documents', type=int, default=32, help='Number of documents for the corpus benchmark')
+    parser.add_argument('--diagrams', type=int, default=12, help='Number of diagrams for the render benchmark')
+    parser.add_argument('--nodes', type=int, action='append', help='Node count for the diagram benchmark (repeatable, default 10000 and 100000)')
+    parser.add_argument('--corpus-size', action='append', type=parse_size,
+                        help='Synthetic corpus size for the pipeline benchmark, 1KB to 1GB (repeatable, default 1KB, 1MB and 10MB)')
+    parser.add_argument('--density', type=parse_density, default=dict(DEFAULT_DENSITY),
+                        help='Fraction of corpus lines per phrase kind, e.g. user_can=0.3,conditional=0.1,system_should=0.2')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic corpus')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='Seconds the stub renderer waits per request')
+    parser.add_argument('--only', choices=BENCHMARKS, action='append', help='Run only the given benchmark (repeatable)')
+    parser.add_argument('--json', help='Save the results to this JSON file')
+    parser.add_argument('--label', help='Free-form label stored with the JSON results')
+
+    args = parser.parse_args()
+    selected = args.only or BENCHMARKS
+    results = {}
+
+    if 'analysis' in selected:
+        results['analysis'] = benchmark_analysis(args.size_mb, args.repeat)
+    if 'corpus' in selected:
+        results['corpus'] = benchmark_corpus(args.size_mb, args.documents, args.repeat)
+    if 'render' in selected:
+        results['render'] = benchmark_render(args.diagrams)
+    if 'diagrams' in selected:
+        results['diagrams'] = benchmark_diagrams(args.nodes or [10000, 100000], args.repeat)
+    if 'pipeline' in selected:
+        sizes = args.corpus_size or [parse_size('1KB'), parse_size('1MB'), parse_size('10MB')]
+        results['pipeline'] = benchmark_pipeline(sizes, args.density, args.seed, args.stub_latency)
+
+    if args.json:
+        write_results(args.json, results, args.label)
+        print(f"📝 Results saved to: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -2,413 +2,290 @@
 # create-enhanced-fsd.py
 # Enhanced FSD Creation with Mermaid Integration
 
+import argparse
+import contextlib
+import glob
+import io
 import os
-import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
 
-def read_requirements(file_path):
-    """Read raw requirements from file"""
+from artifact_writer import ArtifactWriter
+from fsd_templates import TemplateError, get_template
+from fsd_update import update_fsd_diagrams
+from pipeline_metrics import get_metrics, profile_memory_to_file_at_exit, write_metrics_at_exit
+
+DEFAULT_TEMPLATE = 'enhanced_fsd.md'
+SUMMARY_LENGTH = 500
+
+def read_requirements_summary(file_path, limit=SUMMARY_LENGTH):
+    """Read only the first limit characters of the requirements"""
     with open(file_path, 'r') as f:
-        return f.read()
-
-def read_mermaid_diagrams(diagrams_dir):
-    """Read all Mermaid diagrams from directory"""
-    diagrams = {}
-    
-    for file_path in Path(diagrams_dir).glob('*.mmd'):
-        with open(file_path, 'r') as f:
-            diagrams[file_path.stem] = f.read()
-    
-    return diagrams
-
-def create_enhanced_fsd(requirements, diagrams):
+        return f.read(limit)
+
+def index_mermaid_diagrams(diagrams_dir):
+    """Map each Mermaid diagram name in directory to its file, without reading it"""
+    return {file_path.stem: file_path for file_path in Path(diagrams_dir).glob('*.mmd')}
+
+def created_timestamp():
+    """Return the current local time in the format of date(1)"""
+    return datetime.now().astimezone().strftime('%a %b %d %H:%M:%S %Z %Y')
+
+def fsd_context(requirements_summary):
+    """Return the template values for one FSD"""
+    return {
+        'created': created_timestamp(),
+        'requirements_summary': requirements_summary[:SUMMARY_LENGTH]
+    }
+
+def create_enhanced_fsd(requirements, diagrams, template=DEFAULT_TEMPLATE):
     """Create enhanced FSD with embedded Mermaid diagrams"""
-    
-    fsd_content = f"""# ENHANCED FUNCTIONAL SPECIFICATION DOCUMENT (FSD)
-## Employee Time Tracking Application
-
----
-
-## **1. PROJECT OVERVIEW**
-
-### **1.1 Project Information**
-- **Project Name**: Employee Time Tracking Application
-- **Version**: 1.0
-- **Date**: {os.popen('date').read().strip()}
-- **Author**: Enhanced EFTDM System
-- **Stakeholders**: Development Team, QA Team, Product Management
-
-### **1.2 Executive Summary**
-{requirements[:500]}...
-
-### **1.3 Scope Definition**
-- **In Scope**: Time tracking, file upload, AI processing, data review, submission
-- **Out of Scope**: Advanced reporting, mobile app, third-party integrations
-- **Assumptions**: Users have basic computer skills, stable internet connection
-
----
-
-## **2. USER JOURNEY & FLOW DIAGRAMS**
-
-### **2.1 High-Level User Journey**
-```mermaid
-{diagrams.get('user_journey', 'graph TD\\n    A[User Login] --> B[Dashboard]\\n    B --> C[Upload File]\\n    C --> D[AI Processing]\\n    D --> E[Review Data]\\n    E --> F[Submit]')}
-```
-
-### **2.2 Detailed User Flows**
-
-#### **2.2.1 Authentication Flow**
-```mermaid
-sequenceDiagram
-    participant U as User
-    participant F as Frontend
-    participant B as Backend
-    participant D as Database
-    
-    U->>F: Enter Credentials
-    F->>B: POST /auth/login
-    B->>D: Validate User
-    D-->>B: User Data
-    B-->>F: JWT Token
-    F-->>U: Redirect to Dashboard
-```
-
-#### **2.2.2 File Upload & Processing Flow**
-```mermaid
-{diagrams.get('decision_flow', 'flowchart TD\\n    A[File Upload] --> B{Valid File?}\\n    B -->|Yes| C[Process File]\\n    B -->|No| D[Show Error]')}
-```
-
-#### **2.2.3 System Flow Diagram**
-```mermaid
-{diagrams.get('system_flow', 'sequenceDiagram\\n    participant U as User\\n    participant S as System\\n    U->>S: Action\\n    S-->>U: Response')}
-```
-
----
-
-## **3. FUNCTIONAL REQUIREMENTS**
-
-### **3.1 User Management**
-
-#### **3.1.1 Authentication**
-- **REQ-AUTH-001**: User login with email/password
-- **REQ-AUTH-002**: JWT token-based session management
-- **REQ-AUTH-003**: Password reset functionality
-- **REQ-AUTH-004**: Session timeout handling
-
-#### **3.1.2 User Roles & Permissions**
-```mermaid
-graph TD
-    A[User Types] --> B[Employee]
-    A --> C[Manager]
-    A --> D[Admin]
-    
-    B --> E[View Own Timesheets]
-    B --> F[Create Timesheets]
-    B --> G[Edit Own Timesheets]
-    
-    C --> H[View Team Timesheets]
-    C --> I[Approve Timesheets]
-    C --> J[Generate Reports]
-    
-    D --> K[Manage Users]
-    D --> L[System Configuration]
-    D --> M[All Permissions]
-```
-
-### **3.2 Core Functionality**
-
-#### **3.2.1 Timesheet Management**
-- **REQ-TS-001**: Create new timesheet
-- **REQ-TS-002**: Upload timesheet files (PDF, Excel, CSV)
-- **REQ-TS-003**: AI-powered data extraction
-- **REQ-TS-004**: Manual data entry
-- **REQ-TS-005**: Edit timesheet data
-- **REQ-TS-006**: Submit timesheet for approval
-
-#### **3.2.2 Data Processing Flow**
-```mermaid
-flowchart TD
-    A[File Upload] --> B[File Validation]
-    B --> C[AI Processing]
-    C --> D[Data Extraction]
-    D --> E[Data Validation]
-    E --> F[User Review]
-    F --> G[Data Correction]
-    G --> H[Final Submission]
-    
-    subgraph "AI Processing"
-        C1[OCR Text Recognition]
-        C2[Data Structure Analysis]
-        C3[Field Mapping]
-        C4[Confidence Scoring]
-    end
-    
-    C --> C1
-    C1 --> C2
-    C2 --> C3
-    C3 --> C4
-    C4 --> D
-```
-
----
-
-## **4. BUSINESS RULES & VALIDATION**
-
-### **4.1 Business Rules**
-```mermaid
-graph TD
-    A[Business Rules] --> B[Time Entry Rules]
-    A --> C[Approval Rules]
-    A --> D[Data Rules]
-    
-    B --> B1[Max 12 hours per day]
-    B --> B2[Min 0.5 hours per entry]
-    B --> B3[No future dates]
-    
-    C --> C1[Manager approval required]
-    C --> C2[Auto-approve if < 8 hours]
-    C --> C3[Escalation after 3 days]
-    
-    D --> D1[Required fields validation]
-    D --> D2[Date range validation]
-    D --> D3[Project code validation]
-```
-
-### **4.2 Validation Rules**
-- **VAL-001**: Required field validation
-- **VAL-002**: Date range validation
-- **VAL-003**: Time format validation
-- **VAL-004**: Project code validation
-- **VAL-005**: Duplicate entry prevention
-
----
-
-## **5. USER INTERFACE REQUIREMENTS**
-
-### **5.1 Page Structure**
-```mermaid
-graph TD
-    A[Application] --> B[Authentication Pages]
-    A --> C[Main Application]
-    
-    B --> B1[Login Page]
-    B --> B2[Register Page]
-    B --> B3[Forgot Password]
-    
-    C --> C1[Dashboard]
-    C --> C2[Timesheet Management]
-    C --> C3[Reports]
-    C --> C4[Profile]
-    
-    C2 --> C2A[Upload Timesheet]
-    C2 --> C2B[Review Timesheet]
-    C2 --> C2C[Edit Timesheet]
-    C2 --> C2D[Timesheet History]
-```
-
-### **5.2 Component Hierarchy**
-```mermaid
-graph TD
-    A[App Component] --> B[Header Component]
-    A --> C[Sidebar Component]
-    A --> D[Main Content]
-    A --> E[Footer Component]
-    
-    D --> D1[Dashboard View]
-    D --> D2[Timesheet View]
-    D --> D3[Profile View]
-    
-    D2 --> D2A[File Upload Component]
-    D2 --> D2B[Data Review Component]
-    D2 --> D2C[Edit Form Component]
-```
-
----
-
-## **6. TECHNICAL SPECIFICATIONS**
-
-### **6.1 Technology Stack**
-- **Frontend**: Vue.js 3, TypeScript, TailwindCSS
-- **Backend**: Node.js, Express, TypeScript
-- **Database**: PostgreSQL
-- **AI/ML**: Python, OCR libraries
-- **Cloud**: AWS (ECS, RDS, S3)
-
-### **6.2 API Endpoints**
-```mermaid
-graph TD
-    A[API Endpoints] --> B[Authentication APIs]
-    A --> C[Timesheet APIs]
-    A --> D[User APIs]
-    
-    B --> B1[POST /auth/login]
-    B --> B2[POST /auth/register]
-    B --> B3[POST /auth/refresh]
-    
-    C --> C1[POST /timesheets/upload]
-    C --> C2[GET /timesheets]
-    C --> C3[PUT /timesheets/:id]
-    C --> C4[POST /timesheets/:id/submit]
-    
-    D --> D1[GET /users/profile]
-    D --> D2[PUT /users/profile]
-    D --> D3[GET /users/team]
-```
-
----
-
-## **7. DATA MODEL**
-
-### **7.1 Entity Relationship Diagram**
-```mermaid
-{diagrams.get('data_model', 'erDiagram\\n    USER ||--o{ TIMESHEET : creates\\n    TIMESHEET ||--o{ ENTRY : contains\\n    PROJECT ||--o{ ENTRY : belongs_to')}
-```
-
----
-
-## **8. NON-FUNCTIONAL REQUIREMENTS**
-
-### **8.1 Performance Requirements**
-- **PERF-001**: Page load time < 2 seconds
-- **PERF-002**: API response time < 500ms
-- **PERF-003**: File upload processing < 30 seconds
-- **PERF-004**: Support 1000 concurrent users
-
-### **8.2 Security Requirements**
-- **SEC-001**: HTTPS encryption
-- **SEC-002**: JWT token authentication
-- **SEC-003**: Input validation and sanitization
-- **SEC-004**: SQL injection prevention
-- **SEC-005**: XSS protection
-
-### **8.3 Scalability Requirements**
-```mermaid
-graph TD
-    A[Scalability Plan] --> B[Horizontal Scaling]
-    A --> C[Database Scaling]
-    A --> D[CDN Implementation]
-    
-    B --> B1[Load Balancer]
-    B --> B2[Multiple Instances]
-    B --> B3[Auto-scaling Groups]
-    
-    C --> C1[Read Replicas]
-    C --> C2[Database Sharding]
-    C --> C3[Caching Layer]
-    
-    D --> D1[Static Asset CDN]
-    D --> D2[API Response Caching]
-    D --> D3[Edge Computing]
-```
-
----
-
-## **9. ACCEPTANCE CRITERIA**
-
-### **9.1 User Story Acceptance Criteria**
-```mermaid
-graph TD
-    A[User Story] --> B[Given]
-    A --> C[When]
-    A --> D[Then]
-    
-    B --> B1[User is logged in]
-    B --> B2[File is selected]
-    B --> B3[Data is valid]
-    
-    C --> C1[User uploads file]
-    C --> C2[AI processes data]
-    C --> C3[User reviews data]
-    
-    D --> D1[Data is displayed correctly]
-    D --> D2[User can edit data]
-    D --> D3[Timesheet is submitted]
-```
-
-### **9.2 Testing Scenarios**
-- **TEST-001**: Happy path testing
-- **TEST-002**: Error handling testing
-- **TEST-003**: Edge case testing
-- **TEST-004**: Performance testing
-- **TEST-005**: Security testing
-
----
-
-## **10. RISK ASSESSMENT**
-
-### **10.1 Risk Matrix**
-```mermaid
-graph TD
-    A[Risk Assessment] --> B[High Risk]
-    A --> C[Medium Risk]
-    A --> D[Low Risk]
-    
-    B --> B1[Data Loss]
-    B --> B2[Security Breach]
-    B --> B3[System Downtime]
-    
-    C --> C1[Performance Issues]
-    C --> C2[User Adoption]
-    C --> C3[Integration Failures]
-    
-    D --> D1[Minor UI Issues]
-    D --> D2[Documentation Gaps]
-    D --> D3[Training Requirements]
-```
-
----
-
-## **11. IMPLEMENTATION TIMELINE**
-
-### **11.1 Development Phases**
-```mermaid
-{diagrams.get('gantt_chart', 'gantt\\n    title Development Timeline\\n    dateFormat  YYYY-MM-DD\\n    section Phase 1\\n    Project Setup    :2024-01-01, 7d\\n    Authentication   :2024-01-08, 14d')}
-```
-
----
-
-## **12. APPENDICES**
-
-### **12.1 Glossary**
-- **AI Processing**: Automated data extraction from uploaded files
-- **OCR**: Optical Character Recognition
-- **JWT**: JSON Web Token
-- **API**: Application Programming Interface
-
-### **12.2 References**
-- [Link to Design Assets]
-- [Link to Technical Documentation]
-- [Link to User Research]
-
----
-
-**Document Version**: 1.0  
-**Created**: {os.popen('date').read().strip()}  
-**Next Review**: [Date]  
-**Status**: Draft/Review/Approved
-"""
-    
-    return fsd_content
+    out = io.StringIO()
+    get_template(template).render(out, fsd_context(requirements), diagrams)
+    return out.getvalue()
+
+@contextlib.contextmanager
+def fsd_step(timings, name):
+    """Time one FSD step into timings and as a stage of the run's metrics"""
+    started = time.perf_counter()
+    with get_metrics().span(name):
+        yield
+    timings[name] = time.perf_counter() - started
+
+def write_enhanced_fsd(requirements_path, diagrams_dir, output_path, template=DEFAULT_TEMPLATE, writer=None,
+                       timings=None):
+    """Render the FSD straight into output_path; return False if the document was unchanged
+
+    Diagrams are copied from their files into the output one at a time, so
+    memory stays flat however many diagrams the FSD embeds. When a timings
+    dict is given, the seconds spent in each step are stored in it.
+    """
+    timings = timings if timings is not None else {}
+    compiled = get_template(template)
+
+    with fsd_step(timings, 'requirements'):
+        context = fsd_context(read_requirements_summary(requirements_path))
+
+    with fsd_step(timings, 'diagrams'):
+        diagrams = index_mermaid_diagrams(diagrams_dir)
+    timings['diagram_count'] = len(diagrams)
+
+    writer = writer or ArtifactWriter()
+    with fsd_step(timings, 'assembly'):
+        with writer.open_text(output_path) as out:
+            compiled.render(out, context, diagrams)
+    return out.changed
+
+def update_enhanced_fsd(requirements_path, diagrams_dir, output_path, template=DEFAULT_TEMPLATE, writer=None,
+                        timings=None):
+    """Re-splice only the changed diagram blocks of an existing FSD; return (changed, report)
+
+    Manual edits outside the changed blocks are kept. A missing FSD, or one
+    without diagram markers, is created in full instead and report is None.
+    """
+    timings = timings if timings is not None else {}
+    if not os.path.exists(output_path):
+        return write_enhanced_fsd(requirements_path, diagrams_dir, output_path, template, writer, timings), None
+
+    with fsd_step(timings, 'diagrams'):
+        diagrams = index_mermaid_diagrams(diagrams_dir)
+    timings['diagram_count'] = len(diagrams)
+
+    with fsd_step(timings, 'update'):
+        report = update_fsd_diagrams(output_path, diagrams, writer or ArtifactWriter())
+    if report is None:
+        return write_enhanced_fsd(requirements_path, diagrams_dir, output_path, template, writer, timings), None
+    return bool(report['updated']), report
+
+def expand_project_roots(patterns):
+    """Expand project root paths and glob patterns into a sorted list of unique directories"""
+    roots = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        roots.update(os.path.normpath(match) for match in matches if os.path.isdir(match))
+    return sorted(roots)
+
+def build_project_fsd(project_root, requirements, diagrams, output, template, update=False):
+    """Create (or with update, re-splice) one project's FSD inside a worker process; return its summary entry
+
+    requirements, diagrams and output are relative to project_root.
+    """
+    started = time.perf_counter()
+    output_path = os.path.join(project_root, output)
+    result = {'project': project_root, 'output': output_path}
+    timings = {}
+    writer = ArtifactWriter()
+    paths = (os.path.join(project_root, requirements), os.path.join(project_root, diagrams), output_path)
+    try:
+        if update:
+            changed, report = update_enhanced_fsd(*paths, template, writer, timings)
+            if report is not None:
+                result['updated_diagrams'] = report['updated']
+                result['missing_diagrams'] = report['missing']
+        else:
+            changed = write_enhanced_fsd(*paths, template, writer, timings)
+        writer.sync()
+        result['status'] = 'written' if changed else 'unchanged'
+        result['bytes'] = os.path.getsize(output_path)
+    except (OSError, TemplateError) as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    result['diagrams'] = timings.pop('diagram_count', 0)
+    timings['total'] = time.perf_counter() - started
+    result['seconds'] = timings
+    return result
+
+def create_fsds_batch(project_roots, requirements='raw_requirements.txt', diagrams='diagrams/',
+                      output='enhanced_fsd.md', template=DEFAULT_TEMPLATE, workers=None, update=False):
+    """Create the FSD of every project on a process pool; return the batch summary
+
+    Each project is read, assembled and written independently, so throughput
+    grows with the number of worker processes. Results keep the order of
+    project_roots.
+    """
+    get_template(template)  # Fail on a broken template before starting any workers
+    started = time.perf_counter()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(project_roots) or 1))
+    results = {}
+
+    def report(result):
+        results[result['project']] = result
+        icon = {'written': '✅', 'unchanged': '⏭️ ', 'failed': '❌'}[result['status']]
+        detail = result.get('error') or f"{result['diagrams']} diagrams"
+        print(f"{icon} {result['project']}: {result['status']} in {result['seconds']['total']:.3f}s ({detail})")
+
+    if workers == 1:
+        for root in project_roots:
+            report(build_project_fsd(root, requirements, diagrams, output, template, update))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(build_project_fsd, root, requirements, diagrams, output, template, update)
+                for root in project_roots
+            ]
+            for future in as_completed(futures):
+                report(future.result())
+
+    elapsed = time.perf_counter() - started
+    projects = [results[root] for root in project_roots]
+    counts = {status: sum(1 for result in projects if result['status'] == status)
+              for status in ('written', 'unchanged', 'failed')}
+    return {
+        'projects': projects,
+        'counts': counts,
+        'workers': workers,
+        'seconds': elapsed,
+        'projects_per_second': len(projects) / elapsed if elapsed > 0 else 0.0
+    }
+
+def run_batch(args):
+    """Batch mode: create the FSD of every project root and write the summary"""
+    project_roots = expand_project_roots(args.projects)
+    if not project_roots:
+        print("❌ No project directories match --projects")
+        return 1
+
+    print(f"📚 Creating FSDs for {len(project_roots)} projects")
+    try:
+        summary = create_fsds_batch(
+            project_roots, args.requirements, args.diagrams, args.output, args.template, args.workers, args.update
+        )
+    except TemplateError as e:
+        print(f"❌ Error loading FSD template: {e}")
+        return 1
+
+    writer = ArtifactWriter()
+    writer.write_json(args.summary, summary)
+    writer.sync()
+
+    counts = summary['counts']
+    print(
+        f"📊 {counts['written']} written, {counts['unchanged']} unchanged, {counts['failed']} failed "
+        f"in {summary['seconds']:.2f}s with {summary['workers']} workers "
+        f"({summary['projects_per_second']:.1f} projects/s)"
+    )
+    print(f"📝 Batch summary: {args.summary}")
+    return 1 if counts['failed'] else 0
+
+def run_update(args):
+    """Update mode: re-splice the changed diagrams into the existing FSD"""
+    writer = ArtifactWriter()
+    try:
+        changed, report = update_enhanced_fsd(args.requirements, args.diagrams, args.output, args.template, writer)
+    except (OSError, TemplateError) as e:
+        print(f"❌ Error updating enhanced FSD: {e}")
+        return 1
+    writer.sync()
+
+    if report is None:
+        print(f"✅ Enhanced FSD created: {args.output} (no diagram blocks to update)")
+        return 0
+    if changed:
+        print(f"✅ Enhanced FSD updated: {args.output} ({', '.join(report['updated'])})")
+    else:
+        print(f"✅ Enhanced FSD unchanged: {args.output}")
+    print(f"⏭️  Diagram blocks unchanged: {len(report['unchanged'])}")
+    if report['orphaned']:
+        print(f"⚠️  Kept blocks whose diagram file is gone: {', '.join(report['orphaned'])}")
+    if report['missing']:
+        print(f"⚠️  Diagrams without a block (run without --update to add them): {', '.join(report['missing'])}")
+    return 0
 
 def main():
     """Main function to create enhanced FSD"""
-    
-    # Read requirements
-    requirements = read_requirements('raw_requirements.txt')
-    
-    # Read Mermaid diagrams
-    diagrams = read_mermaid_diagrams('diagrams/')
-    
-    # Create enhanced FSD
-    fsd_content = create_enhanced_fsd(requirements, diagrams)
-    
-    # Save enhanced FSD
-    with open('enhanced_fsd.md', 'w') as f:
-        f.write(fsd_content)
-    
-    print("✅ Enhanced FSD created: enhanced_fsd.md")
+    parser = argparse.ArgumentParser(description='Create an enhanced FSD with embedded Mermaid diagrams')
+    parser.add_argument('--requirements', default='raw_requirements.txt',
+                        help='Raw requirements file (relative to each project root in batch mode)')
+    parser.add_argument('--diagrams', default='diagrams/',
+                        help='Directory of .mmd diagrams to embed (relative to each project root in batch mode)')
+    parser.add_argument('--output', default='enhanced_fsd.md',
+                        help='FSD file to write (relative to each project root in batch mode)')
+    parser.add_argument('--template', default=DEFAULT_TEMPLATE,
+                        help='FSD template: a name under scripts/templates, or a path such as ./my_template.md')
+    parser.add_argument('--update', action='store_true',
+                        help='Re-splice only the diagram blocks whose .mmd changed into the existing FSD, keeping manual edits')
+    parser.add_argument('--projects', nargs='+', metavar='ROOT',
+                        help='Batch mode: project root directories or glob patterns, e.g. "portfolio/*"')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --projects (default: CPU count)')
+    parser.add_argument('--summary', default='fsd_batch_summary.json',
+                        help='Per-project timings summary written in batch mode')
+    parser.add_argument('--metrics-json', metavar='FILE',
+                        help='Save per-step timings to FILE (single-project and --update modes)')
+    parser.add_argument('--memory-profile', metavar='FILE',
+                        help='Trace allocations and save per-step peak and retained memory and top allocation sites '
+                             'to FILE (single-project and --update modes)')
+    args = parser.parse_args()
+
+    if args.projects:
+        return run_batch(args)
+
+    get_metrics('create-enhanced-fsd')
+    if args.metrics_json:
+        write_metrics_at_exit(args.metrics_json)
+    if args.memory_profile:
+        profile_memory_to_file_at_exit(args.memory_profile)
+
+    if args.update:
+        return run_update(args)
+
+    # Render the FSD straight to disk, atomically; an identical document is left untouched
+    writer = ArtifactWriter()
+    try:
+        changed = write_enhanced_fsd(args.requirements, args.diagrams, args.output, args.template, writer)
+    except (OSError, TemplateError) as e:
+        print(f"❌ Error creating enhanced FSD: {e}")
+        return 1
+    writer.sync()
+
+    if changed:
+        print(f"✅ Enhanced FSD created: {args.output}")
+    else:
+        print(f"✅ Enhanced FSD unchanged: {args.output}")
     print("🎨 FSD includes embedded Mermaid diagrams")
     print("📊 Ready for stakeholder review!")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
@@ -2,15 +2,43 @@
 # enhanced-iterative-mermaid-generator.py
 # Enhanced Mermaid Diagram Generation with Iterative Refinement Support
 
+import io
 import re
 import json
 import os
 import subprocess
 import sys
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 import argparse
 
+from requirements_analysis import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_TOP_K, ITERATIVE_RULES, LazyRequirements,
+    extract_requirements, extract_requirements_lazy, extract_requirements_streaming,
+    extract_requirements_streaming_lazy, format_throughput, resolve_requirements
+)
+from analysis_cache import (
+    DEFAULT_ANALYSIS_CACHE_DAYS, DEFAULT_ANALYSIS_CACHE_DIR, DEFAULT_ANALYSIS_CACHE_MB, AnalysisCache,
+    hash_requirements_file, hash_requirements_text
+)
+from artifact_writer import get_artifact_writer
+from incremental_analysis import SegmentAnalysis, format_segment_throughput
+from mermaid_diagrams import Chain, Edge, Flowchart, GanttChart, Node, NodeIdAllocator, Section, Task, node_id
+from mermaid_pagination import DEFAULT_PAGE_BUDGET, IMAGES_DIRNAME, paginate_diagram, remove_stale_pages
+from mermaid_validation import filter_valid_diagrams
+from mermaid_rendering import DEFAULT_RENDER_CACHE_DIR, DEFAULT_RENDER_CACHE_MB, RenderCache, print_render_timings
+from online_rendering import DEFAULT_ONLINE_CONCURRENCY, DEFAULT_ONLINE_ENDPOINT, render_files_online
+from pipeline_metrics import (
+    count_requirement_matches, get_metrics, profile_memory_to_file_at_exit, profile_to_file_at_exit,
+    record_render_results, record_writer, write_metrics_at_exit
+)
+from stage1_manifest import DiagramManifest, hash_file, hash_text, hash_value
+from stage1_staging import StagedRun
+
+# Any change to this script invalidates every generated diagram
+GENERATOR_FINGERPRINT = hash_file(os.path.abspath(__file__))
+
 def ensure_directory_exists(directory_path):
     """Ensure directory exists, create if it doesn't"""
     Path(directory_path).mkdir(parents=True, exist_ok=True)
@@ -19,65 +47,121 @@ def ensure_directory_exists(directory_path):
 def save_requirements_to_file(requirements_text, file_path="raw_requirements.txt"):
     """Save requirements text to file for processing"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(requirements_text)
+        get_artifact_writer().write_text(file_path, requirements_text)
         print(f"✅ Requirements saved to: {file_path}")
         return True
     except Exception as e:
         print(f"❌ Error saving requirements: {str(e)}")
         return False
 
-def analyze_requirements_from_text(requirements_text):
-    """Analyze requirements text directly (not from file)"""
-    
-    # Extract user actions
-    user_actions = re.findall(r'user\s+(?:can\s+)?(?:should\s+)?(?:must\s+)?(\w+)', requirements_text, re.IGNORECASE)
+def copy_requirements_file(source_path, file_path):
+    """Copy a requirements file without loading it into memory"""
+    try:
+        if os.path.abspath(source_path) != os.path.abspath(file_path):
+            get_artifact_writer().copy_file(source_path, file_path)
+        print(f"✅ Requirements saved to: {file_path}")
+        return True
+    except Exception as e:
+        print(f"❌ Error saving requirements: {str(e)}")
+        return False
+
+# Used for every category the requirements yield nothing for
+DEFAULT_REQUIREMENTS = {
+    'user_actions': ['login', 'browse', 'select', 'submit'],
+    'decision_points': ['valid input', 'user authenticated', 'data available'],
+    'validation_rules': ['input validation', 'authentication check'],
+    'system_interactions': ['process request', 'store data', 'send notification'],
+    'data_entities': ['user', 'session', 'data'],
+    'business_processes': ['data processing', 'user management'],
+    'integrations': ['external API', 'database']
+}
+
+def analyze_requirements_from_text(requirements_text, top_k=DEFAULT_TOP_K, order='frequency'):
+    """Analyze requirements text directly (not from file)
     
-    # Extract decision points
-    decision_points = re.findall(r'(?:if|when|whether)\s+([^,\.]+)', requirements_text, re.IGNORECASE)
+    With order 'document' the categories are lazy: each is scanned only as far
+    as the diagrams read it, in document order.
+    """
     
-    # Extract validation rules
-    validation_rules = re.findall(r'(?:validate|check|ensure)\s+([^,\.]+)', requirements_text, re.IGNORECASE)
+    if order == 'document':
+        return apply_default_requirements(extract_requirements_lazy(requirements_text, ITERATIVE_RULES, DEFAULT_REQUIREMENTS))
     
-    # Extract system interactions
-    system_interactions = re.findall(r'(?:system|application|app)\s+(?:should|must|can)\s+([^,\.]+)', requirements_text, re.IGNORECASE)
+    # Extract every category in a single pass over the text
+    return apply_default_requirements(extract_requirements(requirements_text, ITERATIVE_RULES, top_k))
+
+def analyze_requirements_from_file(file_path, chunk_size=DEFAULT_CHUNK_SIZE, top_k=DEFAULT_TOP_K, order='frequency'):
+    """Analyze a requirements file in bounded, memory-mapped chunks"""
+    
+    if order == 'document':
+        print("⚡ Lazy analysis: chunks are scanned only as far as the diagrams need")
+        return apply_default_requirements(
+            extract_requirements_streaming_lazy(file_path, ITERATIVE_RULES, chunk_size, DEFAULT_REQUIREMENTS)
+        )
+    
+    extracted, stats = extract_requirements_streaming(file_path, ITERATIVE_RULES, chunk_size, top_k)
+    print(f"⚡ Streamed analysis: {format_throughput(stats)}")
+    return apply_default_requirements(extracted)
+
+def analyze_requirements_incrementally(requirements_text, requirements_file, directory, top_k=DEFAULT_TOP_K,
+                                       chunk_size=DEFAULT_CHUNK_SIZE, fresh=False):
+    """Analyze requirements re-scanning only the segments changed since the analysis stored in directory
+    
+    Reads requirements_file line by line through a chunk_size buffer when
+    given, otherwise requirements_text. With fresh set the stored segment
+    tallies are ignored and rebuilt.
+    """
+    analysis = SegmentAnalysis(directory, ITERATIVE_RULES, fresh=fresh)
+    if requirements_file:
+        with open(requirements_file, 'r', encoding='utf-8', errors='replace', newline='\n', buffering=chunk_size) as f:
+            tally = analysis.update(f)
+    else:
+        tally = analysis.update(io.StringIO(requirements_text, newline='\n'))
+    analysis.save()
+    print(f"♻️  Incremental analysis: {format_segment_throughput(analysis.stats, analysis.rescanned)}")
+    metrics = get_metrics()
+    metrics.count('analysis.segments_rescanned', analysis.rescanned)
+    metrics.count('analysis.segments_reused', analysis.reused)
+    metrics.count('analysis.bytes_scanned', analysis.stats['bytes_scanned'])
+    return apply_default_requirements(tally.ranked(top_k))
+
+def apply_default_requirements(extracted):
+    """Fill empty categories with default values
+    
+    A LazyRequirements built with DEFAULT_REQUIREMENTS applies them itself once
+    a category turns out empty, so no category is scanned here.
+    """
+    if isinstance(extracted, LazyRequirements):
+        return {category: extracted[category] for category in DEFAULT_REQUIREMENTS}
+    
+    requirements = {
+        category: extracted[category] if extracted[category] else defaults
+        for category, defaults in DEFAULT_REQUIREMENTS.items()
+    }
+    requirements['counts'] = extracted['counts']
+    requirements['matches'] = extracted['matches']
+    return requirements
+
+def build_user_journey_diagram(actions, full=False):
+    """Build the user journey diagram model"""
     
-    # Extract data entities
-    data_entities = re.findall(r'(?:create|store|save|update|delete)\s+([^,\.]+)', requirements_text, re.IGNORECASE)
+    diagram = Flowchart()
     
-    # Extract business processes
-    business_processes = re.findall(r'(?:process|workflow|step)\s+([^,\.]+)', requirements_text, re.IGNORECASE)
+    if not full:
+        actions = actions[:6]  # Limit to 6 actions for clarity
     
-    # Extract integrations
-    integrations = re.findall(r'(?:integrate|connect|api|service)\s+([^,\.]+)', requirements_text, re.IGNORECASE)
+    labels = [action.title() for action in actions]
+    if labels:
+        diagram.add(Chain(map(node_id, range(len(labels))), labels))
     
-    return {
-        'user_actions': user_actions if user_actions else ['login', 'browse', 'select', 'submit'],
-        'decision_points': decision_points if decision_points else ['valid input', 'user authenticated', 'data available'],
-        'validation_rules': validation_rules if validation_rules else ['input validation', 'authentication check'],
-        'system_interactions': system_interactions if system_interactions else ['process request', 'store data', 'send notification'],
-        'data_entities': data_entities if data_entities else ['user', 'session', 'data'],
-        'business_processes': business_processes if business_processes else ['data processing', 'user management'],
-        'integrations': integrations if integrations else ['external API', 'database']
-    }
+    return diagram
 
-def generate_user_journey_diagram(actions, custom_flow=None):
+def generate_user_journey_diagram(actions, custom_flow=None, full=False):
     """Generate user journey Mermaid diagram with custom flow support"""
     
     if custom_flow:
         return custom_flow
     
-    diagram = "graph TD\n"
-    
-    for i, action in enumerate(actions[:6]):  # Limit to 6 actions for clarity
-        node_id = chr(65 + i)
-        if i == 0:
-            diagram += f"    {node_id}[{action.title()}]\n"
-        else:
-            prev_node = chr(65 + i - 1)
-            diagram += f"    {prev_node} --> {node_id}[{action.title()}]\n"
-    
-    return diagram
+    return build_user_journey_diagram(actions, full).to_mermaid()
 
 def generate_system_architecture_diagram(custom_architecture=None):
     """Generate system architecture Mermaid diagram with custom support"""
@@ -85,40 +169,47 @@ def generate_system_architecture_diagram(custom_architecture=None):
     if custom_architecture:
         return custom_architecture
     
-    diagram = "graph TD\n"
-    diagram += "    A[Frontend - Vue.js 3] --> B[API Gateway]\n"
-    diagram += "    B --> C[Authentication Service]\n"
-    diagram += "    B --> D[Business Logic Service]\n"
-    diagram += "    C --> E[Azure AD]\n"
-    diagram += "    D --> F[MongoDB Database]\n"
-    diagram += "    G[Load Balancer] --> A\n"
-    diagram += "    H[External APIs] --> B\n"
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Frontend - Vue.js 3'), Node('B', 'API Gateway')),
+        Edge('B', Node('C', 'Authentication Service')),
+        Edge('B', Node('D', 'Business Logic Service')),
+        Edge('C', Node('E', 'Azure AD')),
+        Edge('D', Node('F', 'MongoDB Database')),
+        Edge(Node('G', 'Load Balancer'), 'A'),
+        Edge(Node('H', 'External APIs'), 'B')
+    ])
+    
+    return diagram.to_mermaid()
+
+def build_business_process_diagram(decisions, full=False):
+    """Build the business process diagram model"""
+    
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Business Event'), Node('B', 'Process Step 1')),
+        Edge('B', Node('C', 'Decision Point', 'decision'))
+    ])
+    
+    if not full:
+        decisions = decisions[:3]  # Limit to 3 decisions
+    
+    # Outcome nodes D, E, F (and H, I, ... in full mode) around the fixed A, B, C and G
+    ids = NodeIdAllocator(reserved=('A', 'B', 'C', 'G'))
+    outcomes = [Node(ids.allocate(), f"Process {node_id(i)}") for i in range(max(3, len(decisions)))]
+    for outcome, decision in zip(outcomes, decisions):
+        diagram.add(Edge('C', outcome, decision))
+    
+    diagram.add(Edge(outcomes[0].id, Node('G', 'End State')))
+    diagram.extend(Edge(outcome.id, 'G') for outcome in outcomes[1:])
     
     return diagram
 
-def generate_business_process_diagram(decisions, custom_process=None):
+def generate_business_process_diagram(decisions, custom_process=None, full=False):
     """Generate business process Mermaid diagram with custom support"""
     
     if custom_process:
         return custom_process
     
-    diagram = "graph TD\n"
-    diagram += "    A[Business Event] --> B[Process Step 1]\n"
-    diagram += "    B --> C{Decision Point}\n"
-    
-    for i, decision in enumerate(decisions[:3]):  # Limit to 3 decisions
-        if i == 0:
-            diagram += f"    C -->|{decision}| D[Process A]\n"
-        elif i == 1:
-            diagram += f"    C -->|{decision}| E[Process B]\n"
-        else:
-            diagram += f"    C -->|{decision}| F[Process C]\n"
-    
-    diagram += "    D --> G[End State]\n"
-    diagram += "    E --> G\n"
-    diagram += "    F --> G\n"
-    
-    return diagram
+    return build_business_process_diagram(decisions, full).to_mermaid()
 
 def generate_data_flow_diagram(entities, custom_flow=None):
     """Generate data flow Mermaid diagram with custom support"""
@@ -126,38 +217,51 @@ def generate_data_flow_diagram(entities, custom_flow=None):
     if custom_flow:
         return custom_flow
     
-    diagram = "graph TD\n"
-    diagram += "    A[Data Source] --> B[Data Processing]\n"
-    diagram += "    B --> C[Data Validation]\n"
-    diagram += "    C --> D[Data Storage]\n"
-    diagram += "    D --> E[Data Retrieval]\n"
-    diagram += "    E --> F[Data Presentation]\n"
-    diagram += "    G[User Input] --> A\n"
-    diagram += "    F --> H[User Output]\n"
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Data Source'), Node('B', 'Data Processing')),
+        Edge('B', Node('C', 'Data Validation')),
+        Edge('C', Node('D', 'Data Storage')),
+        Edge('D', Node('E', 'Data Retrieval')),
+        Edge('E', Node('F', 'Data Presentation')),
+        Edge(Node('G', 'User Input'), 'A'),
+        Edge('F', Node('H', 'User Output'))
+    ])
+    
+    return diagram.to_mermaid()
+
+def build_decision_tree_diagram(decisions, full=False):
+    """Build the decision tree diagram model"""
+    
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Root Decision'), Node('B', 'Condition 1?', 'decision'))
+    ])
+    
+    if not full:
+        decisions = decisions[:3]  # Limit to 3 conditions
+    
+    # Each decision adds a condition with a Yes action; the last condition's No is the default
+    ids = NodeIdAllocator(reserved=('A', 'B'))
+    depth = len(decisions) if full else 3
+    condition = 'B'
+    for i in range(min(len(decisions), depth)):
+        yes = Node(ids.allocate(), f"Action {node_id(i)}")
+        if i == depth - 1:
+            no = Node(ids.allocate(), 'Default Action')
+        else:
+            no = Node(ids.allocate(), f"Condition {i + 2}?", 'decision')
+        diagram.add(Edge(condition, yes, 'Yes'))
+        diagram.add(Edge(condition, no, 'No'))
+        condition = no.id
     
     return diagram
 
-def generate_decision_tree_diagram(decisions, custom_tree=None):
+def generate_decision_tree_diagram(decisions, custom_tree=None, full=False):
     """Generate decision tree Mermaid diagram with custom support"""
     
     if custom_tree:
         return custom_tree
     
-    diagram = "graph TD\n"
-    diagram += "    A[Root Decision] --> B{Condition 1?}\n"
-    
-    for i, decision in enumerate(decisions[:4]):  # Limit to 4 decisions
-        if i == 0:
-            diagram += f"    B -->|Yes| C[Action A]\n"
-            diagram += f"    B -->|No| D{{Condition 2?}}\n"
-        elif i == 1:
-            diagram += f"    D -->|Yes| E[Action B]\n"
-            diagram += f"    D -->|No| F{{Condition 3?}}\n"
-        elif i == 2:
-            diagram += f"    F -->|Yes| G[Action C]\n"
-            diagram += f"    F -->|No| H[Default Action]\n"
-    
-    return diagram
+    return build_decision_tree_diagram(decisions, full).to_mermaid()
 
 def generate_gantt_chart(custom_timeline=None):
     """Generate Gantt chart with custom timeline support"""
@@ -168,149 +272,318 @@ def generate_gantt_chart(custom_timeline=None):
     # Calculate dates based on current date
     start_date = datetime.now()
     
-    diagram = "gantt\n"
-    diagram += "    title Development Timeline\n"
-    diagram += "    dateFormat  YYYY-MM-DD\n"
-    diagram += "    section Phase 1 - Setup\n"
-    diagram += f"    Project Setup    :a1, {start_date.strftime('%Y-%m-%d')}, 7d\n"
-    diagram += f"    Authentication   :after a1, 14d\n"
-    diagram += "    section Phase 2 - Core Features\n"
-    diagram += f"    File Upload      :{(start_date + timedelta(days=21)).strftime('%Y-%m-%d')}, 21d\n"
-    diagram += f"    AI Processing    :{(start_date + timedelta(days=42)).strftime('%Y-%m-%d')}, 28d\n"
-    diagram += "    section Phase 3 - Integration\n"
-    diagram += f"    Data Review      :{(start_date + timedelta(days=70)).strftime('%Y-%m-%d')}, 14d\n"
-    diagram += f"    Submission       :{(start_date + timedelta(days=84)).strftime('%Y-%m-%d')}, 7d\n"
-    diagram += "    section Phase 4 - Deployment\n"
-    diagram += f"    Testing          :{(start_date + timedelta(days=91)).strftime('%Y-%m-%d')}, 14d\n"
-    diagram += f"    Deployment       :{(start_date + timedelta(days=105)).strftime('%Y-%m-%d')}, 7d\n"
-    
-    return diagram
+    def start(days):
+        return (start_date + timedelta(days=days)).strftime('%Y-%m-%d')
+    
+    diagram = GanttChart('Development Timeline', statements=[
+        Section('Phase 1 - Setup'),
+        Task('Project Setup', f"a1, {start(0)}, 7d"),
+        Task('Authentication', 'after a1, 14d'),
+        Section('Phase 2 - Core Features'),
+        Task('File Upload', f"{start(21)}, 21d"),
+        Task('AI Processing', f"{start(42)}, 28d"),
+        Section('Phase 3 - Integration'),
+        Task('Data Review', f"{start(70)}, 14d"),
+        Task('Submission', f"{start(84)}, 7d"),
+        Section('Phase 4 - Deployment'),
+        Task('Testing', f"{start(91)}, 14d"),
+        Task('Deployment', f"{start(105)}, 7d")
+    ])
+    
+    return diagram.to_mermaid()
 
 def save_diagram(directory, filename, content):
-    """Save diagram content to file with verification"""
+    """Save diagram content atomically, leaving an identical existing file untouched"""
     file_path = os.path.join(directory, filename)
     
+    if not content:
+        print(f"❌ Failed to create: {file_path} (empty diagram)")
+        return False
+    
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        # Verify file was created and has content
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        if get_artifact_writer().write_text(file_path, content):
             print(f"✅ Generated: {file_path}")
-            return True
         else:
-            print(f"❌ Failed to create: {file_path}")
-            return False
+            print(f"✅ Unchanged: {file_path}")
+        return True
             
     except Exception as e:
         print(f"❌ Error saving {file_path}: {str(e)}")
         return False
 
-def generate_images_from_mmd_files(mmd_dir, images_dir):
-    """Generate images for all MMD files using online API"""
+def generate_images_from_mmd_files(mmd_dir, images_dir, max_workers=None, render_cache=None,
+                                   online_endpoint=DEFAULT_ONLINE_ENDPOINT, only=None, validate=True):
+    """Generate images for all MMD files (or only the named ones) using online API
+
+    Unless validate is False, diagrams with syntax errors are reported and never sent to the renderer.
+    """
     ensure_directory_exists(images_dir)
     
     try:
-        import requests
-        import base64
+        # Find all MMD files
+        mmd_paths = [
+            os.path.join(mmd_dir, f) for f in os.listdir(mmd_dir)
+            if f.endswith('.mmd') and (only is None or f in only)
+        ]
+        total_files = len(mmd_paths)
+        metrics = get_metrics()
+        if validate:
+            with metrics.span('validation'):
+                mmd_paths = filter_valid_diagrams(mmd_paths)
+            metrics.count('diagrams.invalid', total_files - len(mmd_paths))
         
-        success_count = 0
-        total_files = 0
+        # One pooled async client; unchanged diagrams are served from the render cache
+        start = time.perf_counter()
+        cache_hits = render_cache.hits if render_cache else 0
+        with metrics.span('render'):
+            results = render_files_online(
+                mmd_paths, images_dir, render_cache=render_cache, max_workers=max_workers,
+                base_url=online_endpoint, max_connections=max_workers or DEFAULT_ONLINE_CONCURRENCY
+            )
+        record_render_results(metrics, results, render_cache.hits - cache_hits if render_cache else 0)
+        print_render_timings(results, time.perf_counter() - start)
+        if render_cache:
+            print(f"🗄️  Render cache: {render_cache.summary()}")
         
-        # Find all MMD files
-        for filename in os.listdir(mmd_dir):
-            if filename.endswith('.mmd'):
-                total_files += 1
-                mmd_path = os.path.join(mmd_dir, filename)
-                
-                try:
-                    # Read MMD content
-                    with open(mmd_path, 'r', encoding='utf-8') as f:
-                        mmd_content = f.read()
-                    
-                    # Extract filename without extension
-                    image_filename = Path(mmd_path).stem
-                    output_file = os.path.join(images_dir, f"{image_filename}.png")
-                    
-                    # Use Mermaid online API
-                    url = "https://mermaid.ink/img/" + base64.b64encode(mmd_content.encode()).decode()
-                    
-                    response = requests.get(url)
-                    if response.status_code == 200:
-                        with open(output_file, 'wb') as f:
-                            f.write(response.content)
-                        print(f"✅ Generated image: {output_file}")
-                        success_count += 1
-                    else:
-                        print(f"❌ Failed to generate image for {filename}: HTTP {response.status_code}")
-                        
-                except Exception as e:
-                    print(f"❌ Error generating image for {filename}: {str(e)}")
+        success_count = sum(1 for result in results if result['success'])
         
         print(f"📊 Image generation: {success_count}/{total_files} files")
         return success_count > 0
         
-    except ImportError:
-        print("❌ requests library not available for image generation")
-        return False
     except Exception as e:
         print(f"❌ Error in image generation: {str(e)}")
         return False
 
-def generate_diagrams_iterative(requirements_text, custom_diagrams=None, output_dir="Stage1_Mermaid_Generation/diagrams"):
-    """Generate diagrams with support for custom modifications"""
+# Extracted categories each generated diagram depends on ('generated_on' is the run date)
+DIAGRAM_DEPENDENCIES = {
+    'user_journey.mmd': ('user_actions',),
+    'system_architecture.mmd': (),
+    'business_process.mmd': ('decision_points',),
+    'data_flow.mmd': (),
+    'decision_tree.mmd': ('decision_points',),
+    'gantt_chart.mmd': ('generated_on',)
+}
+
+# Leading items each diagram reads from its categories unless full is set
+DIAGRAM_ITEM_LIMITS = {
+    'user_journey.mmd': 6,
+    'business_process.mmd': 3,
+    'decision_tree.mmd': 3
+}
+
+DIAGRAM_GENERATORS = {
+    'user_journey.mmd': lambda inputs, full: build_user_journey_diagram(inputs['user_actions'], full),
+    'system_architecture.mmd': lambda inputs, full: generate_system_architecture_diagram(),
+    'business_process.mmd': lambda inputs, full: build_business_process_diagram(inputs['decision_points'], full),
+    'data_flow.mmd': lambda inputs, full: generate_data_flow_diagram(inputs['data_entities']),
+    'decision_tree.mmd': lambda inputs, full: build_decision_tree_diagram(inputs['decision_points'], full),
+    'gantt_chart.mmd': lambda inputs, full: generate_gantt_chart()
+}
+
+def plan_diagrams(requirements, custom_diagrams=None, full=False, page_budget=DEFAULT_PAGE_BUDGET):
+    """Return {filename: (depends_on, input_hash, build)} for every diagram of this run"""
+    if custom_diagrams:
+        return {
+            filename: (('custom',), hash_text(content), lambda content=content: content)
+            for filename, content in custom_diagrams.items()
+        }
+    
+    inputs = dict(requirements, generated_on=datetime.now().strftime('%Y-%m-%d'))
+    plan = {}
+    for filename, depends_on in DIAGRAM_DEPENDENCIES.items():
+        # Hash only the items the diagram reads, so lazy categories are scanned no further
+        limit = None if full else DIAGRAM_ITEM_LIMITS.get(filename)
+        used = {}
+        for name in depends_on:
+            value = inputs[name] if limit is None else inputs[name][:limit]
+            used[name] = value if isinstance(value, str) else list(value)
+        input_hash = hash_value([GENERATOR_FINGERPRINT, full, page_budget, used])
+        build = lambda generator=DIAGRAM_GENERATORS[filename]: generator(inputs, full)
+        plan[filename] = (depends_on, input_hash, build)
+    return plan
+
+def generate_diagrams_iterative(requirements_text, custom_diagrams=None, output_dir="Stage1_Mermaid_Generation/diagrams",
+                                requirements_file=None, chunk_size=DEFAULT_CHUNK_SIZE, render_workers=None,
+                                render_cache=None, online_endpoint=DEFAULT_ONLINE_ENDPOINT, force=False,
+                                full=False, page_budget=DEFAULT_PAGE_BUDGET, staging=True, validate=True,
+                                top_k=DEFAULT_TOP_K, order='frequency', analysis_cache=None,
+                                incremental=True):
+    """Generate diagrams with support for custom modifications
+    
+    When requirements_file is given the file is analyzed in streaming mode (line
+    by line with incremental analysis, otherwise in memory-mapped chunks) and
+    requirements_text is ignored, so the full text is never held in memory.
+    Diagrams, analysis and images whose inputs are unchanged since the last run
+    (per stage1_manifest.json) are skipped unless force is set. Each category keeps
+    its top_k most frequent distinct items; with full set every distinct item is
+    kept and the generated diagrams include all of them. With order 'document'
+    items are taken in document order instead, and the requirements are only
+    scanned as far as the diagrams read them before the first diagram is
+    saved; the rest is scanned for analysis_results.json. With an analysis_cache,
+    unchanged requirements reuse the stored analysis instead. With incremental
+    set (the default), frequency-ordered analysis re-scans only the segments of
+    the requirements edited since the last run and reports its throughput.
+    Diagrams above page_budget nodes and edges are split into linked pages. Unless staging is
+    disabled the run builds in its own directory and publishes its files into
+    output_dir under a lock, so concurrent runs on one output_dir never mix their files.
+    """
     
     print("🎯 Enhanced Iterative Mermaid Diagram Generator")
     print("=" * 50)
     
-    # Create diagrams directory
-    diagrams_dir = ensure_directory_exists(output_dir)
+    # Build into a private staging directory; published file by file once complete
+    run = StagedRun(output_dir, enabled=staging)
+    diagrams_dir = run.open()
     print(f"📁 Diagrams directory: {diagrams_dir}")
     
-    # Analyze requirements
-    print("\n📋 Analyzing requirements...")
-    requirements = analyze_requirements_from_text(requirements_text)
-    
-    # Use custom diagrams if provided, otherwise generate from requirements
-    diagrams = {}
-    
-    if custom_diagrams:
-        print("🎨 Using custom diagram modifications...")
-        diagrams = custom_diagrams
-    else:
-        print("🎨 Generating diagrams from requirements...")
-        diagrams = {
-            'user_journey.mmd': generate_user_journey_diagram(requirements['user_actions']),
-            'system_architecture.mmd': generate_system_architecture_diagram(),
-            'business_process.mmd': generate_business_process_diagram(requirements['decision_points']),
-            'data_flow.mmd': generate_data_flow_diagram(requirements['data_entities']),
-            'decision_tree.mmd': generate_decision_tree_diagram(requirements['decision_points']),
-            'gantt_chart.mmd': generate_gantt_chart()
-        }
-    
-    # Save diagrams with verification
-    print("\n💾 Saving diagrams...")
-    success_count = 0
-    for filename, content in diagrams.items():
-        if save_diagram(diagrams_dir, filename, content):
-            success_count += 1
-    
-    # Save requirements and analysis
-    save_requirements_to_file(requirements_text, os.path.join(diagrams_dir, 'current_requirements.txt'))
-    
-    analysis_file = os.path.join(diagrams_dir, 'analysis_results.json')
     try:
-        with open(analysis_file, 'w', encoding='utf-8') as f:
-            json.dump(requirements, f, indent=2)
-        print(f"✅ Generated: {analysis_file}")
-        success_count += 1
-    except Exception as e:
-        print(f"❌ Error saving analysis: {str(e)}")
-    
-    # Generate images from MMD files
-    print("\n🖼️  Generating images from MMD files...")
-    images_dir = os.path.join(diagrams_dir, 'images')
-    image_success = generate_images_from_mmd_files(diagrams_dir, images_dir)
+        # Analyze requirements
+        print("\n📋 Analyzing requirements...")
+        metrics = get_metrics()
+        top_k = None if full else top_k
+        requirements = None
+        analysis_key = None
+        with metrics.span('analysis'):
+            if analysis_cache is not None:
+                if requirements_file:
+                    content_hash = hash_requirements_file(requirements_file)
+                else:
+                    content_hash = hash_requirements_text(requirements_text)
+                analysis_key = AnalysisCache.key(content_hash, ITERATIVE_RULES, GENERATOR_FINGERPRINT, top_k, order)
+                requirements = analysis_cache.fetch(analysis_key)
+            if requirements is not None:
+                print("🗄️  Analysis cache hit: requirements unchanged, analysis skipped")
+                metrics.count('analysis.cache_hits')
+                analysis_key = None
+            elif incremental and order == 'frequency':
+                requirements = analyze_requirements_incrementally(requirements_text, requirements_file, diagrams_dir,
+                                                                  top_k, chunk_size, fresh=force)
+            elif requirements_file:
+                requirements = analyze_requirements_from_file(requirements_file, chunk_size, top_k, order)
+            else:
+                requirements = analyze_requirements_from_text(requirements_text, top_k, order)
+        
+        # Use custom diagrams if provided, otherwise generate from requirements
+        if custom_diagrams:
+            print("🎨 Using custom diagram modifications...")
+        else:
+            print("🎨 Generating diagrams from requirements...")
+        diagrams = plan_diagrams(requirements, custom_diagrams, full, page_budget)
+        manifest = DiagramManifest(diagrams_dir)
+        
+        # Save only the diagrams whose inputs changed
+        print("\n💾 Saving diagrams...")
+        success_count = 0
+        changed = []
+        skipped = []
+        mmd_files = []
+        for filename, (depends_on, input_hash, build) in diagrams.items():
+            pages = manifest.dependents(filename, '.mmd')
+            if not force and all(manifest.is_current(name, input_hash) for name in [filename] + pages):
+                skipped.append(filename)
+                mmd_files.extend([filename] + pages)
+                success_count += 1
+                metrics.count('diagrams.skipped')
+                continue
+            
+            # Oversized diagrams become numbered pages plus an index under filename
+            with metrics.span('generation', diagram=filename):
+                files = paginate_diagram(filename, build(), page_budget)
+            for stale in set(pages) - set(files):
+                manifest.forget(stale)
+                manifest.forget(image_name(stale))
+                remove_stale_file(os.path.join(diagrams_dir, image_name(stale)))
+            remove_stale_pages(diagrams_dir, files)
+            
+            saved = True
+            for name, content in files.items():
+                with metrics.span('save', diagram=name):
+                    saved_file = save_diagram(diagrams_dir, name, content)
+                if saved_file:
+                    manifest.record(name, depends_on if name == filename else (filename,), input_hash,
+                                    hash_file(os.path.join(diagrams_dir, name)))
+                    changed.append(name)
+                else:
+                    saved = False
+            mmd_files.extend(files)
+            if saved:
+                success_count += 1
+        
+        # Save requirements and analysis
+        current_requirements = os.path.join(diagrams_dir, 'current_requirements.txt')
+        if requirements_file:
+            requirements_hash = hash_file(requirements_file)
+        else:
+            requirements_hash = hash_text(requirements_text)
+        if not force and manifest.is_current('current_requirements.txt', requirements_hash):
+            skipped.append('current_requirements.txt')
+        else:
+            if requirements_file:
+                saved = copy_requirements_file(requirements_file, current_requirements)
+            else:
+                saved = save_requirements_to_file(requirements_text, current_requirements)
+            if saved:
+                manifest.record('current_requirements.txt', ('requirements',), requirements_hash, hash_file(current_requirements))
+        
+        analysis_file = os.path.join(diagrams_dir, 'analysis_results.json')
+        with metrics.span('analysis_complete'):
+            requirements = resolve_requirements(requirements)
+        if analysis_key:
+            analysis_cache.store(analysis_key, requirements)
+        count_requirement_matches(metrics, requirements)
+        analysis_hash = hash_value(requirements)
+        if not force and manifest.is_current('analysis_results.json', analysis_hash):
+            skipped.append('analysis_results.json')
+            success_count += 1
+        else:
+            try:
+                get_artifact_writer().write_json(analysis_file, requirements)
+                print(f"✅ Generated: {analysis_file}")
+                manifest.record('analysis_results.json', list(requirements), analysis_hash, hash_file(analysis_file))
+                success_count += 1
+            except Exception as e:
+                print(f"❌ Error saving analysis: {str(e)}")
+        
+        # Generate images only for diagrams that changed or whose image is out of date
+        print("\n🖼️  Generating images from MMD files...")
+        images_dir = os.path.join(diagrams_dir, IMAGES_DIRNAME)
+        image_inputs = {
+            filename: hash_file(os.path.join(diagrams_dir, filename))
+            for filename in mmd_files if os.path.exists(os.path.join(diagrams_dir, filename))
+        }
+        to_render = {
+            filename for filename, mmd_hash in image_inputs.items()
+            if force or not manifest.is_current(image_name(filename), mmd_hash)
+        }
+        if to_render:
+            # Stale images must not be mistaken for fresh ones if their render fails
+            for filename in to_render:
+                remove_stale_file(os.path.join(diagrams_dir, image_name(filename)))
+            image_success = generate_images_from_mmd_files(
+                diagrams_dir, images_dir, render_workers, render_cache, online_endpoint, only=to_render, validate=validate
+            )
+            for filename in to_render:
+                image_path = os.path.join(diagrams_dir, image_name(filename))
+                if os.path.exists(image_path):
+                    manifest.record(image_name(filename), (filename,), image_inputs[filename], hash_file(image_path))
+        else:
+            print("⏭️  All images are up to date")
+            image_success = True
+        skipped.extend(image_name(filename) for filename in sorted(set(image_inputs) - to_render))
+        
+        manifest.save()
+        writer = get_artifact_writer()
+        writer.sync()
+        
+        # Publish this run's outputs under the staging lock
+        with metrics.span('publish'):
+            diagrams_dir = run.publish()
+    except BaseException:
+        # A failed run leaves the published outputs as they were
+        run.discard()
+        raise
+    images_dir = os.path.join(diagrams_dir, IMAGES_DIRNAME)
+    record_writer(metrics, writer)
     
     # Summary
     print(f"\n🎉 Mermaid diagrams generation completed!")
@@ -319,23 +592,76 @@ def generate_diagrams_iterative(requirements_text, custom_diagrams=None, output_
         print(f"🖼️  Successfully generated: Image files in {images_dir}")
     else:
         print(f"⚠️  Image generation failed - MMD files available for manual conversion")
+    if skipped:
+        print(f"⏭️  Skipped (inputs unchanged): {', '.join(skipped)}")
+    print(f"💾 Artifacts: {writer.summary()}")
+    print(f"⏱️  Stages: {metrics.summary()}")
     print(f"📁 All files saved to: {diagrams_dir}")
     print(f"🔗 Ready for FSD integration!")
     
     return success_count > 0
 
+def image_name(mmd_filename):
+    """Return the manifest name of the image rendered from an .mmd file"""
+    return os.path.join(IMAGES_DIRNAME, f"{Path(mmd_filename).stem}.png")
+
+def remove_stale_file(file_path):
+    """Remove a file if it exists"""
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
 def main():
     """Main function with command line argument support"""
     parser = argparse.ArgumentParser(description='Enhanced Iterative Mermaid Diagram Generator')
     parser.add_argument('--requirements', '-r', help='Requirements text or file path')
     parser.add_argument('--custom-diagrams', '-c', help='JSON file with custom diagram modifications')
     parser.add_argument('--output-dir', '-o', default='Stage1_Mermaid_Generation/diagrams', help='Output directory')
+    parser.add_argument('--stream', action='store_true', help='Analyze a requirements file without loading it whole: line by line, or in memory-mapped chunks with --no-incremental (for very large files)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Chunk size in bytes for --stream (the read buffer size with incremental analysis)')
+    parser.add_argument('--render-workers', type=int, default=None, help='Maximum concurrent image renders (default: CPU count)')
+    parser.add_argument('--render-cache', default=DEFAULT_RENDER_CACHE_DIR, help='Directory of the content-addressed render cache')
+    parser.add_argument('--render-cache-mb', type=int, default=DEFAULT_RENDER_CACHE_MB, help='Size cap of the render cache in MB')
+    parser.add_argument('--no-render-cache', action='store_true', help='Always re-render every diagram')
+    parser.add_argument('--analysis-cache', default=DEFAULT_ANALYSIS_CACHE_DIR, help='Directory of the requirements analysis cache')
+    parser.add_argument('--analysis-cache-mb', type=int, default=DEFAULT_ANALYSIS_CACHE_MB, help='Size cap of the analysis cache in MB')
+    parser.add_argument('--analysis-cache-days', type=int, default=DEFAULT_ANALYSIS_CACHE_DAYS, help='Drop cached analyses unused for this many days')
+    parser.add_argument('--no-analysis-cache', action='store_true', help='Always re-analyze the requirements')
+    parser.add_argument('--online-endpoint', default=DEFAULT_ONLINE_ENDPOINT, help='Base URL of the online renderer')
+    parser.add_argument('--full', action='store_true', help='Include every distinct extracted action and decision instead of the most frequent few')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Most frequent distinct items kept per category in the analysis (all with --full)')
+    parser.add_argument('--order', choices=('frequency', 'document'), default='frequency',
+                        help='Pick diagram items by frequency (scans everything first) or in document order '
+                             '(scans only as far as the diagrams need before the first one is saved)')
+    parser.add_argument('--no-incremental', action='store_true',
+                        help='Re-scan the whole requirements document instead of only the lines edited since the last run')
+    parser.add_argument('--page-budget', type=int, default=DEFAULT_PAGE_BUDGET, help='Nodes and edges per diagram before it is split into linked pages')
+    parser.add_argument('--no-staging', action='store_true', help='Write straight into the output directory instead of staging and publishing once complete')
+    parser.add_argument('--force', action='store_true', help='Regenerate every diagram even if its inputs are unchanged')
+    parser.add_argument('--no-validate', action='store_true', help='Send diagrams to the renderer without the Mermaid syntax check')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Save per-stage timings, per-diagram spans and counters to FILE')
+    parser.add_argument('--profile', metavar='FILE', help='Profile the run with cProfile and save the stats to FILE')
+    parser.add_argument('--memory-profile', metavar='FILE',
+                        help='Trace allocations and save per-stage peak and retained memory and top allocation sites to FILE')
     
     args = parser.parse_args()
     
+    get_metrics('enhanced-iterative-mermaid-generator')
+    if args.metrics_json:
+        write_metrics_at_exit(args.metrics_json, get_artifact_writer())
+    if args.profile:
+        profile_to_file_at_exit(args.profile)
+    if args.memory_profile:
+        profile_memory_to_file_at_exit(args.memory_profile, get_artifact_writer())
+    
     # Get requirements
+    requirements_text = None
+    requirements_file = None
     if args.requirements:
-        if os.path.exists(args.requirements):
+        if args.stream and os.path.isfile(args.requirements):
+            requirements_file = args.requirements
+        elif os.path.exists(args.requirements):
             with open(args.requirements, 'r', encoding='utf-8') as f:
                 requirements_text = f.read()
         else:
@@ -362,7 +688,16 @@ def main():
             print(f"❌ Error loading custom diagrams: {str(e)}")
     
     # Generate diagrams
-    generate_diagrams_iterative(requirements_text, custom_diagrams, args.output_dir)
+    generate_diagrams_iterative(requirements_text, custom_diagrams, args.output_dir,
+                                requirements_file=requirements_file, chunk_size=args.chunk_size,
+                                render_workers=args.render_workers,
+                                render_cache=None if args.no_render_cache else RenderCache(args.render_cache, args.render_cache_mb),
+                                online_endpoint=args.online_endpoint, force=args.force,
+                                full=args.full, page_budget=args.page_budget, staging=not args.no_staging,
+                                validate=not args.no_validate, top_k=args.top_k, order=args.order,
+                                analysis_cache=None if args.no_analysis_cache else AnalysisCache(
+                                    args.analysis_cache, args.analysis_cache_mb, args.analysis_cache_days
+                                ), incremental=not args.no_incremental)
 
 if __name__ == "__main__":
     main()
@@ -7,9 +7,44 @@ import json
 import os
 import subprocess
 import sys
+import time
+import argparse
 from pathlib import Path
 from datetime import datetime, timedelta
 
+from requirements_analysis import (
+    DEFAULT_TOP_K, ENHANCED_RULES, extract_requirements_corpus, extract_requirements_streaming, format_throughput
+)
+from analysis_cache import (
+    DEFAULT_ANALYSIS_CACHE_DAYS, DEFAULT_ANALYSIS_CACHE_DIR, DEFAULT_ANALYSIS_CACHE_MB, AnalysisCache, cached_analysis,
+    hash_requirements_file
+)
+from artifact_writer import get_artifact_writer
+from mermaid_diagrams import Chain, Edge, Flowchart, GanttChart, Node, NodeIdAllocator, Section, Task, node_id
+from mermaid_pagination import DEFAULT_PAGE_BUDGET, IMAGES_DIRNAME, paginate_diagram, remove_stale_pages
+from mermaid_validation import filter_valid_diagrams
+from mermaid_rendering import (
+    DEFAULT_RENDER_CACHE_DIR, DEFAULT_RENDER_CACHE_MB, PROCESS_RENDER_MEMORY_MB, WORKER_RENDER_MEMORY_MB,
+    RenderCache, RenderError, cached_render, get_render_worker, mermaid_cli_version,
+    plan_render_concurrency, print_render_timings, render_batch
+)
+from online_rendering import DEFAULT_ONLINE_CONCURRENCY, DEFAULT_ONLINE_ENDPOINT, render_files_online
+from pipeline_metrics import (
+    count_requirement_matches, get_metrics, profile_memory_to_file_at_exit, profile_to_file_at_exit,
+    record_render_results, record_writer, write_metrics_at_exit
+)
+from stage1_manifest import hash_file
+from stage1_staging import StagedRun
+
+# Stage 1 documentation that must never be treated as requirements
+NON_REQUIREMENT_PREFIXES = (
+    'mermaid_', 'kickoff_', 'kickoff-', 'stage1_', 'stage1-', 'troubleshooting',
+    'user_guide', 'validation_', 'README', 'IMAGE_GENERATION_'
+)
+
+# Generated or template folders skipped when collecting a requirements corpus
+NON_REQUIREMENT_DIRS = {'diagrams', 'example_outputs', 'mermaid_templates'}
+
 def ensure_directory_exists(directory_path):
     """Ensure directory exists, create if it doesn't"""
     Path(directory_path).mkdir(parents=True, exist_ok=True)
@@ -59,6 +94,9 @@ def generate_image_from_mmd(mmd_file_path, output_dir, cli_type='local'):
         else:
             cmd = ['npx', 'mmdc', '-i', mmd_file_path, '-o', output_file, '-t', 'neutral', '-b', 'white']
         
+        # mmdc writes into its output file, so unlink it first rather than modify a linked copy
+        if os.path.lexists(output_file):
+            os.remove(output_file)
         result = subprocess.run(cmd, capture_output=True, text=True)
         
         if result.returncode == 0:
@@ -72,62 +110,49 @@ def generate_image_from_mmd(mmd_file_path, output_dir, cli_type='local'):
         print(f"❌ Error generating image: {str(e)}")
         return False
 
-def generate_image_from_mmd_online(mmd_file_path, output_dir):
+def generate_image_from_mmd_online(mmd_file_path, output_dir, base_url=DEFAULT_ONLINE_ENDPOINT):
     """Generate PNG image from MMD file using online Mermaid API (fallback)"""
+    results = render_files_online([mmd_file_path], output_dir, base_url=base_url)
+    return results[0]['success']
+
+def generate_image_with_worker(worker, mmd_file_path, output_dir):
+    """Generate PNG image from MMD file using the persistent render worker"""
     try:
-        import requests
-        import base64
-        
-        # Read MMD content
-        with open(mmd_file_path, 'r', encoding='utf-8') as f:
-            mmd_content = f.read()
-        
-        # Extract filename without extension
-        filename = Path(mmd_file_path).stem
-        output_file = os.path.join(output_dir, f"{filename}.png")
-        
-        # Use Mermaid online API
-        url = "https://mermaid.ink/img/" + base64.b64encode(mmd_content.encode()).decode()
-        
-        response = requests.get(url)
-        if response.status_code == 200:
-            with open(output_file, 'wb') as f:
-                f.write(response.content)
-            print(f"✅ Generated image (online): {output_file}")
-            return True
-        else:
-            print(f"❌ Failed to generate image online: HTTP {response.status_code}")
-            return False
-            
-    except ImportError:
-        print("❌ requests library not available for online image generation")
-        return False
-    except Exception as e:
-        print(f"❌ Error generating image online: {str(e)}")
+        output_file = worker.render_file(mmd_file_path, output_dir)
+        print(f"✅ Generated image: {output_file}")
+        return True
+    except (RenderError, OSError) as e:
+        print(f"❌ Render worker failed: {str(e)}")
         return False
 
-def generate_images_from_mmd_files(mmd_dir, images_dir):
-    """Generate images for all MMD files"""
+def generate_images_from_mmd_files(mmd_dir, images_dir, use_worker=True, max_workers=None, memory_budget_mb=None,
+                                   render_cache=None, online_endpoint=DEFAULT_ONLINE_ENDPOINT, validate=True):
+    """Generate images for all MMD files
+
+    Unless validate is False, diagrams with syntax errors are reported and never sent to the renderer.
+    """
     ensure_directory_exists(images_dir)
     
     print(f"🔍 Looking for MMD files in: {mmd_dir}")
     print(f"📁 Images will be saved to: {images_dir}")
     
     # Check if Mermaid CLI is available
-    cli_available, cli_type = check_mermaid_cli()
+    metrics = get_metrics()
+    with metrics.span('cli_probe'):
+        cli_available, cli_type = check_mermaid_cli()
     print(f"🎨 Mermaid CLI status: {'Available' if cli_available else 'Not available'} ({cli_type})")
     
     if not cli_available:
         print("⚠️  Mermaid CLI not found. Attempting to install...")
-        if not install_mermaid_cli():
+        with metrics.span('npm_install'):
+            installed = install_mermaid_cli()
+        if not installed:
             print("⚠️  CLI installation failed. Trying online method...")
-            return generate_images_online(mmd_dir, images_dir)
+            return generate_images_online(mmd_dir, images_dir, max_workers, render_cache, online_endpoint, validate,
+                                          memory_budget_mb)
         cli_type = 'local'  # After local installation
         print("✅ Mermaid CLI installed successfully")
     
-    success_count = 0
-    total_files = 0
-    
     # Find all MMD files
     if not os.path.exists(mmd_dir):
         print(f"❌ MMD directory does not exist: {mmd_dir}")
@@ -135,80 +160,146 @@ def generate_images_from_mmd_files(mmd_dir, images_dir):
         
     mmd_files = [f for f in os.listdir(mmd_dir) if f.endswith('.mmd')]
     print(f"📋 Found {len(mmd_files)} MMD files: {mmd_files}")
-    
-    for filename in mmd_files:
-        total_files += 1
-        mmd_path = os.path.join(mmd_dir, filename)
-        print(f"🖼️  Processing: {filename}")
-        if generate_image_from_mmd(mmd_path, images_dir, cli_type):
-            success_count += 1
+    mmd_paths = [os.path.join(mmd_dir, f) for f in mmd_files]
+    if validate:
+        with metrics.span('validation'):
+            mmd_paths = filter_valid_diagrams(mmd_paths)
+        metrics.count('diagrams.invalid', len(mmd_files) - len(mmd_paths))
+    
+    # One long-lived renderer for the whole run instead of one mmdc process per file
+    worker = None
+    if use_worker and mmd_paths:
+        workers = plan_render_concurrency(max_workers, memory_budget_mb, WORKER_RENDER_MEMORY_MB)
+        worker = get_render_worker(workers)
+        if worker:
+            print("⚡ Using persistent render worker")
         else:
-            print(f"⚠️  Failed to generate image for: {filename}")
+            print("⚠️  Render worker unavailable, using one mmdc process per file")
+    if not worker:
+        workers = plan_render_concurrency(max_workers, memory_budget_mb, PROCESS_RENDER_MEMORY_MB)
+    print(f"⚙️  Rendering up to {workers} diagrams at once")
+    
+    def render(mmd_path):
+        print(f"🖼️  Processing: {os.path.basename(mmd_path)}")
+        if worker and generate_image_with_worker(worker, mmd_path, images_dir):
+            return True
+        if generate_image_from_mmd(mmd_path, images_dir, cli_type):
+            return True
+        print(f"⚠️  Failed to generate image for: {os.path.basename(mmd_path)}")
+        return False
+    
+    render_function = render
+    if render_cache:
+        renderer = f"mermaid-cli:{mermaid_cli_version(cli_type)}"
+        render_function = lambda mmd_path: cached_render(render_cache, mmd_path, images_dir, renderer, render)
+    
+    start = time.perf_counter()
+    cache_hits = render_cache.hits if render_cache else 0
+    with metrics.span('render'):
+        results = render_batch(mmd_paths, render_function, workers)
+    record_render_results(metrics, results, render_cache.hits - cache_hits if render_cache else 0)
+    print_render_timings(results, time.perf_counter() - start)
+    if render_cache:
+        print(f"🗄️  Render cache: {render_cache.summary()}")
+    
+    success_count = sum(1 for result in results if result['success'])
+    total_files = len(mmd_files)
     
     print(f"📊 Image generation: {success_count}/{total_files} files")
     return success_count > 0
 
-def generate_images_online(mmd_dir, images_dir):
+def generate_images_online(mmd_dir, images_dir, max_workers=None, render_cache=None, base_url=DEFAULT_ONLINE_ENDPOINT,
+                           validate=True, memory_budget_mb=None):
     """Generate images using online Mermaid API as fallback"""
-    try:
-        import requests
-        print("🌐 Using online Mermaid API for image generation...")
-        
-        success_count = 0
-        total_files = 0
-        
-        # Find all MMD files
-        for filename in os.listdir(mmd_dir):
-            if filename.endswith('.mmd'):
-                total_files += 1
-                mmd_path = os.path.join(mmd_dir, filename)
-                if generate_image_from_mmd_online(mmd_path, images_dir):
-                    success_count += 1
-        
-        print(f"📊 Online image generation: {success_count}/{total_files} files")
-        return success_count > 0
-        
-    except ImportError:
-        print("❌ Cannot generate images - neither CLI nor online method available")
-        print("💡 Install requests: pip install requests")
-        return False
+    print(f"🌐 Using online Mermaid API for image generation ({base_url})...")
+    
+    # Find all MMD files
+    mmd_paths = [os.path.join(mmd_dir, f) for f in os.listdir(mmd_dir) if f.endswith('.mmd')]
+    total_files = len(mmd_paths)
+    metrics = get_metrics()
+    if validate:
+        with metrics.span('validation'):
+            mmd_paths = filter_valid_diagrams(mmd_paths)
+        metrics.count('diagrams.invalid', total_files - len(mmd_paths))
+    
+    # One pooled async client; online renders are network bound, and the memory budget only sizes the local fallback
+    start = time.perf_counter()
+    cache_hits = render_cache.hits if render_cache else 0
+    with metrics.span('render'):
+        results = render_files_online(
+            mmd_paths, images_dir, render_cache=render_cache, max_workers=max_workers,
+            memory_budget_mb=memory_budget_mb, base_url=base_url,
+            max_connections=max_workers or DEFAULT_ONLINE_CONCURRENCY
+        )
+    record_render_results(metrics, results, render_cache.hits - cache_hits if render_cache else 0)
+    print_render_timings(results, time.perf_counter() - start)
+    if render_cache:
+        print(f"🗄️  Render cache: {render_cache.summary()}")
+    
+    success_count = sum(1 for result in results if result['success'])
+    
+    print(f"📊 Online image generation: {success_count}/{total_files} files")
+    return success_count > 0
 
-def analyze_requirements(file_path):
-    """Analyze raw requirements and extract flow information"""
+def analyze_requirements(file_path, top_k=DEFAULT_TOP_K):
+    """Analyze raw requirements and extract flow information
+    
+    Every category lists its top_k most frequent distinct items (all of them
+    when top_k is None), most frequent first.
+    """
     
     if not os.path.exists(file_path):
         print(f"⚠️  Warning: {file_path} not found. Using default requirements.")
         return get_default_requirements()
     
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Extract user actions
-    user_actions = re.findall(r'user\s+(?:can\s+)?(?:should\s+)?(?:must\s+)?(\w+)', content, re.IGNORECASE)
-    
-    # Extract decision points (improved regex)
-    decision_points = re.findall(r'(?:if|when|whether)\s+([^,\.\n]+)', content, re.IGNORECASE)
+    # Stream the file through the single-pass extractor in bounded chunks
+    extracted, stats = extract_requirements_streaming(file_path, ENHANCED_RULES, top_k=top_k)
+    print(f"⚡ Analyzed {format_throughput(stats)}")
+    user_actions = extracted['user_actions']
+    validation_rules = extracted['validation_rules']
+    system_interactions = extracted['system_interactions']
+    data_entities = extracted['data_entities']
     
     # Clean up decision points
-    decision_points = [d.strip() for d in decision_points if d.strip() and len(d.strip()) > 3]
-    
-    # Extract validation rules
-    validation_rules = re.findall(r'(?:validate|check|ensure)\s+([^,\.]+)', content, re.IGNORECASE)
-    
-    # Extract system interactions
-    system_interactions = re.findall(r'(?:system|application|app)\s+(?:should|must|can)\s+([^,\.]+)', content, re.IGNORECASE)
-    
-    # Extract data entities
-    data_entities = re.findall(r'(?:create|store|save|update|delete)\s+([^,\.]+)', content, re.IGNORECASE)
+    decision_points = [d for d in extracted['decision_points'] if len(d) > 3]
     
     return {
         'user_actions': user_actions if user_actions else ['login', 'browse', 'select', 'submit'],
         'decision_points': decision_points if decision_points else ['valid input', 'user authenticated', 'data available'],
         'validation_rules': validation_rules if validation_rules else ['input validation', 'authentication check'],
         'system_interactions': system_interactions if system_interactions else ['process request', 'store data', 'send notification'],
-        'data_entities': data_entities if data_entities else ['user', 'session', 'data']
+        'data_entities': data_entities if data_entities else ['user', 'session', 'data'],
+        'counts': extracted['counts'],
+        'matches': extracted['matches']
     }
 
+def analyze_requirements_corpus(file_paths, workers=None, top_k=DEFAULT_TOP_K):
+    """Analyze many requirements documents in parallel and merge the results"""
+    
+    merged, stats = extract_requirements_corpus(file_paths, ENHANCED_RULES, workers, top_k=top_k)
+    print(f"⚡ Analyzed {stats['documents']} documents with {stats['workers']} workers: {format_throughput(stats)}")
+    
+    # Clean up decision points, keeping each one's source document
+    decisions = [
+        (d, source)
+        for d, source in zip(merged['decision_points'], merged['sources']['decision_points'])
+        if len(d) > 3
+    ]
+    merged['decision_points'] = [d for d, _ in decisions]
+    merged['sources']['decision_points'] = [source for _, source in decisions]
+    
+    # Fall back to defaults for empty categories
+    defaults = get_default_requirements()
+    for category, values in defaults.items():
+        if not merged[category]:
+            merged[category] = values
+            merged['sources'][category] = [None] * len(values)
+    
+    return merged
+
+# Cached analyses are only reused by the same version of this generator (its defaults shape them)
+GENERATOR_FINGERPRINT = hash_file(os.path.abspath(__file__))
+
 def get_default_requirements():
     """Get default requirements if file doesn't exist"""
     return {
@@ -219,34 +310,39 @@ def get_default_requirements():
         'data_entities': ['user', 'session', 'data', 'audit_log']
     }
 
-def generate_user_journey_diagram(actions):
-    """Generate user journey Mermaid diagram"""
+def build_user_journey_diagram(actions, full=False):
+    """Build the user journey diagram model"""
     
-    diagram = "graph TD\n"
+    diagram = Flowchart()
     
-    for i, action in enumerate(actions[:6]):  # Limit to 6 actions for clarity
-        node_id = chr(65 + i)
-        if i == 0:
-            diagram += f"    {node_id}[{action.title()}]\n"
-        else:
-            prev_node = chr(65 + i - 1)
-            diagram += f"    {prev_node} --> {node_id}[{action.title()}]\n"
+    if not full:
+        actions = actions[:6]  # Limit to 6 actions for clarity
+    
+    labels = [action.title() for action in actions]
+    if labels:
+        diagram.add(Chain(map(node_id, range(len(labels))), labels))
     
     return diagram
 
+def generate_user_journey_diagram(actions, full=False):
+    """Generate user journey Mermaid diagram"""
+    
+    return build_user_journey_diagram(actions, full).to_mermaid()
+
 def generate_system_architecture_diagram():
     """Generate system architecture Mermaid diagram"""
     
-    diagram = "graph TD\n"
-    diagram += "    A[Frontend - Vue.js 3] --> B[API Gateway]\n"
-    diagram += "    B --> C[Authentication Service]\n"
-    diagram += "    B --> D[Business Logic Service]\n"
-    diagram += "    C --> E[Azure AD]\n"
-    diagram += "    D --> F[MongoDB Database]\n"
-    diagram += "    G[Load Balancer] --> A\n"
-    diagram += "    H[External APIs] --> B\n"
-    
-    return diagram
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Frontend - Vue.js 3'), Node('B', 'API Gateway')),
+        Edge('B', Node('C', 'Authentication Service')),
+        Edge('B', Node('D', 'Business Logic Service')),
+        Edge('C', Node('E', 'Azure AD')),
+        Edge('D', Node('F', 'MongoDB Database')),
+        Edge(Node('G', 'Load Balancer'), 'A'),
+        Edge(Node('H', 'External APIs'), 'B')
+    ])
+    
+    return diagram.to_mermaid()
 
 def sanitize_mermaid_text(text):
     """Sanitize text for Mermaid diagram compatibility"""
@@ -268,62 +364,75 @@ def sanitize_mermaid_text(text):
     
     return text or "condition"
 
-def generate_business_process_diagram(decisions):
-    """Generate business process Mermaid diagram"""
+def build_business_process_diagram(decisions, full=False):
+    """Build the business process diagram model"""
     
-    diagram = "graph TD\n"
-    diagram += "    A[Business Event] --> B[Process Step 1]\n"
-    diagram += "    B --> C{Decision Point}\n"
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Business Event'), Node('B', 'Process Step 1')),
+        Edge('B', Node('C', 'Decision Point', 'decision'))
+    ])
     
     # Use sanitized decisions
-    sanitized_decisions = [sanitize_mermaid_text(d) for d in decisions[:3]]
+    sanitized_decisions = [sanitize_mermaid_text(d) for d in (decisions if full else decisions[:3])]
     
-    for i, decision in enumerate(sanitized_decisions):
-        if i == 0:
-            diagram += f"    C -->|{decision}| D[Process A]\n"
-        elif i == 1:
-            diagram += f"    C -->|{decision}| E[Process B]\n"
-        else:
-            diagram += f"    C -->|{decision}| F[Process C]\n"
+    # Outcome nodes D, E, F (and H, I, ... in full mode) around the fixed A, B, C and G
+    ids = NodeIdAllocator(reserved=('A', 'B', 'C', 'G'))
+    outcomes = [Node(ids.allocate(), f"Process {node_id(i)}") for i in range(max(3, len(sanitized_decisions)))]
+    for outcome, decision in zip(outcomes, sanitized_decisions):
+        diagram.add(Edge('C', outcome, decision))
     
-    diagram += "    D --> G[End State]\n"
-    diagram += "    E --> G\n"
-    diagram += "    F --> G\n"
+    diagram.add(Edge(outcomes[0].id, Node('G', 'End State')))
+    diagram.extend(Edge(outcome.id, 'G') for outcome in outcomes[1:])
     
     return diagram
 
+def generate_business_process_diagram(decisions, full=False):
+    """Generate business process Mermaid diagram"""
+    
+    return build_business_process_diagram(decisions, full).to_mermaid()
+
 def generate_data_flow_diagram(entities):
     """Generate data flow Mermaid diagram"""
     
-    diagram = "graph TD\n"
-    diagram += "    A[Data Source] --> B[Data Processing]\n"
-    diagram += "    B --> C[Data Validation]\n"
-    diagram += "    C --> D[Data Storage]\n"
-    diagram += "    D --> E[Data Retrieval]\n"
-    diagram += "    E --> F[Data Presentation]\n"
-    diagram += "    G[User Input] --> A\n"
-    diagram += "    F --> H[User Output]\n"
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Data Source'), Node('B', 'Data Processing')),
+        Edge('B', Node('C', 'Data Validation')),
+        Edge('C', Node('D', 'Data Storage')),
+        Edge('D', Node('E', 'Data Retrieval')),
+        Edge('E', Node('F', 'Data Presentation')),
+        Edge(Node('G', 'User Input'), 'A'),
+        Edge('F', Node('H', 'User Output'))
+    ])
+    
+    return diagram.to_mermaid()
+
+def build_decision_tree_diagram(decisions, full=False):
+    """Build the decision tree diagram model"""
+    
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Root Decision'), Node('B', 'Condition 1?', 'decision'))
+    ])
+    
+    # Each decision adds a condition with a Yes action; the last condition's No is the default
+    ids = NodeIdAllocator(reserved=('A', 'B'))
+    depth = len(decisions) if full else 3  # Limit to 3 conditions
+    condition = 'B'
+    for i in range(min(len(decisions), depth)):
+        yes = Node(ids.allocate(), f"Action {node_id(i)}")
+        if i == depth - 1:
+            no = Node(ids.allocate(), 'Default Action')
+        else:
+            no = Node(ids.allocate(), f"Condition {i + 2}?", 'decision')
+        diagram.add(Edge(condition, yes, 'Yes'))
+        diagram.add(Edge(condition, no, 'No'))
+        condition = no.id
     
     return diagram
 
-def generate_decision_tree_diagram(decisions):
+def generate_decision_tree_diagram(decisions, full=False):
     """Generate decision tree Mermaid diagram"""
     
-    diagram = "graph TD\n"
-    diagram += "    A[Root Decision] --> B{Condition 1?}\n"
-    
-    for i, decision in enumerate(decisions[:4]):  # Limit to 4 decisions
-        if i == 0:
-            diagram += f"    B -->|Yes| C[Action A]\n"
-            diagram += f"    B -->|No| D{{Condition 2?}}\n"
-        elif i == 1:
-            diagram += f"    D -->|Yes| E[Action B]\n"
-            diagram += f"    D -->|No| F{{Condition 3?}}\n"
-        elif i == 2:
-            diagram += f"    F -->|Yes| G[Action C]\n"
-            diagram += f"    F -->|No| H[Default Action]\n"
-    
-    return diagram
+    return build_decision_tree_diagram(decisions, full).to_mermaid()
 
 def generate_gantt_chart():
     """Generate Gantt chart for project timeline"""
@@ -331,39 +440,40 @@ def generate_gantt_chart():
     # Calculate dates based on current date
     start_date = datetime.now()
     
-    diagram = "gantt\n"
-    diagram += "    title Development Timeline\n"
-    diagram += "    dateFormat  YYYY-MM-DD\n"
-    diagram += "    section Phase 1 - Setup\n"
-    diagram += f"    Project Setup    :a1, {start_date.strftime('%Y-%m-%d')}, 7d\n"
-    diagram += f"    Authentication   :after a1, 14d\n"
-    diagram += "    section Phase 2 - Core Features\n"
-    diagram += f"    File Upload      :{(start_date + timedelta(days=21)).strftime('%Y-%m-%d')}, 21d\n"
-    diagram += f"    AI Processing    :{(start_date + timedelta(days=42)).strftime('%Y-%m-%d')}, 28d\n"
-    diagram += "    section Phase 3 - Integration\n"
-    diagram += f"    Data Review      :{(start_date + timedelta(days=70)).strftime('%Y-%m-%d')}, 14d\n"
-    diagram += f"    Submission       :{(start_date + timedelta(days=84)).strftime('%Y-%m-%d')}, 7d\n"
-    diagram += "    section Phase 4 - Deployment\n"
-    diagram += f"    Testing          :{(start_date + timedelta(days=91)).strftime('%Y-%m-%d')}, 14d\n"
-    diagram += f"    Deployment       :{(start_date + timedelta(days=105)).strftime('%Y-%m-%d')}, 7d\n"
-    
-    return diagram
+    def start(days):
+        return (start_date + timedelta(days=days)).strftime('%Y-%m-%d')
+    
+    diagram = GanttChart('Development Timeline', statements=[
+        Section('Phase 1 - Setup'),
+        Task('Project Setup', f"a1, {start(0)}, 7d"),
+        Task('Authentication', 'after a1, 14d'),
+        Section('Phase 2 - Core Features'),
+        Task('File Upload', f"{start(21)}, 21d"),
+        Task('AI Processing', f"{start(42)}, 28d"),
+        Section('Phase 3 - Integration'),
+        Task('Data Review', f"{start(70)}, 14d"),
+        Task('Submission', f"{start(84)}, 7d"),
+        Section('Phase 4 - Deployment'),
+        Task('Testing', f"{start(91)}, 14d"),
+        Task('Deployment', f"{start(105)}, 7d")
+    ])
+    
+    return diagram.to_mermaid()
 
 def save_diagram(directory, filename, content):
-    """Save diagram content to file with verification"""
+    """Save diagram content atomically, leaving an identical existing file untouched"""
     file_path = os.path.join(directory, filename)
     
+    if not content:
+        print(f"❌ Failed to create: {file_path} (empty diagram)")
+        return False
+    
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-        
-        # Verify file was created and has content
-        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+        if get_artifact_writer().write_text(file_path, content):
             print(f"✅ Generated: {file_path}")
-            return True
         else:
-            print(f"❌ Failed to create: {file_path}")
-            return False
+            print(f"✅ Unchanged: {file_path}")
+        return True
             
     except Exception as e:
         print(f"❌ Error saving {file_path}: {str(e)}")
@@ -392,66 +502,170 @@ def find_requirements_file():
     # Look for any .md or .txt file in Stage1_Mermaid_Generation
     if os.path.exists(stage1_dir):
         for filename in os.listdir(stage1_dir):
-            if filename.endswith(('.md', '.txt')) and not filename.startswith(('mermaid_', 'kickoff_', 'stage1_', 'troubleshooting', 'user_guide', 'validation_')):
+            if filename.endswith(('.md', '.txt')) and not filename.startswith(NON_REQUIREMENT_PREFIXES):
                 return os.path.join(stage1_dir, filename)
     
     # Default fallback
     return 'raw_requirements.txt'
 
+def find_requirements_files(stage1_dir='Stage1_Mermaid_Generation'):
+    """Find every requirements document under the Stage 1 directory"""
+    requirement_files = []
+    
+    for root, dirs, files in os.walk(stage1_dir):
+        dirs[:] = sorted(d for d in dirs if d not in NON_REQUIREMENT_DIRS and not d.startswith('.'))
+        for filename in sorted(files):
+            if filename.endswith(('.md', '.txt')) and not filename.startswith(NON_REQUIREMENT_PREFIXES):
+                requirement_files.append(os.path.join(root, filename))
+    
+    return requirement_files
+
 def main():
     """Main function to generate all Mermaid diagrams"""
+    parser = argparse.ArgumentParser(description='Enhanced Mermaid Diagram Generator')
+    parser.add_argument('--corpus', nargs='?', const='Stage1_Mermaid_Generation', metavar='DIR',
+                        help='Analyze every requirements document under DIR in parallel (default: Stage1_Mermaid_Generation)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --corpus (default: CPU count)')
+    parser.add_argument('--render-workers', type=int, default=None, help='Maximum concurrent image renders (default: CPU count)')
+    parser.add_argument('--render-memory-mb', type=int, default=None, help='Memory budget for concurrent renders (default: half of available memory)')
+    parser.add_argument('--render-cache', default=DEFAULT_RENDER_CACHE_DIR, help='Directory of the content-addressed render cache')
+    parser.add_argument('--render-cache-mb', type=int, default=DEFAULT_RENDER_CACHE_MB, help='Size cap of the render cache in MB')
+    parser.add_argument('--no-render-cache', action='store_true', help='Always re-render every diagram')
+    parser.add_argument('--analysis-cache', default=DEFAULT_ANALYSIS_CACHE_DIR, help='Directory of the requirements analysis cache')
+    parser.add_argument('--analysis-cache-mb', type=int, default=DEFAULT_ANALYSIS_CACHE_MB, help='Size cap of the analysis cache in MB')
+    parser.add_argument('--analysis-cache-days', type=int, default=DEFAULT_ANALYSIS_CACHE_DAYS, help='Drop cached analyses unused for this many days')
+    parser.add_argument('--no-analysis-cache', action='store_true', help='Always re-analyze the requirements')
+    parser.add_argument('--online-endpoint', default=DEFAULT_ONLINE_ENDPOINT, help='Base URL of the online renderer used as fallback')
+    parser.add_argument('--full', action='store_true', help='Include every distinct extracted action and decision instead of the most frequent few')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K, help='Most frequent distinct items kept per category in the analysis (all with --full)')
+    parser.add_argument('--no-validate', action='store_true', help='Send diagrams to the renderer without the Mermaid syntax check')
+    parser.add_argument('--no-staging', action='store_true', help='Write straight into the diagrams directory instead of staging and publishing once complete')
+    parser.add_argument('--page-budget', type=int, default=DEFAULT_PAGE_BUDGET, help='Nodes and edges per diagram before it is split into linked pages')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Save per-stage timings, per-diagram spans and counters to FILE')
+    parser.add_argument('--profile', metavar='FILE', help='Profile the run with cProfile and save the stats to FILE')
+    parser.add_argument('--memory-profile', metavar='FILE',
+                        help='Trace allocations and save per-stage peak and retained memory and top allocation sites to FILE')
+    
+    args = parser.parse_args()
+    
+    metrics = get_metrics('enhanced-mermaid-generator')
+    if args.metrics_json:
+        write_metrics_at_exit(args.metrics_json, get_artifact_writer())
+    if args.profile:
+        profile_to_file_at_exit(args.profile)
+    if args.memory_profile:
+        profile_memory_to_file_at_exit(args.memory_profile, get_artifact_writer())
     
     print("🎯 Enhanced Mermaid Diagram Generator")
     print("=" * 50)
     
     # Create diagrams directory
-    diagrams_dir = ensure_directory_exists('Stage1_Mermaid_Generation/diagrams')
+    # Build into a private staging directory; published file by file once complete
+    run = StagedRun('Stage1_Mermaid_Generation/diagrams', enabled=not args.no_staging)
+    diagrams_dir = run.open()
     print(f"📁 Diagrams directory: {diagrams_dir}")
     
-    # Find requirements file
-    requirements_file = find_requirements_file()
-    print(f"📋 Using requirements file: {requirements_file}")
-    
-    # Analyze requirements
-    print("\n📋 Analyzing requirements...")
-    requirements = analyze_requirements(requirements_file)
-    
-    # Generate diagrams
-    print("\n🎨 Generating Mermaid diagrams...")
-    diagrams = {
-        'user_journey.mmd': generate_user_journey_diagram(requirements['user_actions']),
-        'system_architecture.mmd': generate_system_architecture_diagram(),
-        'business_process.mmd': generate_business_process_diagram(requirements['decision_points']),
-        'data_flow.mmd': generate_data_flow_diagram(requirements['data_entities']),
-        'decision_tree.mmd': generate_decision_tree_diagram(requirements['decision_points']),
-        'gantt_chart.mmd': generate_gantt_chart()
-    }
-    
-    # Save diagrams with verification
-    print("\n💾 Saving diagrams...")
-    success_count = 0
-    for filename, content in diagrams.items():
-        if save_diagram(diagrams_dir, filename, content):
-            success_count += 1
-    
-    # Save analysis results
-    analysis_file = os.path.join(diagrams_dir, 'analysis_results.json')
     try:
-        with open(analysis_file, 'w', encoding='utf-8') as f:
-            json.dump(requirements, f, indent=2)
-        print(f"✅ Generated: {analysis_file}")
-        success_count += 1
-    except Exception as e:
-        print(f"❌ Error saving analysis: {str(e)}")
-    
-    # Generate images from MMD files
-    print("\n🖼️  Generating images from MMD files...")
-    images_dir = os.path.join(diagrams_dir, 'images')
-    image_success = generate_images_from_mmd_files(diagrams_dir, images_dir)
+        top_k = None if args.full else args.top_k
+        analysis_cache = None if args.no_analysis_cache else AnalysisCache(
+            args.analysis_cache, args.analysis_cache_mb, args.analysis_cache_days
+        )
+        if args.corpus:
+            # Find and analyze every requirements document
+            requirement_files = find_requirements_files(args.corpus)
+            print(f"📋 Using {len(requirement_files)} requirements files from: {args.corpus}")
+            
+            print("\n📋 Analyzing requirements...")
+            with metrics.span('analysis', documents=len(requirement_files)):
+                if requirement_files:
+                    requirements = cached_analysis(
+                        analysis_cache,
+                        lambda: AnalysisCache.key(
+                            [[path, hash_requirements_file(path)] for path in requirement_files],
+                            ENHANCED_RULES, GENERATOR_FINGERPRINT, top_k
+                        ),
+                        lambda: analyze_requirements_corpus(requirement_files, args.workers, top_k)
+                    )
+                else:
+                    print(f"⚠️  Warning: no requirements files found in {args.corpus}. Using default requirements.")
+                    requirements = get_default_requirements()
+        else:
+            # Find requirements file
+            requirements_file = find_requirements_file()
+            print(f"📋 Using requirements file: {requirements_file}")
+            
+            # Analyze requirements
+            print("\n📋 Analyzing requirements...")
+            with metrics.span('analysis'):
+                requirements = cached_analysis(
+                    analysis_cache if os.path.exists(requirements_file) else None,
+                    lambda: AnalysisCache.key(hash_requirements_file(requirements_file), ENHANCED_RULES, GENERATOR_FINGERPRINT, top_k),
+                    lambda: analyze_requirements(requirements_file, top_k)
+                )
+        count_requirement_matches(metrics, requirements)
+        
+        # Generate diagrams
+        print("\n🎨 Generating Mermaid diagrams...")
+        builders = {
+            'user_journey.mmd': lambda: build_user_journey_diagram(requirements['user_actions'], full=args.full),
+            'system_architecture.mmd': generate_system_architecture_diagram,
+            'business_process.mmd': lambda: build_business_process_diagram(requirements['decision_points'], full=args.full),
+            'data_flow.mmd': lambda: generate_data_flow_diagram(requirements['data_entities']),
+            'decision_tree.mmd': lambda: build_decision_tree_diagram(requirements['decision_points'], full=args.full),
+            'gantt_chart.mmd': generate_gantt_chart
+        }
+        diagrams = {}
+        for filename, build in builders.items():
+            with metrics.span('generation', diagram=filename):
+                diagrams.update(paginate_diagram(filename, build(), args.page_budget))
+        remove_stale_pages(diagrams_dir, diagrams)
+        
+        # Save diagrams with verification
+        print("\n💾 Saving diagrams...")
+        success_count = 0
+        for filename, content in diagrams.items():
+            with metrics.span('save', diagram=filename):
+                saved = save_diagram(diagrams_dir, filename, content)
+            if saved:
+                success_count += 1
+        
+        # Save analysis results
+        analysis_file = os.path.join(diagrams_dir, 'analysis_results.json')
+        try:
+            if get_artifact_writer().write_json(analysis_file, requirements):
+                print(f"✅ Generated: {analysis_file}")
+            else:
+                print(f"✅ Unchanged: {analysis_file}")
+            success_count += 1
+        except Exception as e:
+            print(f"❌ Error saving analysis: {str(e)}")
+        writer = get_artifact_writer()
+        writer.sync()
+        
+        # Generate images from MMD files
+        print("\n🖼️  Generating images from MMD files...")
+        images_dir = os.path.join(diagrams_dir, IMAGES_DIRNAME)
+        render_cache = None if args.no_render_cache else RenderCache(args.render_cache, args.render_cache_mb)
+        image_success = generate_images_from_mmd_files(
+            diagrams_dir, images_dir, max_workers=args.render_workers, memory_budget_mb=args.render_memory_mb,
+            render_cache=render_cache, online_endpoint=args.online_endpoint, validate=not args.no_validate
+        )
+        
+        # Publish this run's outputs under the staging lock
+        with metrics.span('publish'):
+            diagrams_dir = run.publish()
+    except BaseException:
+        # A failed run leaves the published outputs as they were
+        run.discard()
+        raise
+    images_dir = os.path.join(diagrams_dir, IMAGES_DIRNAME)
+    record_writer(metrics, writer)
     
     # Summary
     print(f"\n🎉 Mermaid diagrams generation completed!")
     print(f"📊 Successfully generated: {success_count}/{len(diagrams) + 1} MMD files")
+    print(f"💾 Artifacts: {writer.summary()}")
+    print(f"⏱️  Stages: {metrics.summary()}")
     if image_success:
         print(f"🖼️  Successfully generated: Image files in {images_dir}")
     else:
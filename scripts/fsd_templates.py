@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# fsd_templates.py
+# Compiled, cached FSD templates rendered straight into an output stream
+
+import functools
+import os
+import re
+import shutil
+
+from stage1_manifest import hash_file, hash_text
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+COPY_BUFFER_SIZE = 64 * 1024
+
+# {{ name }} substitutes a context value.
+# {% diagram name %} ... {% enddiagram %} embeds a diagram as a marked ```mermaid block, the
+# enclosed lines being its default.
+TOKEN_PATTERN = re.compile(
+    r"\{\{ (?P<variable>\w+) \}\}"
+    r"|^\{% diagram (?P<diagram>\w+) %\}\n(?P<default>.*?)^\{% enddiagram %\}\n",
+    re.MULTILINE | re.DOTALL
+)
+
+TEXT, VARIABLE, DIAGRAM = range(3)
+
+# Precedes every embedded block so an existing FSD can be updated block by block
+DIAGRAM_MARKER = "<!-- fsd-diagram: {name} sha256={digest}{source} -->\n"
+
+# Added to the marker of a block holding the template's default, which has no diagram file
+DEFAULT_SOURCE = " source=default"
+
+class TemplateError(Exception):
+    """Raised for a template that cannot be compiled or rendered"""
+
+class CompiledTemplate:
+    """A template parsed once into a flat list of (op, value, default) steps"""
+
+    __slots__ = ('name', 'ops')
+
+    def __init__(self, name, ops):
+        self.name = name
+        self.ops = ops
+
+    def render(self, out, context, diagrams):
+        """Write the document to out (anything with write())
+
+        diagrams maps a name to its Mermaid text or to the Path of its .mmd file;
+        files are copied into out in bounded chunks rather than read whole.
+        """
+        for op, value, default in self.ops:
+            if op == TEXT:
+                out.write(value)
+            elif op == VARIABLE:
+                if value not in context:
+                    raise TemplateError(f"{self.name}: no value for {{{{ {value} }}}}")
+                out.write(str(context[value]))
+            elif op == DIAGRAM:
+                if value in diagrams:
+                    write_diagram_block(out, value, diagrams[value])
+                else:
+                    write_diagram_block(out, value, default, from_default=True)
+
+def diagram_digest(diagram):
+    """Return the hash recorded in a block's marker: of the text, or of the file's bytes"""
+    return hash_text(diagram) if isinstance(diagram, str) else hash_file(diagram)
+
+def diagram_block_start(name, digest, from_default=False):
+    """Return the marker and opening fence of a diagram's block, marked as a template default if from_default"""
+    source = DEFAULT_SOURCE if from_default else ''
+    return DIAGRAM_MARKER.format(name=name, digest=digest, source=source) + "```mermaid\n"
+
+def write_diagram_block(out, name, diagram, from_default=False):
+    """Write a marked ```mermaid block, streaming the diagram from disk when given a path"""
+    out.write(diagram_block_start(name, diagram_digest(diagram), from_default))
+    if isinstance(diagram, str):
+        out.write(diagram)
+    else:
+        with open(diagram, 'r', encoding='utf-8') as f:
+            shutil.copyfileobj(f, out, COPY_BUFFER_SIZE)
+    out.write("\n```\n")
+
+def compile_template(text, name='<template>'):
+    """Parse template text into a CompiledTemplate"""
+    ops = []
+
+    def add_text(start, end):
+        tag = text.find('{%', start, end)
+        if tag != -1:
+            line = text.count("\n", 0, tag) + 1
+            raise TemplateError(f"{name}:{line}: unknown or unterminated template tag")
+        if end > start:
+            ops.append((TEXT, text[start:end], None))
+
+    position = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        add_text(position, match.start())
+        if match.group('variable'):
+            ops.append((VARIABLE, match.group('variable'), None))
+        else:
+            default = match.group('default')
+            ops.append((DIAGRAM, match.group('diagram'), default[:-1] if default.endswith("\n") else default))
+        position = match.end()
+    add_text(position, len(text))
+    return CompiledTemplate(name, ops)
+
+@functools.lru_cache(maxsize=32)
+def _compile_file(path, mtime_ns, size):
+    with open(path, 'r', encoding='utf-8') as f:
+        return compile_template(f.read(), os.path.basename(path))
+
+def get_template(name_or_path):
+    """Return the compiled template, recompiling only when the file changed
+
+    A bare name is looked up in TEMPLATES_DIR; prefix ./ for a file in the working directory.
+    """
+    path = name_or_path
+    if not os.path.dirname(path):
+        path = os.path.join(TEMPLATES_DIR, path)
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise TemplateError(f"Template not found: {name_or_path} ({e})") from e
+    return _compile_file(path, stat.st_mtime_ns, stat.st_size)
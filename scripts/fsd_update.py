@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# fsd_update.py
+# In-place FSD updates that re-splice only the Mermaid blocks whose diagrams changed
+
+import mmap
+import re
+
+from artifact_writer import get_artifact_writer
+from fsd_templates import diagram_block_start
+from stage1_manifest import hash_file
+
+# A block as written by fsd_templates.write_diagram_block, without its final newline
+BLOCK_PATTERN = re.compile(
+    rb"^<!-- fsd-diagram: (?P<name>[\w.-]+) sha256=(?P<digest>[0-9a-f]{64})(?P<default> source=default)? -->\n"
+    rb"```mermaid\n.*?\n```$",
+    re.MULTILINE | re.DOTALL
+)
+
+def index_diagram_blocks(fsd_path):
+    """Return [(name, digest, start, end, from_default)] for every marked diagram block, with byte offsets"""
+    with open(fsd_path, 'rb') as f:
+        try:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty file
+            return []
+        with content:
+            return [
+                (
+                    match.group('name').decode('ascii'), match.group('digest').decode('ascii'),
+                    match.start(), match.end(), match.group('default') is not None
+                )
+                for match in BLOCK_PATTERN.finditer(content)
+            ]
+
+def render_diagram_block(name, digest, diagram_path):
+    """Return the bytes of a diagram's block, without its final newline"""
+    with open(diagram_path, 'r', encoding='utf-8') as f:
+        diagram = f.read()
+    return f"{diagram_block_start(name, digest)}{diagram}\n```".encode('utf-8')
+
+def plan_block_updates(blocks, diagrams):
+    """Return (edits, report) for the blocks whose diagram no longer matches the recorded hash
+
+    diagrams maps a name to its .mmd Path. Only the files of changed diagrams
+    are read; every other block is left byte-for-byte as it is, manual edits
+    included. A block holding the template's default never had a diagram
+    file, so it stays unchanged until one appears rather than being orphaned.
+    """
+    edits = []
+    report = {'updated': [], 'unchanged': [], 'orphaned': [], 'missing': []}
+    digests = {}
+    for name, recorded, start, end, from_default in blocks:
+        diagram_path = diagrams.get(name)
+        if diagram_path is None:
+            report['unchanged' if from_default else 'orphaned'].append(name)
+            continue
+        if name not in digests:
+            digests[name] = hash_file(diagram_path)
+        if digests[name] == recorded:
+            report['unchanged'].append(name)
+            continue
+        edits.append((start, end, render_diagram_block(name, digests[name], diagram_path)))
+        report['updated'].append(name)
+
+    placed = {name for name, _, _, _, _ in blocks}
+    report['missing'] = sorted(name for name in diagrams if name not in placed)
+    return edits, report
+
+def update_fsd_diagrams(fsd_path, diagrams, writer=None):
+    """Re-splice the changed diagram blocks of an existing FSD; return the report, or None if it has no marked blocks
+
+    The report lists diagrams updated, unchanged, orphaned (block kept, diagram
+    file gone) and missing (diagram file with no block; needs a full rebuild).
+    """
+    blocks = index_diagram_blocks(fsd_path)
+    if not blocks:
+        return None
+
+    edits, report = plan_block_updates(blocks, diagrams)
+    if edits:
+        (writer or get_artifact_writer()).write_spliced(fsd_path, edits)
+    return report
@@ -5,163 +5,228 @@
 import re
 import json
 import os
+import argparse
 from pathlib import Path
 
-def analyze_requirements(file_path):
-    """Analyze raw requirements and extract flow information"""
-    
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Extract user actions
-    user_actions = re.findall(r'user\s+(?:can\s+)?(?:should\s+)?(?:must\s+)?(\w+)', content, re.IGNORECASE)
-    
-    # Extract decision points
-    decision_points = re.findall(r'(?:if|when|whether)\s+([^,\.]+)', content, re.IGNORECASE)
-    
-    # Extract validation rules
-    validation_rules = re.findall(r'(?:validate|check|ensure)\s+([^,\.]+)', content, re.IGNORECASE)
+from analysis_cache import (
+    DEFAULT_ANALYSIS_CACHE_DAYS, DEFAULT_ANALYSIS_CACHE_DIR, DEFAULT_ANALYSIS_CACHE_MB, AnalysisCache, cached_analysis,
+    hash_requirements_file
+)
+from artifact_writer import get_artifact_writer
+from mermaid_diagrams import (
+    Attribute, Edge, Entity, ERDiagram, Flowchart, GanttChart, Message, Node, Participant, Path, SequenceDiagram,
+    Section, Task, node_id
+)
+from mermaid_pagination import paginate_diagram, remove_stale_pages
+from pipeline_metrics import (
+    count_requirement_matches, get_metrics, profile_memory_to_file_at_exit, profile_to_file_at_exit,
+    record_writer, write_metrics_at_exit
+)
+from requirements_analysis import BASIC_RULES, DEFAULT_TOP_K, extract_requirements_streaming
+from stage1_staging import StagedRun
+
+def analyze_requirements(file_path, analysis_cache=None):
+    """Analyze raw requirements and extract flow information, reusing a cached analysis of unchanged requirements"""
+    
+    # Stream the file through the single-pass extractor in bounded chunks
+    return cached_analysis(
+        analysis_cache,
+        lambda: AnalysisCache.key(hash_requirements_file(file_path), BASIC_RULES, DEFAULT_TOP_K),
+        lambda: extract_requirements_streaming(file_path, BASIC_RULES)[0]
+    )
+
+def build_user_journey_diagram(actions):
+    """Build the user journey diagram model"""
     
-    # Extract system interactions
-    system_interactions = re.findall(r'(?:system|application|app)\s+(?:should|must|can)\s+([^,\.]+)', content, re.IGNORECASE)
+    diagram = Flowchart()
     
-    # Extract data entities
-    data_entities = re.findall(r'(?:create|store|save|update|delete)\s+([^,\.]+)', content, re.IGNORECASE)
+    if actions:
+        diagram.add(Path(Node(node_id(i), action.title()) for i, action in enumerate(actions)))
     
-    return {
-        'user_actions': user_actions,
-        'decision_points': decision_points,
-        'validation_rules': validation_rules,
-        'system_interactions': system_interactions,
-        'data_entities': data_entities
-    }
+    return diagram
 
 def generate_user_journey_diagram(actions):
     """Generate user journey Mermaid diagram"""
     
-    diagram = "graph TD\n"
+    return build_user_journey_diagram(actions).to_mermaid(final_newline=False)
+
+def build_decision_flow_diagram(decisions):
+    """Build the decision flow diagram model"""
     
-    for i, action in enumerate(actions):
-        if i == 0:
-            diagram += f"    A[{action.title()}]"
-        else:
-            diagram += f" --> {chr(65+i)}[{action.title()}]"
+    diagram = Flowchart(keyword='flowchart')
+    
+    for i, decision in enumerate(decisions):
+        diagram.add(Edge(Node('A', decision), Node('B', f"Decision {i+1}", 'decision')))
+        diagram.add(Edge('B', Node('C', f"Action {i+1}"), 'Yes'))
+        diagram.add(Edge('B', Node('D', f"Alternative {i+1}"), 'No'))
     
     return diagram
 
 def generate_decision_flow_diagram(decisions):
     """Generate decision flow Mermaid diagram"""
     
-    diagram = "flowchart TD\n"
+    return build_decision_flow_diagram(decisions).to_mermaid()
+
+def build_system_flow_diagram(interactions):
+    """Build the system flow diagram model"""
     
-    for i, decision in enumerate(decisions):
-        diagram += f"    A[{decision}] --> B{{Decision {i+1}}}\n"
-        diagram += f"    B -->|Yes| C[Action {i+1}]\n"
-        diagram += f"    B -->|No| D[Alternative {i+1}]\n"
+    diagram = SequenceDiagram(statements=[
+        Participant('U', 'User'),
+        Participant('F', 'Frontend'),
+        Participant('B', 'Backend'),
+        Participant('D', 'Database')
+    ])
+    
+    for interaction in interactions:
+        diagram.extend([
+            Message('U', 'F', interaction),
+            Message('F', 'B', 'API Request'),
+            Message('B', 'D', 'Data Operation'),
+            Message('D', 'B', 'Response', '-->>'),
+            Message('B', 'F', 'API Response', '-->>'),
+            Message('F', 'U', 'UI Update', '-->>')
+        ])
     
     return diagram
 
 def generate_system_flow_diagram(interactions):
     """Generate system flow Mermaid diagram"""
     
-    diagram = "sequenceDiagram\n"
-    diagram += "    participant U as User\n"
-    diagram += "    participant F as Frontend\n"
-    diagram += "    participant B as Backend\n"
-    diagram += "    participant D as Database\n"
+    return build_system_flow_diagram(interactions).to_mermaid()
+
+def build_data_model_diagram(entities):
+    """Build the data model ER diagram"""
+    
+    diagram = ERDiagram()
     
-    for interaction in interactions:
-        diagram += f"    U->>F: {interaction}\n"
-        diagram += f"    F->>B: API Request\n"
-        diagram += f"    B->>D: Data Operation\n"
-        diagram += f"    D-->>B: Response\n"
-        diagram += f"    B-->>F: API Response\n"
-        diagram += f"    F-->>U: UI Update\n"
+    for entity in entities:
+        entity_name = entity.replace(' ', '_').upper()
+        diagram.add(Entity(entity_name, [
+            Attribute('int', 'id', 'PK'),
+            Attribute('string', 'name'),
+            Attribute('datetime', 'created_at'),
+            Attribute('datetime', 'updated_at')
+        ]))
     
     return diagram
 
 def generate_data_model_diagram(entities):
     """Generate data model Mermaid diagram"""
     
-    diagram = "erDiagram\n"
-    
-    for i, entity in enumerate(entities):
-        entity_name = entity.replace(' ', '_').upper()
-        diagram += f"    {entity_name} {{\n"
-        diagram += f"        int id PK\n"
-        diagram += f"        string name\n"
-        diagram += f"        datetime created_at\n"
-        diagram += f"        datetime updated_at\n"
-        diagram += f"    }}\n"
-    
-    return diagram
+    return build_data_model_diagram(entities).to_mermaid()
 
 def generate_api_flow_diagram():
     """Generate API flow Mermaid diagram"""
     
-    diagram = "graph TD\n"
-    diagram += "    A[Client Request] --> B[API Gateway]\n"
-    diagram += "    B --> C[Authentication]\n"
-    diagram += "    C --> D[Validation]\n"
-    diagram += "    D --> E[Business Logic]\n"
-    diagram += "    E --> F[Database]\n"
-    diagram += "    F --> G[Response]\n"
-    diagram += "    G --> H[Client]\n"
-    
-    return diagram
+    diagram = Flowchart(statements=[
+        Edge(Node('A', 'Client Request'), Node('B', 'API Gateway')),
+        Edge('B', Node('C', 'Authentication')),
+        Edge('C', Node('D', 'Validation')),
+        Edge('D', Node('E', 'Business Logic')),
+        Edge('E', Node('F', 'Database')),
+        Edge('F', Node('G', 'Response')),
+        Edge('G', Node('H', 'Client'))
+    ])
+    
+    return diagram.to_mermaid()
 
 def generate_gantt_chart():
     """Generate Gantt chart for project timeline"""
     
-    diagram = "gantt\n"
-    diagram += "    title Development Timeline\n"
-    diagram += "    dateFormat  YYYY-MM-DD\n"
-    diagram += "    section Phase 1\n"
-    diagram += "    Project Setup    :2024-01-01, 7d\n"
-    diagram += "    Authentication   :2024-01-08, 14d\n"
-    diagram += "    section Phase 2\n"
-    diagram += "    File Upload      :2024-01-22, 21d\n"
-    diagram += "    AI Processing    :2024-02-12, 28d\n"
-    diagram += "    section Phase 3\n"
-    diagram += "    Data Review      :2024-03-11, 14d\n"
-    diagram += "    Submission       :2024-03-25, 7d\n"
-    diagram += "    section Phase 4\n"
-    diagram += "    Testing          :2024-04-01, 14d\n"
-    diagram += "    Deployment       :2024-04-15, 7d\n"
-    
-    return diagram
+    diagram = GanttChart('Development Timeline', statements=[
+        Section('Phase 1'),
+        Task('Project Setup', '2024-01-01, 7d'),
+        Task('Authentication', '2024-01-08, 14d'),
+        Section('Phase 2'),
+        Task('File Upload', '2024-01-22, 21d'),
+        Task('AI Processing', '2024-02-12, 28d'),
+        Section('Phase 3'),
+        Task('Data Review', '2024-03-11, 14d'),
+        Task('Submission', '2024-03-25, 7d'),
+        Section('Phase 4'),
+        Task('Testing', '2024-04-01, 14d'),
+        Task('Deployment', '2024-04-15, 7d')
+    ])
+    
+    return diagram.to_mermaid()
 
 def main():
     """Main function to generate all Mermaid diagrams"""
     
-    # Create diagrams directory
-    os.makedirs('diagrams', exist_ok=True)
-    
-    # Analyze requirements
-    requirements = analyze_requirements('raw_requirements.txt')
-    
-    # Generate diagrams
-    diagrams = {
-        'user_journey.mmd': generate_user_journey_diagram(requirements['user_actions']),
-        'decision_flow.mmd': generate_decision_flow_diagram(requirements['decision_points']),
-        'system_flow.mmd': generate_system_flow_diagram(requirements['system_interactions']),
-        'data_model.mmd': generate_data_model_diagram(requirements['data_entities']),
-        'api_flow.mmd': generate_api_flow_diagram(),
-        'gantt_chart.mmd': generate_gantt_chart()
-    }
-    
-    # Save diagrams
-    for filename, content in diagrams.items():
-        with open(f'diagrams/{filename}', 'w') as f:
-            f.write(content)
-        print(f"✅ Generated: diagrams/{filename}")
-    
-    # Save analysis results
-    with open('diagrams/analysis_results.json', 'w') as f:
-        json.dump(requirements, f, indent=2)
+    parser = argparse.ArgumentParser(description='Mermaid Diagram Generator')
+    parser.add_argument('--analysis-cache', default=DEFAULT_ANALYSIS_CACHE_DIR, help='Directory of the requirements analysis cache')
+    parser.add_argument('--analysis-cache-mb', type=int, default=DEFAULT_ANALYSIS_CACHE_MB, help='Size cap of the analysis cache in MB')
+    parser.add_argument('--analysis-cache-days', type=int, default=DEFAULT_ANALYSIS_CACHE_DAYS, help='Drop cached analyses unused for this many days')
+    parser.add_argument('--no-analysis-cache', action='store_true', help='Always re-analyze the requirements')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Save per-stage timings, per-diagram spans and counters to FILE')
+    parser.add_argument('--profile', metavar='FILE', help='Profile the run with cProfile and save the stats to FILE')
+    parser.add_argument('--memory-profile', metavar='FILE',
+                        help='Trace allocations and save per-stage peak and retained memory and top allocation sites to FILE')
+    
+    args = parser.parse_args()
+    
+    metrics = get_metrics('generate-mermaid-diagrams')
+    if args.metrics_json:
+        write_metrics_at_exit(args.metrics_json, get_artifact_writer())
+    if args.profile:
+        profile_to_file_at_exit(args.profile)
+    if args.memory_profile:
+        profile_memory_to_file_at_exit(args.memory_profile, get_artifact_writer())
+    
+    # Build into a private staging directory; published file by file once complete, discarded on error
+    run = StagedRun('diagrams')
+    diagrams_dir = run.open()
+    
+    try:
+        # Analyze requirements
+        analysis_cache = None if args.no_analysis_cache else AnalysisCache(
+            args.analysis_cache, args.analysis_cache_mb, args.analysis_cache_days
+        )
+        with metrics.span('analysis'):
+            requirements = analyze_requirements('raw_requirements.txt', analysis_cache)
+        count_requirement_matches(metrics, requirements)
+        
+        # Generate diagrams
+        builders = {
+            'user_journey.mmd': lambda: build_user_journey_diagram(requirements['user_actions']),
+            'decision_flow.mmd': lambda: build_decision_flow_diagram(requirements['decision_points']),
+            'system_flow.mmd': lambda: build_system_flow_diagram(requirements['system_interactions']),
+            'data_model.mmd': lambda: build_data_model_diagram(requirements['data_entities']),
+            'api_flow.mmd': generate_api_flow_diagram,
+            'gantt_chart.mmd': generate_gantt_chart
+        }
+        diagrams = {}
+        for filename, build in builders.items():
+            with metrics.span('generation', diagram=filename):
+                diagrams.update(paginate_diagram(filename, build()))
+        remove_stale_pages(diagrams_dir, diagrams)
+        
+        # Save diagrams atomically, leaving unchanged files untouched
+        writer = get_artifact_writer()
+        for filename, content in diagrams.items():
+            with metrics.span('save', diagram=filename):
+                written = writer.write_text(os.path.join(diagrams_dir, filename), content)
+            if written:
+                print(f"✅ Generated: diagrams/{filename}")
+            else:
+                print(f"✅ Unchanged: diagrams/{filename}")
+        
+        # Save analysis results
+        writer.write_json(os.path.join(diagrams_dir, 'analysis_results.json'), requirements)
+        writer.sync()
+        
+        # Publish this run's outputs under the staging lock
+        with metrics.span('publish'):
+            run.publish()
+    except BaseException:
+        # A failed run leaves the published outputs as they were
+        run.discard()
+        raise
+    record_writer(metrics, writer)
     
     print("🎉 Mermaid diagrams generated successfully!")
     print("📁 Diagrams saved to: diagrams/")
+    print(f"⏱️  Stages: {metrics.summary()}")
     print("🔗 Ready for FSD integration!")
 
 if __name__ == "__main__":
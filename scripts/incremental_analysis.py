@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# incremental_analysis.py
+# Line-level incremental requirements analysis that re-scans only the segments edited since the last run
+
+import json
+import os
+import time
+import zlib
+from collections import Counter
+
+from analysis_cache import EXTRACTOR_FINGERPRINT
+from artifact_writer import get_artifact_writer
+from requirements_analysis import CaptureTally, get_scanner
+from stage1_manifest import hash_bytes, hash_value
+
+SEGMENTS_FILENAME = 'analysis_segments.json'
+SEGMENTS_VERSION = 1
+
+# No rule matches across '.' or ',', so a segment may end after any line ending in one.
+# Which of those lines end a segment depends only on the line itself (about one in
+# SEGMENT_CUT_MASK + 1), so an edit moves at most the boundaries next to it.
+SEGMENT_CUT_CHARACTERS = ('.', ',')
+SEGMENT_CUT_MASK = 0x1f
+MAX_SEGMENT_LINES = 256
+
+def iter_segments(lines):
+    """Yield the text of each segment of an iterable of lines (line ends included)"""
+    segment = []
+    for line in lines:
+        segment.append(line)
+        content = line.rstrip()
+        if not content.endswith(SEGMENT_CUT_CHARACTERS):
+            continue
+        if zlib.crc32(content.encode('utf-8')) & SEGMENT_CUT_MASK == 0 or len(segment) >= MAX_SEGMENT_LINES:
+            yield ''.join(segment)
+            segment = []
+    if segment:
+        yield ''.join(segment)
+
+def _tally_items(tally):
+    """Return {category: [[label, count]]} for the non-empty categories of a tally"""
+    return {
+        category: [[label, count] for count, label, _ in entries.values()]
+        for category, entries in tally.entries.items() if entries
+    }
+
+def _items_tally(categories, items):
+    """Return a CaptureTally holding {category: [[label, count]]} items"""
+    tally = CaptureTally(categories)
+    for category, pairs in items.items():
+        for label, count in pairs:
+            tally.add(category, label, count=count)
+    return tally
+
+class SegmentAnalysis:
+    """Per-segment match tallies of the last analyzed requirements, kept next to the outputs
+
+    The requirements are split into segments of whole lines and each distinct
+    segment's tally is stored under its content hash, together with the
+    segment order and the tally of the whole document. update() diffs the
+    new segments against the stored ones, scans only segments not seen before,
+    and patches the document tally by subtracting the tallies of removed
+    segments and adding those of new ones, so the scanning cost follows the
+    size of the edit rather than the document.
+
+    Counts and matches always equal a full scan. A patched tally keeps its
+    earlier items first, so among items with equal counts new ones rank after
+    known ones, and an item keeps its first stored spelling.
+    """
+
+    def __init__(self, directory, rules, filename=SEGMENTS_FILENAME, fresh=False):
+        self.path = os.path.join(directory, filename)
+        self.scanner = get_scanner(rules)
+        self.version = hash_value([SEGMENTS_VERSION, EXTRACTOR_FINGERPRINT, rules])
+        self.segments = []
+        self.table = {}
+        self.tally = None
+        self.rescanned = 0
+        self.reused = 0
+        self.stats = {}
+        if not fresh:
+            self.load()
+
+    def load(self):
+        """Load the stored tallies, starting empty if they are missing, unreadable or from other rules"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.version:
+                return
+            self.segments = data['segments']
+            self.table = data['table']
+            self.tally = _items_tally(self.scanner.categories, data['tally'])
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.segments = []
+            self.table = {}
+            self.tally = None
+
+    def save(self):
+        """Write the segment tallies for the next run"""
+        data = {
+            'version': self.version,
+            'segments': self.segments,
+            'table': self.table,
+            'tally': _tally_items(self.tally)
+        }
+        get_artifact_writer().write_json(self.path, data, indent=None)
+
+    def update(self, lines):
+        """Bring the document tally up to date with the requirements in lines; return it
+
+        stats records the bytes read and re-scanned, the segments and the time taken.
+        """
+        started = time.perf_counter()
+        size = 0
+        scanned = 0
+        segments = []
+        table = {}
+        for segment in iter_segments(lines):
+            data = segment.encode('utf-8')
+            size += len(data)
+            digest = hash_bytes(data)
+            segments.append(digest)
+            if digest in table:
+                continue
+            items = self.table.get(digest)
+            if items is None:
+                items = _tally_items(self.scanner.tally(segment))
+                scanned += len(data)
+                self.rescanned += 1
+            else:
+                self.reused += 1
+            table[digest] = items
+
+        if self.tally is None:
+            self.tally = CaptureTally(self.scanner.categories)
+            added = Counter(segments)
+        else:
+            previous = Counter(self.segments)
+            current = Counter(segments)
+            for digest, times in (previous - current).items():
+                removed = _items_tally(self.scanner.categories, self.table[digest])
+                for _ in range(times):
+                    self.tally.subtract(removed)
+            added = current - previous
+
+        # Segments are added in document order, so new items appear in the order a full scan finds them
+        for digest in segments:
+            times = added.pop(digest, 0)
+            if times:
+                segment_tally = _items_tally(self.scanner.categories, table[digest])
+                for _ in range(times):
+                    self.tally.update(segment_tally)
+
+        self.segments = segments
+        self.table = table
+        elapsed = time.perf_counter() - started
+        self.stats = {
+            'bytes': size,
+            'bytes_scanned': scanned,
+            'segments': len(segments),
+            'seconds': elapsed,
+            'bytes_per_second': size / elapsed if elapsed > 0 else 0.0
+        }
+        return self.tally
+
+def format_segment_throughput(stats, rescanned):
+    """Return a human readable throughput line for SegmentAnalysis stats"""
+    return (
+        f"{stats['bytes'] / (1024 * 1024):.1f} MB in {stats['seconds']:.2f}s "
+        f"({stats['bytes_per_second'] / (1024 * 1024):.1f} MB/s), "
+        f"{rescanned} of {stats['segments']} segments re-scanned ({stats['bytes_scanned'] / (1024 * 1024):.1f} MB)"
+    )
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# mermaid-ink-stub-server.py
+# Local stand-in for the mermaid.ink renderer, for tests, benchmarks and offline runs
+
+import argparse
+import base64
+import binascii
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def make_png(width=1, height=1):
+    """Return a minimal valid white PNG image"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    raw = b''.join(b'\x00' + b'\xff\xff\xff' * width for _ in range(height))
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', zlib.compress(raw))
+        + chunk(b'IEND', b'')
+    )
+
+STUB_PNG = make_png()
+
+def decode_diagram(payload):
+    """Decode a plain base64 or "pako:" payload from the URL path; raise ValueError if invalid"""
+    try:
+        if payload.startswith('pako:'):
+            data = payload[len('pako:'):]
+            state = zlib.decompress(base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+            return json.loads(state.decode('utf-8'))['code']
+        return base64.b64decode(payload, validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError, zlib.error, KeyError, TypeError) as e:
+        raise ValueError(str(e))
+
+class StubRendererHandler(BaseHTTPRequestHandler):
+    """Answer mermaid.ink style /img/<payload> and /svg/<payload> requests"""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    fail_rate = 0.0
+    max_url_length = 0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            return self._respond(503, b'temporarily unavailable', 'text/plain')
+
+        if self.max_url_length and len(self.path) > self.max_url_length:
+            return self._respond(414, b'uri too long', 'text/plain')
+
+        _, _, rest = self.path.partition('/')
+        endpoint, _, payload = rest.partition('/')
+        if endpoint not in ('img', 'svg') or not payload:
+            return self._respond(404, b'not found', 'text/plain')
+        try:
+            source = decode_diagram(payload.split('?')[0])
+        except ValueError as e:
+            return self._respond(400, f"invalid payload: {e}".encode('utf-8'), 'text/plain')
+
+        if endpoint == 'svg':
+            lines = len(source.splitlines())
+            body = f'<svg xmlns="http://www.w3.org/2000/svg" data-lines="{lines}"/>'.encode('utf-8')
+            return self._respond(200, body, 'image/svg+xml')
+        return self._respond(200, STUB_PNG, 'image/png')
+
+    def _respond(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server(host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, max_url_length=0):
+    """Start the stub server in a background thread; return (server, base_url)"""
+    handler = type('ConfiguredStubHandler', (StubRendererHandler,), {
+        'latency': latency, 'fail_rate': fail_rate, 'max_url_length': max_url_length
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    """Run the stub renderer until interrupted"""
+    parser = argparse.ArgumentParser(description='Local stand-in for the mermaid.ink renderer')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of requests answered with HTTP 503')
+    parser.add_argument('--max-url-length', type=int, default=0, help='Answer longer request paths with HTTP 414 (0: no limit)')
+
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.host, args.port, args.latency, args.fail_rate, args.max_url_length)
+    print(f"🧪 Stub Mermaid renderer listening on {base_url}")
+    print(f"💡 Use it with: MERMAID_INK_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env node
+// mermaid-render-worker.mjs
+// Long-lived Mermaid renderer: one Node process and one headless browser for a whole run.
+//
+// Protocol (JSON lines):
+//   stdout on startup: {"ready": true} or {"ready": false, "error": "..."}
+//   stdin request:     {"id": 1, "definition": "graph TD...", "format": "png",
+//                       "theme": "neutral", "backgroundColor": "white"}
+//   stdout response:   {"id": 1, "ok": true, "data": "<base64>"} or {"id": 1, "ok": false, "error": "..."}
+//
+// Up to MERMAID_WORKER_CONCURRENCY requests (default 1) render at once, each in its
+// own page of the shared browser; responses may then arrive out of order.
+
+import readline from 'node:readline';
+
+const send = (message) => process.stdout.write(JSON.stringify(message) + '\n');
+
+let renderMermaid;
+let browser;
+
+try {
+  ({ renderMermaid } = await import('@mermaid-js/mermaid-cli'));
+  const { default: puppeteer } = await import('puppeteer');
+  browser = await puppeteer.launch({ headless: 'shell' });
+} catch (error) {
+  send({ ready: false, error: String(error && error.message ? error.message : error) });
+  process.exit(1);
+}
+
+send({ ready: true });
+
+const concurrency = Math.max(1, parseInt(process.env.MERMAID_WORKER_CONCURRENCY || '1', 10) || 1);
+const pending = [];
+let active = 0;
+let closing = false;
+
+const handle = async (line) => {
+  let request;
+  try {
+    request = JSON.parse(line);
+  } catch (error) {
+    send({ id: null, ok: false, error: `Invalid request: ${error.message}` });
+    return;
+  }
+
+  try {
+    const { data } = await renderMermaid(browser, request.definition, request.format || 'png', {
+      viewport: { width: 800, height: 600, deviceScaleFactor: 1 },
+      backgroundColor: request.backgroundColor || 'white',
+      mermaidConfig: { theme: request.theme || 'neutral' },
+    });
+    send({ id: request.id, ok: true, data: Buffer.from(data).toString('base64') });
+  } catch (error) {
+    send({ id: request.id, ok: false, error: String(error && error.message ? error.message : error) });
+  }
+};
+
+const shutdown = async () => {
+  await browser.close();
+  process.exit(0);
+};
+
+const pump = () => {
+  while (active < concurrency && pending.length) {
+    active += 1;
+    handle(pending.shift()).finally(() => {
+      active -= 1;
+      pump();
+    });
+  }
+  if (closing && !active && !pending.length) {
+    shutdown();
+  }
+};
+
+const input = readline.createInterface({ input: process.stdin, crlfDelay: Infinity });
+
+input.on('line', (line) => {
+  if (line.trim()) {
+    pending.push(line);
+    pump();
+  }
+});
+
+input.on('close', () => {
+  closing = true;
+  pump();
+});
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# mermaid_diagrams.py
+# In-memory Mermaid diagram model: compact statement records and a single-generator, single-join serializer
+
+import copy
+import re
+import string
+from itertools import chain
+
+INDENT = '    '
+
+# Node IDs use upper-case letters only: never a Mermaid keyword, never read as an arrow head
+ID_ALPHABET = string.ascii_uppercase
+
+# Flowchart node shapes: (opening, closing) delimiters around the label
+NODE_SHAPES = {
+    'box': ('[', ']'),
+    'round': ('(', ')'),
+    'stadium': ('([', '])'),
+    'subroutine': ('[[', ']]'),
+    'circle': ('((', '))'),
+    'decision': ('{', '}'),
+    'hexagon': ('{{', '}}')
+}
+
+def node_id(index):
+    """Return the node ID for a 0-based index: A..Z, then AA..ZZ, AAA.. (bijective base 26)"""
+    letters = []
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, len(ID_ALPHABET))
+        letters.append(ID_ALPHABET[remainder])
+    return ''.join(reversed(letters))
+
+class NodeIdAllocator:
+    """Hands out compact, unique node IDs in order, skipping IDs taken by fixed nodes"""
+
+    __slots__ = ('index', 'reserved')
+
+    def __init__(self, reserved=()):
+        self.index = 0
+        self.reserved = set(reserved)
+
+    def allocate(self):
+        """Return the next free node ID"""
+        while True:
+            candidate = node_id(self.index)
+            self.index += 1
+            if candidate not in self.reserved:
+                return candidate
+
+class Node:
+    """Flowchart node; written inline wherever the record itself (not its id) is used"""
+
+    __slots__ = ('id', 'label', 'shape')
+
+    def __init__(self, id, label=None, shape='box'):
+        self.id = id
+        self.label = label
+        self.shape = shape
+
+    def definition(self):
+        """Return the node ID with its shape and label"""
+        if self.label is None:
+            return self.id
+        opening, closing = NODE_SHAPES[self.shape]
+        return f"{self.id}{opening}{self.label}{closing}"
+
+class Edge:
+    """Flowchart link between two nodes (Node records or node IDs)"""
+
+    __slots__ = ('source', 'target', 'label', 'arrow')
+
+    def __init__(self, source, target, label=None, arrow='-->'):
+        self.source = source
+        self.target = target
+        self.label = label
+        self.arrow = arrow
+
+class Chain:
+    """Run of labelled nodes each linked from the one before, one line per node:
+
+        A[First]
+        A --> B[Second]
+        B --> C[Third]
+
+    Nodes are kept as an ID list and a label list rather than a record per
+    node, so long journeys cost two lists to build and one join to write.
+    """
+
+    __slots__ = ('ids', 'labels', 'shape', 'arrow')
+
+    def __init__(self, ids, labels, shape='box', arrow='-->'):
+        self.ids = list(ids)
+        self.labels = list(labels)
+        self.shape = shape
+        self.arrow = arrow
+
+    def nodes(self):
+        """Return the chain's nodes as Node records"""
+        return [Node(id, label, self.shape) for id, label in zip(self.ids, self.labels)]
+
+    def statements(self):
+        """Return the chain as the equivalent Node and Edge records"""
+        nodes = self.nodes()
+        return nodes[:1] + [Edge(source.id, target, arrow=self.arrow) for source, target in zip(nodes, nodes[1:])]
+
+class Path:
+    """Chain of nodes linked on one line: A --> B --> C"""
+
+    __slots__ = ('nodes', 'arrow')
+
+    def __init__(self, nodes, arrow='-->'):
+        self.nodes = list(nodes)
+        self.arrow = arrow
+
+class Subgraph:
+    """Group of flowchart statements"""
+
+    __slots__ = ('id', 'label', 'statements')
+
+    def __init__(self, id, label=None, statements=None):
+        self.id = id
+        self.label = label
+        self.statements = statements if statements is not None else []
+
+    def add(self, statement):
+        """Append a statement and return it"""
+        self.statements.append(statement)
+        return statement
+
+class Click:
+    """Flowchart click directive linking a node to a URL"""
+
+    __slots__ = ('id', 'url', 'tooltip')
+
+    def __init__(self, id, url, tooltip=None):
+        self.id = id
+        self.url = url
+        self.tooltip = tooltip
+
+class Participant:
+    """Sequence diagram participant"""
+
+    __slots__ = ('id', 'label')
+
+    def __init__(self, id, label=None):
+        self.id = id
+        self.label = label
+
+class Message:
+    """Sequence diagram message"""
+
+    __slots__ = ('source', 'target', 'text', 'arrow')
+
+    def __init__(self, source, target, text, arrow='->>'):
+        self.source = source
+        self.target = target
+        self.text = text
+        self.arrow = arrow
+
+class Attribute:
+    """ER entity attribute"""
+
+    __slots__ = ('type', 'name', 'key')
+
+    def __init__(self, type, name, key=None):
+        self.type = type
+        self.name = name
+        self.key = key
+
+class Entity:
+    """ER diagram entity with its attributes"""
+
+    __slots__ = ('name', 'attributes')
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes if attributes is not None else []
+
+class Relationship:
+    """ER diagram relationship, e.g. USER ||--o{ SESSION : opens"""
+
+    __slots__ = ('source', 'target', 'cardinality', 'label')
+
+    def __init__(self, source, target, cardinality='||--o{', label='has'):
+        self.source = source
+        self.target = target
+        self.cardinality = cardinality
+        self.label = label
+
+class Section:
+    """Gantt chart section header"""
+
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+class Task:
+    """Gantt chart task; spec is the text after the colon (id, start, duration)"""
+
+    __slots__ = ('name', 'spec', 'width')
+
+    def __init__(self, name, spec, width=17):
+        self.name = name
+        self.spec = spec
+        self.width = width
+
+def statement_lines(statements, indent=INDENT):
+    """Yield the Mermaid lines of every statement (a Chain's as one block), without a final line end
+
+    Records are dispatched on their exact type inside this one generator and
+    each line is formatted once, so serializing costs no method call or
+    intermediate string per statement.
+    """
+    shapes = NODE_SHAPES
+    for statement in statements:
+        kind = type(statement)
+        if kind is Edge:
+            source = statement.source
+            if type(source) is Node and source.label is not None:
+                opening, closing = shapes[source.shape]
+                source = f"{source.id}{opening}{source.label}{closing}"
+            elif type(source) is Node:
+                source = source.id
+            target = statement.target
+            if type(target) is Node and target.label is not None:
+                opening, closing = shapes[target.shape]
+                target = f"{target.id}{opening}{target.label}{closing}"
+            elif type(target) is Node:
+                target = target.id
+            if statement.label is None:
+                yield f"{indent}{source} {statement.arrow} {target}"
+            else:
+                yield f"{indent}{source} {statement.arrow}|{statement.label}| {target}"
+        elif kind is Node:
+            if statement.label is None:
+                yield f"{indent}{statement.id}"
+            else:
+                opening, closing = shapes[statement.shape]
+                yield f"{indent}{statement.id}{opening}{statement.label}{closing}"
+        elif kind is Chain:
+            ids = statement.ids
+            labels = statement.labels
+            if not ids:
+                continue
+            opening, closing = shapes[statement.shape]
+            # Interleave the columns by slice assignment and join them once, so a long
+            # journey costs no string per line: A[First], closing + newline, A, -->, B, [, Second ...
+            links = len(ids) - 1
+            pieces = [f"{closing}\n{indent}"] * (6 * links + 2)
+            pieces[0] = f"{indent}{ids[0]}{opening}{labels[0]}"
+            pieces[2::6] = ids[:-1]
+            pieces[3::6] = [f" {statement.arrow} "] * links
+            pieces[4::6] = ids[1:]
+            pieces[5::6] = [opening] * links
+            pieces[6::6] = labels[1:]
+            pieces[-1] = closing
+            yield ''.join(pieces)
+        elif kind is Path:
+            yield indent + f" {statement.arrow} ".join(
+                node.definition() if type(node) is Node else node for node in statement.nodes
+            )
+        elif kind is Subgraph:
+            if statement.label is None:
+                yield f"{indent}subgraph {statement.id}"
+            else:
+                yield f"{indent}subgraph {statement.id} [{statement.label}]"
+            yield from statement_lines(statement.statements, indent + INDENT)
+            yield f"{indent}end"
+        elif kind is Click:
+            if statement.tooltip is None:
+                yield f'{indent}click {statement.id} "{statement.url}"'
+            else:
+                yield f'{indent}click {statement.id} "{statement.url}" "{statement.tooltip}"'
+        elif kind is Participant:
+            if statement.label is None:
+                yield f"{indent}participant {statement.id}"
+            else:
+                yield f"{indent}participant {statement.id} as {statement.label}"
+        elif kind is Message:
+            yield f"{indent}{statement.source}{statement.arrow}{statement.target}: {statement.text}"
+        elif kind is Attribute:
+            if statement.key is None:
+                yield f"{indent}{statement.type} {statement.name}"
+            else:
+                yield f"{indent}{statement.type} {statement.name} {statement.key}"
+        elif kind is Entity:
+            yield f"{indent}{statement.name} {{"
+            yield from statement_lines(statement.attributes, indent + INDENT)
+            yield f"{indent}}}"
+        elif kind is Relationship:
+            yield f"{indent}{statement.source} {statement.cardinality} {statement.target} : {statement.label}"
+        elif kind is Section:
+            yield f"{indent}section {statement.name}"
+        elif kind is Task:
+            yield f"{indent}{statement.name:<{statement.width}}:{statement.spec}"
+        else:
+            raise TypeError(f"Unsupported diagram statement: {statement!r}")
+
+class Diagram:
+    """Ordered list of statement records under a diagram header"""
+
+    __slots__ = ('statements',)
+
+    def __init__(self, statements=None):
+        self.statements = statements if statements is not None else []
+
+    def add(self, statement):
+        """Append a statement and return it"""
+        self.statements.append(statement)
+        return statement
+
+    def extend(self, statements):
+        """Append several statements"""
+        self.statements.extend(statements)
+
+    def header(self):
+        """Return the diagram declaration lines"""
+        raise NotImplementedError
+
+    def page(self, statements):
+        """Return a diagram of the same kind and header holding only statements"""
+        page = copy.copy(self)
+        page.statements = statements
+        return page
+
+    def to_mermaid(self, final_newline=True):
+        """Serialize the diagram: one generator yields every line and a single join consumes it"""
+        ending = ('',) if final_newline or not self.statements else ()
+        return '\n'.join(chain(self.header(), statement_lines(self.statements), ending))
+
+    def __str__(self):
+        return self.to_mermaid()
+
+class Flowchart(Diagram):
+    """Flowchart ('graph' or 'flowchart') diagram"""
+
+    __slots__ = ('direction', 'keyword')
+
+    def __init__(self, direction='TD', keyword='graph', statements=None):
+        super().__init__(statements)
+        self.direction = direction
+        self.keyword = keyword
+
+    def header(self):
+        return (f"{self.keyword} {self.direction}",)
+
+class SequenceDiagram(Diagram):
+    """Sequence diagram"""
+
+    __slots__ = ()
+
+    def header(self):
+        return ("sequenceDiagram",)
+
+class ERDiagram(Diagram):
+    """Entity relationship diagram"""
+
+    __slots__ = ()
+
+    def header(self):
+        return ("erDiagram",)
+
+class GanttChart(Diagram):
+    """Gantt chart"""
+
+    __slots__ = ('title', 'date_format')
+
+    def __init__(self, title, date_format='YYYY-MM-DD', statements=None):
+        super().__init__(statements)
+        self.title = title
+        self.date_format = date_format
+
+    def header(self):
+        return ("gantt", f"{INDENT}title {self.title}", f"{INDENT}dateFormat  {self.date_format}")
+
+# Flowchart syntax as statement_lines writes it, for reading saved diagrams back
+FLOWCHART_HEADER_PATTERN = re.compile(r"(graph|flowchart) (\w+)")
+LINK_PATTERN = re.compile(r" (-->|---|-\.->|==>|--o|--x)(?:\|([^|]*)\|)? ")
+NODE_REFERENCE_PATTERN = re.compile(r"(\w+)(.*)")
+SUBGRAPH_PATTERN = re.compile(r"subgraph (\S+)(?: \[(.*)\])?")
+CLICK_PATTERN = re.compile(r'click (\S+) "([^"]*)"(?: "([^"]*)")?')
+
+def _parse_node_reference(text):
+    """Return the node ID in text, or a Node record if it carries a shaped label; None if it is neither"""
+    match = NODE_REFERENCE_PATTERN.fullmatch(text)
+    if match is None:
+        return None
+    id, rest = match.groups()
+    if not rest:
+        return id
+    # Longest openings first, so '([' is not read as '('
+    for shape, (opening, closing) in sorted(NODE_SHAPES.items(), key=lambda item: -len(item[1][0])):
+        if rest.startswith(opening) and rest.endswith(closing) and len(rest) >= len(opening) + len(closing):
+            return Node(id, rest[len(opening):len(rest) - len(closing)], shape)
+    return None
+
+def _parse_flowchart_statement(content):
+    """Return the Node, Edge or Path record of one flowchart line; None if it is none of them"""
+    parts = LINK_PATTERN.split(content)
+    ends = [_parse_node_reference(part) for part in parts[0::3]]
+    arrows = parts[1::3]
+    labels = parts[2::3]
+    if None in ends:
+        return None
+    if len(ends) == 1:
+        return ends[0] if type(ends[0]) is Node else Node(ends[0])
+    if len(ends) == 2:
+        return Edge(ends[0], ends[1], labels[0], arrows[0])
+    if any(label is not None for label in labels) or len(set(arrows)) > 1:
+        return None
+    return Path(ends, arrows[0])
+
+def parse_flowchart(text):
+    """Return the Flowchart that text is the serialization of, or None for any other text
+
+    Reads back what this module writes for flowcharts (nodes, links, paths,
+    subgraphs and clicks), so a saved .mmd can be split into pages. Text that
+    does not serialize back byte for byte gives None.
+    """
+    lines = text.split('\n')
+    header = FLOWCHART_HEADER_PATTERN.fullmatch(lines[0])
+    if header is None:
+        return None
+    diagram = Flowchart(header.group(2), header.group(1))
+    open_statements = [diagram.statements]
+    for line in lines[1:]:
+        content = line.lstrip(' ')
+        if not content:
+            continue
+        if content == 'end' and len(open_statements) > 1:
+            open_statements.pop()
+            continue
+        match = SUBGRAPH_PATTERN.fullmatch(content)
+        if match:
+            subgraph = Subgraph(match.group(1), match.group(2))
+            open_statements[-1].append(subgraph)
+            open_statements.append(subgraph.statements)
+            continue
+        match = CLICK_PATTERN.fullmatch(content)
+        if match:
+            open_statements[-1].append(Click(*match.groups()))
+            continue
+        statement = _parse_flowchart_statement(content)
+        if statement is None:
+            return None
+        open_statements[-1].append(statement)
+    if len(open_statements) > 1 or diagram.to_mermaid() != text:
+        return None
+    return diagram
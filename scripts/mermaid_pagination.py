@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# mermaid_pagination.py
+# Splits diagrams above a node/edge budget into linked pages plus an index diagram
+
+import glob
+import os
+
+from mermaid_diagrams import (
+    Chain, Click, Edge, Entity, ERDiagram, Flowchart, Node, Participant, Path, Relationship, SequenceDiagram,
+    Subgraph, node_id
+)
+
+# Nodes + edges per page; headless layout time and memory grow quickly past a few hundred
+DEFAULT_PAGE_BUDGET = 400
+
+# Subdirectory of the diagrams directory the renderers write images into
+IMAGES_DIRNAME = 'images'
+
+def statement_size(statement):
+    """Return the number of nodes and edges a statement contributes"""
+    if isinstance(statement, Subgraph):
+        return sum(statement_size(inner) for inner in statement.statements)
+    if isinstance(statement, Path):
+        return max(0, 2 * len(statement.nodes) - 1)
+    if isinstance(statement, Chain):
+        return max(0, 2 * len(statement.ids) - 1)
+    if isinstance(statement, Edge):
+        return 1 + isinstance(statement.source, Node) + isinstance(statement.target, Node)
+    if isinstance(statement, Click):
+        return 0
+    return 1
+
+def diagram_size(diagram):
+    """Return the number of nodes and edges in a diagram"""
+    return sum(statement_size(statement) for statement in diagram.statements)
+
+def node_ids(statement):
+    """Yield the IDs of the nodes or entities a statement mentions"""
+    if isinstance(statement, Subgraph):
+        for inner in statement.statements:
+            yield from node_ids(inner)
+    elif isinstance(statement, Path):
+        for node in statement.nodes:
+            yield node.id if isinstance(node, Node) else node
+    elif isinstance(statement, Chain):
+        yield from statement.ids
+    elif isinstance(statement, Edge):
+        for end in (statement.source, statement.target):
+            yield end.id if isinstance(end, Node) else end
+    elif isinstance(statement, (Node, Click)):
+        yield statement.id
+    elif isinstance(statement, Entity):
+        yield statement.name
+    elif isinstance(statement, Relationship):
+        yield statement.source
+        yield statement.target
+
+def labelled_nodes(statement):
+    """Yield the labelled Node records a statement defines"""
+    if isinstance(statement, Subgraph):
+        for inner in statement.statements:
+            yield from labelled_nodes(inner)
+        return
+    if isinstance(statement, Path):
+        ends = statement.nodes
+    elif isinstance(statement, Chain):
+        ends = statement.nodes()
+    elif isinstance(statement, Edge):
+        ends = (statement.source, statement.target)
+    else:
+        ends = (statement,)
+    for end in ends:
+        if isinstance(end, Node) and end.label is not None:
+            yield end
+
+def chunk_statements(statements, budget):
+    """Pack statements in order into lists of at most budget nodes and edges"""
+    chunks = []
+    current = []
+    size = 0
+    for statement in statements:
+        statement_budget = statement_size(statement)
+        if current and size + statement_budget > budget:
+            chunks.append(current)
+            current = []
+            size = 0
+        current.append(statement)
+        size += statement_budget
+    if current:
+        chunks.append(current)
+    return chunks
+
+def split_statement(statement, budget):
+    """Split a statement larger than the budget into pieces that fit"""
+    if isinstance(statement, Path) and len(statement.nodes) > 2:
+        # Consecutive pieces share their boundary node so the chain stays readable across pages
+        length = max(2, (budget + 1) // 2)
+        nodes = statement.nodes
+        return [Path(nodes[start:start + length], statement.arrow) for start in range(0, len(nodes) - 1, length - 1)]
+    if isinstance(statement, Subgraph):
+        inner = [piece for child in statement.statements for piece in fit_statement(child, budget)]
+        return [Subgraph(statement.id, statement.label, chunk) for chunk in chunk_statements(inner, budget)]
+    return [statement]
+
+def fit_statement(statement, budget):
+    """Return statement, split into pieces if it alone exceeds the budget"""
+    if isinstance(statement, Chain):
+        # Pages may break a chain between any two nodes, as if it were written node by node
+        return statement.statements()
+    if statement_size(statement) > budget:
+        return split_statement(statement, budget)
+    return [statement]
+
+def group_connected(statements):
+    """Group statements by connected component of the nodes they mention, in order of first appearance"""
+    parent = {}
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    mentions = []
+    for statement in statements:
+        ids = list(node_ids(statement))
+        for item in ids:
+            parent.setdefault(item, item)
+        for item in ids[1:]:
+            parent[find(item)] = find(ids[0])
+        mentions.append(ids)
+
+    groups = {}
+    for index, (statement, ids) in enumerate(zip(statements, mentions)):
+        key = find(ids[0]) if ids else ('statement', index)
+        groups.setdefault(key, []).append(statement)
+    return list(groups.values())
+
+def pack_groups(groups, budget):
+    """Pack whole groups into pages; a group larger than the budget is split across its own pages"""
+    pages = []
+    current = []
+    size = 0
+    for group in groups:
+        group_size = sum(statement_size(statement) for statement in group)
+        if group_size > budget:
+            if current:
+                pages.append(current)
+                current = []
+                size = 0
+            pages.extend(chunk_statements(group, budget))
+            continue
+        if current and size + group_size > budget:
+            pages.append(current)
+            current = []
+            size = 0
+        current.extend(group)
+        size += group_size
+    if current:
+        pages.append(current)
+    return pages
+
+def define_missing_nodes(page, definitions):
+    """Prepend definitions of nodes the page links to but whose label lives on another page"""
+    defined = {node.id for statement in page for node in labelled_nodes(statement)}
+    missing = []
+    for statement in page:
+        for item in node_ids(statement):
+            if item not in defined and item in definitions:
+                defined.add(item)
+                missing.append(definitions[item])
+    return missing + page
+
+def partition_diagram(diagram, budget=DEFAULT_PAGE_BUDGET):
+    """Split a diagram above budget into pages of the same kind; return [diagram] if it fits or cannot be split
+
+    Flowcharts and ER diagrams are split by connected component (subgraphs and long
+    paths are split further if needed), sequence diagrams into consecutive message
+    segments that each repeat the participants.
+    """
+    if diagram_size(diagram) <= budget:
+        return [diagram]
+
+    if isinstance(diagram, SequenceDiagram):
+        participants = [statement for statement in diagram.statements if isinstance(statement, Participant)]
+        messages = [statement for statement in diagram.statements if not isinstance(statement, Participant)]
+        segments = chunk_statements(messages, max(1, budget - len(participants)))
+        return [diagram.page(participants + segment) for segment in segments]
+
+    if isinstance(diagram, (Flowchart, ERDiagram)):
+        statements = [piece for statement in diagram.statements for piece in fit_statement(statement, budget)]
+        pages = pack_groups(group_connected(statements), budget)
+        if isinstance(diagram, Flowchart):
+            definitions = {}
+            for statement in statements:
+                for node in labelled_nodes(statement):
+                    definitions.setdefault(node.id, Node(node.id, node.label, node.shape))
+            pages = [define_missing_nodes(page, definitions) for page in pages]
+        return [diagram.page(page) for page in pages]
+
+    return [diagram]
+
+def build_page_index(title, page_files, pages, image_format='png'):
+    """Build a flowchart with one node per page, in reading order, each linking to the page image
+
+    Links point at images/<page>.<image_format> relative to the diagrams
+    directory holding the .mmd files, where the renderers put the images.
+    Mermaid keeps click links only in SVG output; a PNG index is just a picture.
+    """
+    index = Flowchart()
+    index.add(Chain(
+        (node_id(number) for number in range(len(pages))),
+        (f"{title} - page {number + 1} of {len(pages)}, {diagram_size(page)} items" for number, page in enumerate(pages))
+    ))
+    for number, page_file in enumerate(page_files):
+        image = f"{IMAGES_DIRNAME}/{os.path.splitext(page_file)[0]}.{image_format}"
+        index.add(Click(node_id(number), image, f"Open page {number + 1}"))
+    return index
+
+def page_filenames(filename, count):
+    """Return the .mmd filenames of count pages of filename"""
+    stem = os.path.splitext(filename)[0]
+    width = max(2, len(str(count)))
+    return [f"{stem}.page{number:0{width}d}.mmd" for number in range(1, count + 1)]
+
+def existing_pages(directory, filename):
+    """Return the page files of filename currently present in directory"""
+    stem = os.path.splitext(filename)[0]
+    pattern = os.path.join(glob.escape(directory), f"{glob.escape(stem)}.page*.mmd")
+    return sorted(os.path.basename(path) for path in glob.glob(pattern))
+
+def remove_stale_pages(directory, files):
+    """Delete page files left by an earlier, larger split that are not in files; return their names"""
+    stale = []
+    for filename in files:
+        for page_file in existing_pages(directory, filename):
+            if page_file not in files:
+                os.remove(os.path.join(directory, page_file))
+                stale.append(page_file)
+    return stale
+
+def paginate_diagram(filename, diagram, budget=DEFAULT_PAGE_BUDGET, image_format='png'):
+    """Return {filename: text} for one diagram (or ready-made text)
+
+    A diagram above budget becomes numbered page files plus an index diagram
+    written under the original filename.
+    """
+    if isinstance(diagram, str):
+        return {filename: diagram}
+
+    pages = partition_diagram(diagram, budget)
+    if len(pages) == 1:
+        return {filename: pages[0].to_mermaid()}
+
+    page_files = page_filenames(filename, len(pages))
+    title = os.path.splitext(filename)[0].replace('_', ' ').title()
+    files = {filename: build_page_index(title, page_files, pages, image_format).to_mermaid()}
+    for page_file, page in zip(page_files, pages):
+        files[page_file] = page.to_mermaid()
+    return files
+
+def paginate_diagrams(diagrams, budget=DEFAULT_PAGE_BUDGET, image_format='png'):
+    """Return {filename: text} for {filename: diagram or text}, splitting oversized diagrams into pages"""
+    files = {}
+    for filename, diagram in diagrams.items():
+        files.update(paginate_diagram(filename, diagram, budget, image_format))
+    return files
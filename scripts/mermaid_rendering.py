@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# mermaid_rendering.py
+# Shared Mermaid rendering helpers: a persistent headless render worker
+
+import atexit
+import base64
+import functools
+import hashlib
+import json
+import os
+import subprocess
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from pathlib import Path
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mermaid-render-worker.mjs')
+
+# Same look as the mmdc command line used by the generators (-t neutral -b white)
+DEFAULT_THEME = 'neutral'
+DEFAULT_BACKGROUND = 'white'
+
+# Seconds to wait for a single diagram before giving up on it
+RENDER_TIMEOUT = 120
+
+# Rough resident memory of one concurrent render: a page in the shared worker
+# browser, or a whole headless browser when each render is its own mmdc process
+WORKER_RENDER_MEMORY_MB = 80
+PROCESS_RENDER_MEMORY_MB = 250
+
+# Content-addressed cache of rendered images, shared by every project on the host
+DEFAULT_RENDER_CACHE_DIR = os.environ.get(
+    'EFTDM_RENDER_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'eftdm', 'mermaid-renders')
+)
+DEFAULT_RENDER_CACHE_MB = 512
+# Eviction frees the cache down to this share of its cap, so the next scans are many stores away
+EVICTION_LOW_WATER = 0.9
+
+class RenderError(Exception):
+    """Raised when a diagram cannot be rendered"""
+
+class MermaidRenderWorker:
+    """Long-lived Node process that renders Mermaid sources over a stdin/stdout pipe
+
+    Node startup, module resolution and the headless browser launch are paid
+    once per worker instead of once per diagram. With concurrency > 1 the worker
+    renders several diagrams at once in separate pages of the same browser, and
+    render() may be called from several threads.
+    """
+
+    def __init__(self, worker_script=WORKER_SCRIPT, node='node', cwd=None, concurrency=1):
+        self.worker_script = worker_script
+        self.node = node
+        self.cwd = cwd
+        self.concurrency = max(1, concurrency)
+        self.process = None
+        self.error = None
+        self._next_id = 0
+        self._pending = {}
+        self._write_lock = threading.Lock()
+        self._reader = None
+
+    @property
+    def alive(self):
+        """Whether the worker process is running"""
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """Start the worker; return True once it reports ready"""
+        if self.alive:
+            return True
+        try:
+            self.process = subprocess.Popen(
+                [self.node, self.worker_script],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding='utf-8',
+                bufsize=1,
+                cwd=self.cwd,
+                env=dict(os.environ, MERMAID_WORKER_CONCURRENCY=str(self.concurrency))
+            )
+            status = json.loads(self.process.stdout.readline() or '{}')
+        except (OSError, ValueError) as e:
+            self.error = str(e)
+            self.close()
+            return False
+
+        if not status.get('ready'):
+            self.error = status.get('error', 'worker exited during startup')
+            self.close()
+            return False
+
+        self._reader = threading.Thread(target=self._read_responses, args=(self.process,), daemon=True)
+        self._reader.start()
+        return True
+
+    def _read_responses(self, process):
+        """Route responses to the waiting render() calls until the worker exits"""
+        try:
+            for line in process.stdout:
+                try:
+                    response = json.loads(line)
+                except ValueError:
+                    continue
+                future = self._pending.pop(response.get('id'), None)
+                if future is not None:
+                    future.set_result(response)
+        except (OSError, ValueError):
+            pass
+
+        self.error = self.error or 'worker exited unexpectedly'
+        for request_id in list(self._pending):
+            future = self._pending.pop(request_id, None)
+            if future is not None:
+                future.set_exception(RenderError(f"Render worker failed: {self.error}"))
+
+    def render(self, source, output_format='png', theme=DEFAULT_THEME, background=DEFAULT_BACKGROUND,
+               timeout=RENDER_TIMEOUT):
+        """Render one diagram source and return the image bytes"""
+        future = Future()
+        with self._write_lock:
+            if not self.alive:
+                raise RenderError(f"Render worker is not running: {self.error or 'not started'}")
+
+            self._next_id += 1
+            request_id = self._next_id
+            request = {
+                'id': request_id,
+                'definition': source,
+                'format': output_format,
+                'theme': theme,
+                'backgroundColor': background
+            }
+            self._pending[request_id] = future
+            try:
+                self.process.stdin.write(json.dumps(request) + '\n')
+                self.process.stdin.flush()
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                self.error = str(e)
+                raise RenderError(f"Render worker failed: {self.error}")
+
+        try:
+            response = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Forget the request, so a late response is dropped instead of piling up in _pending
+            self._pending.pop(request_id, None)
+            raise RenderError(f"Render timed out after {timeout}s")
+        if not response.get('ok'):
+            raise RenderError(response.get('error', 'unknown render error'))
+        return base64.b64decode(response['data'])
+
+    def render_file(self, mmd_file_path, output_dir, output_format='png'):
+        """Render an .mmd file into output_dir; return the output path"""
+        with open(mmd_file_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        output_file = os.path.join(output_dir, f"{Path(mmd_file_path).stem}.{output_format}")
+        data = self.render(source, output_format)
+        # Replace rather than overwrite, so a hardlinked cache entry is never modified
+        temp_file = f"{output_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(data)
+        os.replace(temp_file, output_file)
+        return output_file
+
+    def close(self):
+        """Stop the worker process after in-flight renders finish"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.close()
+                process.wait(timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        if self._reader is not None:
+            self._reader.join(timeout=5)
+            self._reader = None
+        process.stdout.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+_shared_worker = None
+
+def get_render_worker(concurrency=1):
+    """Return the run-wide render worker, starting it on first use; None if unavailable"""
+    global _shared_worker
+    if _shared_worker is None:
+        _shared_worker = MermaidRenderWorker(concurrency=concurrency)
+        atexit.register(_shared_worker.close)
+        _shared_worker.start()
+    return _shared_worker if _shared_worker.alive else None
+
+def available_memory_mb():
+    """Return available system memory in MB, or None if it cannot be determined"""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def plan_render_concurrency(max_workers=None, memory_budget_mb=None, memory_per_render_mb=PROCESS_RENDER_MEMORY_MB):
+    """Return how many renders may run at once within the CPU and memory budget
+
+    The CPU budget defaults to the CPU count and the memory budget to half of
+    the currently available memory.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if memory_budget_mb is None:
+        available = available_memory_mb()
+        memory_budget_mb = available // 2 if available else None
+    if memory_budget_mb:
+        workers = min(workers, memory_budget_mb // memory_per_render_mb)
+    return max(1, workers)
+
+def render_batch(mmd_paths, render_function, workers=1):
+    """Render many .mmd files on a bounded thread pool
+
+    render_function(mmd_path) returns True on success. Returns one result per
+    file, in input order: {'file', 'success', 'seconds', 'error'}.
+    """
+    def timed_render(mmd_path):
+        start = time.perf_counter()
+        try:
+            success, error = bool(render_function(mmd_path)), None
+        except Exception as e:
+            success, error = False, str(e)
+        return {
+            'file': mmd_path,
+            'success': success,
+            'seconds': time.perf_counter() - start,
+            'error': error
+        }
+
+    if workers <= 1 or len(mmd_paths) <= 1:
+        return [timed_render(mmd_path) for mmd_path in mmd_paths]
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(mmd_paths))) as pool:
+        futures = {pool.submit(timed_render, mmd_path): mmd_path for mmd_path in mmd_paths}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return [results[mmd_path] for mmd_path in mmd_paths]
+
+def print_render_timings(results, wall_seconds):
+    """Print per-file render timings and the batch wall time"""
+    for result in results:
+        status = '✅' if result['success'] else '❌'
+        print(f"   {status} {os.path.basename(result['file'])}: {result['seconds']:.2f}s")
+    slowest = max((result['seconds'] for result in results), default=0.0)
+    print(f"⏱️  Render wall time: {wall_seconds:.2f}s (slowest diagram {slowest:.2f}s)")
+
+@functools.lru_cache(maxsize=None)
+def mermaid_cli_version(cli_type='local'):
+    """Return the installed Mermaid CLI version, used to key cached renders"""
+    # A local install can be read from its package.json without starting Node
+    for base in (os.getcwd(), os.path.dirname(os.path.abspath(__file__))):
+        directory = base
+        while True:
+            package_file = os.path.join(directory, 'node_modules', '@mermaid-js', 'mermaid-cli', 'package.json')
+            if os.path.exists(package_file):
+                try:
+                    with open(package_file, 'r', encoding='utf-8') as f:
+                        return json.load(f).get('version', 'unknown')
+                except (OSError, ValueError):
+                    break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+
+    cmd = ['mmdc', '--version'] if cli_type == 'global' else ['npx', 'mmdc', '--version']
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            return result.stdout.strip() or 'unknown'
+    except FileNotFoundError:
+        pass
+    return 'unknown'
+
+class RenderCache:
+    """Content-addressed store of rendered images with a size cap and LRU eviction
+
+    Entries are keyed by a hash of the diagram source, output format, theme,
+    background and renderer version. Entries are never modified in place, so
+    hits can be hardlinked into the images directory. An entry's mtime is its
+    last use, which drives eviction. The cache keeps a running size total and
+    only scans its directory when that total is unknown or over the cap; other
+    processes' stores are counted at the next scan.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_RENDER_CACHE_DIR, max_mb=DEFAULT_RENDER_CACHE_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None
+        self._lock = threading.Lock()
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(source, renderer, output_format='png', theme=DEFAULT_THEME, background=DEFAULT_BACKGROUND):
+        """Return the cache key of one render"""
+        digest = hashlib.sha256()
+        for part in (renderer, output_format, theme, background, source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _entry_path(self, key, output_format):
+        return os.path.join(self.cache_dir, f"{key}.{output_format}")
+
+    def fetch(self, key, output_file, output_format='png'):
+        """Place a cached render at output_file; return True on a hit"""
+        entry = self._entry_path(key, output_format)
+        try:
+            os.utime(entry)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        # Link under a temporary name and rename it into place, so the previous image survives a failure
+        temp_file = f"{output_file}.{os.getpid()}-{threading.get_ident()}.tmp"
+        _remove_file(temp_file)
+        try:
+            try:
+                os.link(entry, temp_file)
+            except FileNotFoundError:
+                raise
+            except OSError:
+                shutil.copyfile(entry, temp_file)
+            os.replace(temp_file, output_file)
+        except FileNotFoundError:
+            # Evicted by another process since the utime
+            _remove_file(temp_file)
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def store(self, key, output_file, output_format='png'):
+        """Copy a fresh render into the cache, then enforce the size cap"""
+        entry = self._entry_path(key, output_format)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            shutil.copyfile(output_file, temp_path)
+            size = os.path.getsize(temp_path)
+            try:
+                size -= os.path.getsize(entry)
+            except OSError:
+                pass
+            os.replace(temp_path, entry)
+        except OSError:
+            _remove_file(temp_path)
+            return False
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+        self.evict()
+        return True
+
+    def evict(self):
+        """Remove least recently used entries once the cache exceeds its cap, down to the low-water mark"""
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as scan:
+                for item in scan:
+                    try:
+                        if not item.is_file() or item.name.endswith('.tmp'):
+                            continue
+                        stat = item.stat()
+                    except FileNotFoundError:  # Evicted by another process during the scan
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+            if total > self.max_bytes:
+                low_water = self.max_bytes * EVICTION_LOW_WATER
+                for _, size, path in sorted(entries):
+                    _remove_file(path)
+                    self.evictions += 1
+                    total -= size
+                    if total <= low_water:
+                        break
+            self._size = total
+
+    def summary(self):
+        """Return a one-line hit/miss summary for the run"""
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evicted"
+
+def _remove_file(path):
+    """Remove a file if it exists"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def cached_render(cache, mmd_path, output_dir, renderer, render_function, output_format='png'):
+    """Serve a render from the cache, or call render_function(mmd_path) and cache its output"""
+    with open(mmd_path, 'r', encoding='utf-8') as f:
+        source = f.read()
+    output_file = os.path.join(output_dir, f"{Path(mmd_path).stem}.{output_format}")
+    key = cache.key(source, renderer, output_format)
+
+    if cache.fetch(key, output_file, output_format):
+        print(f"♻️  Cached image: {output_file}")
+        return True
+
+    # Never render into a hardlinked cache entry
+    _remove_file(output_file)
+    if not render_function(mmd_path):
+        return False
+    if os.path.exists(output_file):
+        cache.store(key, output_file, output_format)
+    return True
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# mermaid_validation.py
+# In-process syntax check for the Mermaid subset the generators emit, run before any render
+
+import re
+
+# Stop reporting a file after this many problems; the first few are what matter
+MAX_ISSUES = 20
+
+FLOWCHART_HEADER = re.compile(r"(graph|flowchart)\b\s*(.*?)\s*;?\s*$")
+FLOWCHART_DIRECTIONS = {'TB', 'TD', 'BT', 'RL', 'LR'}
+FLOWCHART_KEYWORDS = {'classDef', 'class', 'style', 'linkStyle', 'direction', 'accTitle', 'accDescr'}
+NODE_ID = re.compile(r"\w+")
+NODE_SEPARATOR = re.compile(r"\s*&\s*")
+WHITESPACE = re.compile(r"\s*")
+CLASS_SUFFIX = re.compile(r":::\w+")
+# (opening, closing) delimiters, longest opening first so '((' is not read as '('
+NODE_SHAPES = (
+    ('(((', ')))'), ('([', '])'), ('[[', ']]'), ('[(', ')]'), ('((', '))'), ('{{', '}}'),
+    ('[/', '/]'), ('[\\', '\\]'), ('>', ']'), ('[', ']'), ('(', ')'), ('{', '}')
+)
+# Characters that end or nest a label and so break an unquoted one
+LABEL_BREAKERS = set('[](){}"')
+LINK = re.compile(r"\s*(<?(?:-{2,}|={2,}|-\.+-|~{3,})[>xo]?)\s*")
+TEXT_LINK_START = re.compile(r"\s*(?:--|==|-\.)\s+(?=[^\s>-])")
+TEXT_LINK_END = re.compile(r"\s+(?:-{2,}[>xo]?|={2,}[>xo]?|\.-+>?)\s*")
+
+SEQUENCE_ARROW = re.compile(r"--?>>|--?>|--?x|--?\)")
+SEQUENCE_PARTICIPANT = re.compile(r"(participant|actor)\s+[^\s:]+(\s+as\s+.+)?$")
+SEQUENCE_NOTE = re.compile(r"[Nn]ote\s+(left of|right of|over)\s+[^:]+:")
+SEQUENCE_BLOCKS = {'loop', 'alt', 'opt', 'par', 'critical', 'break', 'rect', 'box'}
+SEQUENCE_BRANCHES = {'else': ('alt',), 'and': ('par',), 'option': ('critical',)}
+SEQUENCE_KEYWORDS = {
+    'autonumber', 'activate', 'deactivate', 'create', 'destroy', 'link', 'links', 'title', 'accTitle', 'accDescr'
+}
+
+ER_NAME = r"[A-Za-z_][\w-]*"
+ER_ENTITY = re.compile(rf"{ER_NAME}$")
+ER_ENTITY_OPEN = re.compile(rf"{ER_NAME}(?:\s*\[[^\]]*\])?\s*\{{$")
+ER_ATTRIBUTE = re.compile(r"[\w\-\[\]()]+\s+\*?[\w\-\[\]()]+(?:\s+(?:PK|FK|UK)(?:\s*,\s*(?:PK|FK|UK))*)?(?:\s+\"[^\"]*\")?$")
+ER_RELATIONSHIP = re.compile(
+    rf"(?P<source>{ER_NAME})\s*(?P<cardinality>[|}}{{o.\-]+)\s*(?P<target>{ER_NAME})\s*(?P<colon>:)?\s*(?P<label>.*)$"
+)
+ER_CARDINALITY = re.compile(r"(?:\|o|\|\||\}o|\}\|)(?:--|\.\.)(?:o\||\|\||o\{|\|\{)$")
+ER_LABEL = re.compile(r'"[^"]*"|[\w-]+$')
+
+GANTT_KEYWORDS = {
+    'title', 'dateFormat', 'axisFormat', 'tickInterval', 'excludes', 'includes', 'todayMarker', 'weekday',
+    'weekend', 'inclusiveEndDates', 'topAxis', 'displayMode', 'section', 'accTitle', 'accDescr'
+}
+
+class ValidationIssue:
+    """One syntax problem, at a 1-based line and column"""
+
+    __slots__ = ('line', 'column', 'message')
+
+    def __init__(self, line, column, message):
+        self.line = line
+        self.column = column
+        self.message = message
+
+    def __str__(self):
+        return f"{self.line}:{self.column}: {self.message}"
+
+class _LineError(Exception):
+    """A problem at a 0-based offset into the statement being checked"""
+
+    def __init__(self, offset, message):
+        super().__init__(message)
+        self.offset = offset
+        self.message = message
+
+def _scan_label(text, position, closing, what):
+    """Return the position after a label that ends with closing; reject characters that break it"""
+    if text.startswith('"', position):
+        end = text.find('"', position + 1)
+        if end == -1:
+            raise _LineError(position, f"unterminated quoted {what}")
+        if not text.startswith(closing, end + 1):
+            raise _LineError(end + 1, f"expected '{closing}' after quoted {what}")
+        return end + 1 + len(closing)
+    end = text.find(closing, position)
+    if end == -1:
+        raise _LineError(position, f"unterminated {what}, expected '{closing}'")
+    for offset in range(position, end):
+        if text[offset] in LABEL_BREAKERS:
+            raise _LineError(offset, f"unescaped '{text[offset]}' in {what}; quote the label or use #quot; style entities")
+    return end + len(closing)
+
+def _scan_node(text, position):
+    """Return the position after a node reference with its optional shape, label and class"""
+    match = NODE_ID.match(text, position)
+    if not match:
+        raise _LineError(position, "expected a node ID")
+    position = match.end()
+    for opening, closing in NODE_SHAPES:
+        if text.startswith(opening, position):
+            position = _scan_label(text, position + len(opening), closing, 'node label')
+            break
+    match = CLASS_SUFFIX.match(text, position)
+    return match.end() if match else position
+
+def _scan_nodes(text, position):
+    """Return the position after one node or an '&' group of nodes"""
+    position = _scan_node(text, position)
+    while True:
+        match = NODE_SEPARATOR.match(text, position)
+        if not match:
+            return position
+        position = _scan_node(text, match.end())
+
+def _scan_link(text, position):
+    """Return the position after a link and its optional |label|, or None if no link starts here"""
+    match = TEXT_LINK_START.match(text, position)
+    if match:
+        end = TEXT_LINK_END.search(text, match.end())
+        if not end:
+            raise _LineError(match.end(), "unterminated link text")
+        return end.end()
+    match = LINK.match(text, position)
+    if not match:
+        return None
+    position = match.end()
+    if text.startswith('|', position):
+        end = text.find('|', position + 1)
+        if end == -1:
+            raise _LineError(position, "unterminated link label, expected '|'")
+        label = text[position + 1:end]
+        if '"' in label and not (len(label) > 1 and label[0] == label[-1] == '"' and '"' not in label[1:-1]):
+            raise _LineError(position + 1 + label.index('"'), "unescaped '\"' in link label")
+        position = WHITESPACE.match(text, end + 1).end()
+    return position
+
+def _check_flowchart_statement(text, state):
+    """Check one flowchart line (without indentation)"""
+    word = text.split(None, 1)[0]
+    if word == 'subgraph':
+        if len(text.split()) < 2:
+            raise _LineError(len(text), "expected a subgraph ID")
+        state.append(('subgraph', None))
+        return
+    if word == 'end':
+        if not state:
+            raise _LineError(0, "'end' without an open subgraph")
+        state.pop()
+        return
+    if word == 'click':
+        if not NODE_ID.match(text, len(word) + 1):
+            raise _LineError(len(word) + 1, "expected a node ID after 'click'")
+        return
+    if word in FLOWCHART_KEYWORDS or word.startswith(('accTitle:', 'accDescr:')):
+        return
+
+    position = _scan_nodes(text, 0)
+    while position < len(text):
+        if text[position:].strip() in ('', ';'):
+            return
+        link_end = _scan_link(text, position)
+        if link_end is None:
+            raise _LineError(position, f"unexpected '{text[position]}'; expected a link or the end of the line")
+        if link_end >= len(text):
+            raise _LineError(link_end, "expected a node after the link")
+        position = _scan_nodes(text, link_end)
+
+def _check_sequence_statement(text, state):
+    """Check one sequence diagram line (without indentation)"""
+    word = text.split(None, 1)[0]
+    if word in ('participant', 'actor'):
+        if not SEQUENCE_PARTICIPANT.match(text):
+            raise _LineError(len(word) + 1, f"expected '{word} ID' or '{word} ID as Label'")
+        return
+    if word in ('Note', 'note'):
+        if not SEQUENCE_NOTE.match(text):
+            raise _LineError(len(word) + 1, "expected 'Note left of|right of|over ID: text'")
+        return
+    if word in SEQUENCE_BLOCKS:
+        state.append((word, None))
+        return
+    if word in SEQUENCE_BRANCHES:
+        if not state or state[-1][0] not in SEQUENCE_BRANCHES[word]:
+            raise _LineError(0, f"'{word}' outside {' or '.join(SEQUENCE_BRANCHES[word])}")
+        return
+    if word == 'end':
+        if not state:
+            raise _LineError(0, "'end' without an open block")
+        state.pop()
+        return
+    if word in SEQUENCE_KEYWORDS or word.split(':', 1)[0] in SEQUENCE_KEYWORDS:
+        return
+
+    arrow = SEQUENCE_ARROW.search(text)
+    if not arrow or ':' in text[:arrow.start()]:
+        raise _LineError(0, "expected a message 'A->>B: text' or a sequence keyword")
+    if not text[:arrow.start()].strip():
+        raise _LineError(arrow.start(), "message without a sender")
+    colon = text.find(':', arrow.end())
+    target = text[arrow.end():colon if colon != -1 else len(text)].strip().lstrip('+-').strip()
+    if not target:
+        raise _LineError(arrow.end(), "message without a receiver")
+    if colon == -1:
+        raise _LineError(len(text), "expected ': text' after the message receiver")
+
+def _check_er_statement(text, state):
+    """Check one ER diagram line (without indentation)"""
+    if state:
+        if text == '}':
+            state.pop()
+        elif not ER_ATTRIBUTE.match(text):
+            raise _LineError(0, "expected an attribute 'type name [PK|FK|UK] [\"comment\"]' or '}'")
+        return
+    if ER_ENTITY_OPEN.match(text):
+        state.append(('entity', None))
+        return
+    if ER_ENTITY.match(text) or text.startswith(('title', 'accTitle', 'accDescr', 'direction')):
+        return
+
+    match = ER_RELATIONSHIP.match(text)
+    if not match:
+        raise _LineError(0, "expected an entity, 'ENTITY {' or a relationship 'A ||--o{ B : label'")
+    if not ER_CARDINALITY.match(match.group('cardinality')):
+        raise _LineError(match.start('cardinality'), f"invalid relationship '{match.group('cardinality')}'")
+    if not match.group('colon'):
+        raise _LineError(match.end('target'), "expected ': label' after the relationship")
+    if not ER_LABEL.match(match.group('label')):
+        raise _LineError(match.start('label'), "relationship label must be one word or quoted")
+
+def _check_gantt_statement(text, state):
+    """Check one gantt chart line (without indentation)"""
+    word = text.split(None, 1)[0]
+    if word in GANTT_KEYWORDS or word.split(':', 1)[0] in GANTT_KEYWORDS:
+        return
+    colon = text.find(':')
+    if colon == -1:
+        raise _LineError(0, "expected a task 'name :spec' or a gantt keyword")
+    if not text[:colon].strip():
+        raise _LineError(0, "task without a name")
+    offset = colon + 1
+    for part in text[colon + 1:].split(','):
+        if not part.strip():
+            raise _LineError(offset, "empty task field")
+        offset += len(part) + 1
+
+# Diagram kind: (header pattern, statement checker, unclosed-block message)
+DIAGRAM_KINDS = {
+    'flowchart': (FLOWCHART_HEADER, _check_flowchart_statement, "subgraph is never closed with 'end'"),
+    'sequence': (re.compile(r"sequenceDiagram\s*$"), _check_sequence_statement, "'{}' block is never closed with 'end'"),
+    'er': (re.compile(r"erDiagram\s*$"), _check_er_statement, "entity is never closed with '}}'"),
+    'gantt': (re.compile(r"gantt\s*$"), _check_gantt_statement, None)
+}
+
+def validate_mermaid(text):
+    """Return the syntax problems of a diagram as ValidationIssues (empty if it is valid)"""
+    issues = []
+    kind = None
+    state = []
+    block_lines = []
+
+    for number, line in enumerate(text.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%%'):
+            continue
+        indent = len(line) - len(line.lstrip())
+
+        if kind is None:
+            for name, (header, _, _) in DIAGRAM_KINDS.items():
+                match = header.match(stripped)
+                if match:
+                    kind = name
+                    break
+            else:
+                issues.append(ValidationIssue(number, indent + 1, f"unknown diagram type '{stripped.split()[0]}'"))
+                return issues
+            if kind == 'flowchart' and match.group(2) and match.group(2) not in FLOWCHART_DIRECTIONS:
+                column = indent + match.start(2) + 1
+                issues.append(ValidationIssue(number, column, f"expected a direction (TB, TD, BT, RL, LR), got '{match.group(2)}'"))
+            continue
+
+        depth = len(state)
+        try:
+            DIAGRAM_KINDS[kind][1](stripped, state)
+        except _LineError as e:
+            issues.append(ValidationIssue(number, indent + e.offset + 1, e.message))
+            if len(issues) >= MAX_ISSUES:
+                return issues
+        if len(state) > depth:
+            block_lines.append((number, indent + 1, state[-1][0]))
+        elif len(state) < depth:
+            block_lines.pop()
+
+    if kind is None:
+        issues.append(ValidationIssue(1, 1, "empty diagram"))
+    for number, column, block in block_lines:
+        issues.append(ValidationIssue(number, column, DIAGRAM_KINDS[kind][2].format(block)))
+    return issues
+
+def validate_mermaid_file(file_path):
+    """Return the syntax problems of a .mmd file; an unreadable file is one problem"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return validate_mermaid(f.read())
+    except (OSError, UnicodeDecodeError) as e:
+        return [ValidationIssue(1, 1, f"cannot read diagram: {e}")]
+
+def filter_valid_diagrams(mmd_paths):
+    """Validate diagrams before rendering; print the problems of invalid ones and return the valid paths"""
+    valid = []
+    for mmd_path in mmd_paths:
+        issues = validate_mermaid_file(mmd_path)
+        if not issues:
+            valid.append(mmd_path)
+            continue
+        print(f"❌ Invalid Mermaid, not rendered: {mmd_path}")
+        for issue in issues:
+            print(f"   {mmd_path}:{issue}")
+    return valid
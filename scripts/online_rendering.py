@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# online_rendering.py
+# Async, connection-pooled client for the mermaid.ink online renderer
+
+import asyncio
+import base64
+import json
+import os
+import random
+import ssl
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from artifact_writer import get_artifact_writer
+from mermaid_diagrams import parse_flowchart
+from mermaid_pagination import diagram_size, paginate_diagram
+from mermaid_rendering import (
+    WORKER_RENDER_MEMORY_MB, RenderError, get_render_worker, plan_render_concurrency, render_batch
+)
+
+# Point this at a local stand-in server (scripts/mermaid-ink-stub-server.py) for tests and offline runs
+DEFAULT_ONLINE_ENDPOINT = os.environ.get('MERMAID_INK_URL', 'https://mermaid.ink')
+
+DEFAULT_ONLINE_CONCURRENCY = 8
+DEFAULT_ONLINE_TIMEOUT = 30
+DEFAULT_ONLINE_RETRIES = 3
+DEFAULT_ONLINE_BACKOFF = 0.5
+
+# Payload encodings: plain base64 of the source, or mermaid.ink's "pako:" form
+# (deflated JSON state in URL-safe base64). 'auto' keeps small diagrams readable
+# and compresses larger ones whenever that yields a shorter URL.
+PAYLOAD_ENCODINGS = ('auto', 'base64', 'pako')
+COMPRESS_THRESHOLD = 1024
+
+# Longest request path sent to the renderer; many servers reject URLs past 8 KB
+MAX_URL_LENGTH = 8000
+
+# Statuses worth retrying; other 4xx responses mean the diagram itself was rejected
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+def normalize_endpoint(base_url):
+    """Return base_url with a lowercase scheme and host and no trailing slash, for use in cache keys"""
+    parts = urlsplit(base_url)
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+class PayloadTooLargeError(RenderError):
+    """Raised when a diagram cannot be encoded into a URL under MAX_URL_LENGTH"""
+
+class _RetryableError(Exception):
+    """A failed attempt that may succeed when retried"""
+
+class AsyncMermaidInkClient:
+    """HTTP/1.1 keep-alive client for mermaid.ink with a bounded connection pool
+
+    At most max_connections requests are in flight; idle connections are reused
+    across diagrams. Each attempt has a timeout, and failed attempts are retried
+    with exponential backoff and full jitter.
+    """
+
+    def __init__(self, base_url=DEFAULT_ONLINE_ENDPOINT, max_connections=DEFAULT_ONLINE_CONCURRENCY,
+                 timeout=DEFAULT_ONLINE_TIMEOUT, retries=DEFAULT_ONLINE_RETRIES, backoff=DEFAULT_ONLINE_BACKOFF,
+                 encoding='auto', max_url_length=MAX_URL_LENGTH):
+        if encoding not in PAYLOAD_ENCODINGS:
+            raise ValueError(f"Unknown payload encoding: {encoding}")
+        parts = urlsplit(base_url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"Unsupported renderer endpoint: {base_url}")
+        self.base_url = base_url
+        self.host = parts.hostname
+        self.secure = parts.scheme == 'https'
+        self.port = parts.port or (443 if self.secure else 80)
+        self.base_path = parts.path.rstrip('/')
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.encoding = encoding
+        self.max_url_length = max_url_length
+        self.requests_sent = 0
+        self.bytes_sent = 0
+        self.connections_opened = 0
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+        self._ssl = ssl.create_default_context() if self.secure else None
+
+    def encode(self, source):
+        """Encode a diagram source for the URL path; return (encoding, payload)"""
+        plain = base64.b64encode(source.encode('utf-8')).decode('ascii')
+        if self.encoding == 'base64' or (self.encoding == 'auto' and len(plain) <= COMPRESS_THRESHOLD):
+            return 'base64', plain
+
+        compressed = encode_pako(source)
+        if self.encoding == 'pako' or len(compressed) < len(plain):
+            return 'pako', compressed
+        return 'base64', plain
+
+    def image_path(self, source, output_format='png'):
+        """Return (encoding, request path) for one diagram"""
+        endpoint = 'svg' if output_format == 'svg' else 'img'
+        encoding, payload = self.encode(source)
+        path = f"{self.base_path}/{endpoint}/{payload}"
+        if len(path) > self.max_url_length:
+            raise PayloadTooLargeError(
+                f"diagram needs a {len(path)}-character URL even with {encoding} encoding "
+                f"(limit {self.max_url_length})"
+            )
+        return encoding, path
+
+    async def render(self, source, output_format='png'):
+        """Render one diagram and return the image bytes"""
+        data, _ = await self.render_with_stats(source, output_format)
+        return data
+
+    async def render_with_stats(self, source, output_format='png'):
+        """Render one diagram; return (image bytes, {'encoding', 'bytes_sent', 'attempts'})"""
+        encoding, path = self.image_path(source, output_format)
+        stats = {'encoding': encoding, 'bytes_sent': 0, 'attempts': 0}
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(random.uniform(0, self.backoff * (2 ** (attempt - 1))))
+            async with self._slots:
+                stats['attempts'] += 1
+                try:
+                    status, body, sent = await asyncio.wait_for(self._get(path), self.timeout)
+                except asyncio.TimeoutError:
+                    last_error = f"timed out after {self.timeout}s"
+                    continue
+                except (_RetryableError, OSError, asyncio.IncompleteReadError) as e:
+                    last_error = str(e) or e.__class__.__name__
+                    continue
+            stats['bytes_sent'] += sent
+
+            if status == 200:
+                return body, stats
+            if status not in RETRY_STATUSES:
+                raise RenderError(f"HTTP {status}")
+            last_error = f"HTTP {status}"
+
+        raise RenderError(f"{last_error} (after {self.retries + 1} attempts)")
+
+    async def _connect(self):
+        """Return an idle pooled connection, or open a new one"""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self._ssl)
+        self.connections_opened += 1
+        return reader, writer, False
+
+    async def _get(self, path):
+        """Send one GET over a pooled connection; return (status, body)"""
+        reader, writer, reused = await self._connect()
+        try:
+            request = (
+                f"GET {path} HTTP/1.1\r\n"
+                f"Host: {self.host_header}\r\n"
+                "User-Agent: eftdm-mermaid-generator\r\n"
+                "Accept: */*\r\n"
+                "Connection: keep-alive\r\n\r\n"
+            )
+            request = request.encode('ascii')
+            writer.write(request)
+            await writer.drain()
+            self.requests_sent += 1
+            self.bytes_sent += len(request)
+            status, headers = await self._read_head(reader)
+            body = await self._read_body(reader, headers)
+        except BaseException as e:
+            writer.close()
+            if reused and isinstance(e, (OSError, asyncio.IncompleteReadError, _RetryableError)):
+                raise _RetryableError(f"stale pooled connection: {e}")
+            raise
+
+        if headers.get('connection', '').lower() == 'close':
+            writer.close()
+        else:
+            self._idle.append((reader, writer))
+        return status, body, len(request)
+
+    @staticmethod
+    async def _read_head(reader):
+        """Read the status line and headers of a response"""
+        status_line = await reader.readline()
+        if not status_line:
+            raise _RetryableError('connection closed before response')
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise _RetryableError(f"malformed status line: {status_line!r}")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    @staticmethod
+    async def _read_body(reader, headers):
+        """Read a response body framed by Content-Length or chunked encoding"""
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await reader.readline()
+                    return b''.join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        if 'content-length' in headers:
+            return await reader.readexactly(int(headers['content-length']))
+        headers['connection'] = 'close'
+        return await reader.read()
+
+    async def close(self):
+        """Close every pooled connection"""
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+async def _render_files(mmd_paths, output_dir, output_format, client_options):
+    """Render files concurrently with one shared client"""
+    client = AsyncMermaidInkClient(**client_options)
+
+    async def render_one(mmd_path):
+        start = time.perf_counter()
+        output_file = os.path.join(output_dir, f"{Path(mmd_path).stem}.{output_format}")
+        stats = {}
+        try:
+            with open(mmd_path, 'r', encoding='utf-8') as f:
+                source = f.read()
+            data, stats = await client.render_with_stats(source, output_format)
+            # Replace rather than overwrite, so a hardlinked cache entry is never modified
+            temp_file = f"{output_file}.tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(data)
+            os.replace(temp_file, output_file)
+            print(f"✅ Generated image (online): {output_file} "
+                  f"({stats['bytes_sent']} bytes sent, {stats['encoding']})")
+            success, error = True, None
+        except PayloadTooLargeError as e:
+            # Left for the batched local fallback in render_files_online
+            return {'file': mmd_path, 'success': False, 'seconds': 0.0, 'error': str(e), 'deferred': True}
+        except (RenderError, OSError) as e:
+            print(f"❌ Failed to generate image online for {os.path.basename(mmd_path)}: {str(e)}")
+            success, error = False, str(e)
+        return {
+            'file': mmd_path,
+            'success': success,
+            'seconds': time.perf_counter() - start,
+            'error': error,
+            'bytes_sent': stats['bytes_sent'] if success else None,
+            'encoding': stats['encoding'] if success else None
+        }
+
+    try:
+        return await asyncio.gather(*(render_one(mmd_path) for mmd_path in mmd_paths))
+    finally:
+        await client.close()
+
+def render_files_online(mmd_paths, output_dir, output_format='png', render_cache=None, max_workers=None,
+                        memory_budget_mb=None, **client_options):
+    """Render .mmd files through the online renderer; returns render_batch-style results
+
+    Cache hits are served before any request is made. Cached images are keyed
+    by endpoint as well, so renders from a stand-in server are never served for
+    another endpoint. Diagrams too large for a URL go to render_oversized_batch,
+    within the max_workers and memory_budget_mb render budget. client_options
+    are passed to AsyncMermaidInkClient (base_url, max_connections, timeout,
+    retries, backoff, encoding, max_url_length).
+    """
+    results = {}
+    pending = []
+    keys = {}
+    renderer = f"mermaid.ink:{normalize_endpoint(client_options.get('base_url', DEFAULT_ONLINE_ENDPOINT))}"
+    for mmd_path in mmd_paths:
+        if render_cache:
+            with open(mmd_path, 'r', encoding='utf-8') as f:
+                keys[mmd_path] = render_cache.key(f.read(), renderer, output_format)
+            output_file = os.path.join(output_dir, f"{Path(mmd_path).stem}.{output_format}")
+            if render_cache.fetch(keys[mmd_path], output_file, output_format):
+                print(f"♻️  Cached image: {output_file}")
+                results[mmd_path] = {'file': mmd_path, 'success': True, 'seconds': 0.0, 'error': None}
+                continue
+        pending.append(mmd_path)
+
+    if pending:
+        online_results = asyncio.run(_render_files(pending, output_dir, output_format, client_options))
+        deferred = [result['file'] for result in online_results if result.get('deferred')]
+        if deferred:
+            online_results = [result for result in online_results if not result.get('deferred')]
+            online_results += render_oversized_batch(
+                deferred, output_dir, output_format, client_options, max_workers, memory_budget_mb
+            )
+        for result in online_results:
+            results[result['file']] = result
+            # A diagram split into pages is not cached: its image is the page index
+            if render_cache and result['success'] and not result.get('pages'):
+                output_file = os.path.join(output_dir, f"{Path(result['file']).stem}.{output_format}")
+                render_cache.store(keys[result['file']], output_file, output_format)
+
+    return [results[mmd_path] for mmd_path in mmd_paths]
+
+def encode_pako(source, theme='default'):
+    """Return mermaid.ink's compressed "pako:" payload for a diagram source"""
+    state = json.dumps({'code': source, 'mermaid': json.dumps({'theme': theme})})
+    compressed = zlib.compress(state.encode('utf-8'), 9)
+    return 'pako:' + base64.urlsafe_b64encode(compressed).decode('ascii').rstrip('=')
+
+def render_oversized_batch(mmd_paths, output_dir, output_format='png', client_options=None, max_workers=None,
+                           memory_budget_mb=None):
+    """Render diagrams too large for a URL: as one batch on the local render worker, or else split into pages online
+
+    The worker and the batch are sized by plan_render_concurrency. Without a
+    worker, which is the usual case when rendering online, each flowchart is
+    split with mermaid_pagination into pages that fit in a URL: its .mmd becomes
+    the page index and the pages are written next to it, as if it had been
+    paginated when generated, and all of them are rendered online.
+    """
+    print(f"📦 {len(mmd_paths)} diagram(s) too large for an online URL")
+    workers = min(len(mmd_paths), plan_render_concurrency(max_workers, memory_budget_mb, WORKER_RENDER_MEMORY_MB))
+    worker = get_render_worker(workers)
+    if worker is not None:
+        print(f"📦 Submitting them to the local renderer ({workers} at a time)")
+
+        def render(mmd_path):
+            output_file = worker.render_file(mmd_path, output_dir, output_format)
+            print(f"✅ Generated image (local batch): {output_file}")
+            return True
+
+        return render_batch(mmd_paths, render, workers=workers)
+
+    client_options = client_options or {}
+    client = AsyncMermaidInkClient(**client_options)
+    results = []
+    for mmd_path in mmd_paths:
+        files = split_for_url(mmd_path, client, output_format)
+        if files is None:
+            print(f"❌ {os.path.basename(mmd_path)} cannot be split to fit a URL and no local renderer is available")
+            results.append({
+                'file': mmd_path, 'success': False, 'seconds': 0.0,
+                'error': 'too large for URL, cannot be split and no local renderer'
+            })
+            continue
+
+        print(f"📄 Split {os.path.basename(mmd_path)} into {len(files) - 1} pages for the online renderer")
+        directory = os.path.dirname(mmd_path)
+        paths = []
+        for filename, text in files.items():
+            paths.append(os.path.join(directory, filename))
+            get_artifact_writer().write_text(paths[-1], text)
+        page_results = asyncio.run(_render_files(paths, output_dir, output_format, client_options))
+        errors = [result['error'] for result in page_results if not result['success']]
+        results.append({
+            'file': mmd_path,
+            'success': not errors,
+            'seconds': sum(result['seconds'] for result in page_results),
+            'error': errors[0] if errors else None,
+            'pages': len(files) - 1
+        })
+    return results
+
+def split_for_url(mmd_path, client, output_format='png'):
+    """Split a flowchart .mmd into linked pages that each fit in client's URLs; return {filename: text} or None
+
+    The page budget is halved until the index and every page fit. Only
+    flowcharts written by mermaid_diagrams can be read back and split.
+    """
+    with open(mmd_path, 'r', encoding='utf-8') as f:
+        diagram = parse_flowchart(f.read())
+    if diagram is None:
+        return None
+    budget = diagram_size(diagram)
+    while budget > 1:
+        budget //= 2
+        files = paginate_diagram(os.path.basename(mmd_path), diagram, budget, output_format)
+        if len(files) > 1 and all(fits_url(client, text, output_format) for text in files.values()):
+            return files
+    return None
+
+def fits_url(client, source, output_format='png'):
+    """Whether client can send source in a URL"""
+    try:
+        client.image_path(source, output_format)
+    except PayloadTooLargeError:
+        return False
+    return True
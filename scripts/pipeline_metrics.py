@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# pipeline_metrics.py
+# Per-stage timing spans, counters and optional cProfile and tracemalloc output for the pipeline CLIs
+
+import atexit
+import contextlib
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+from artifact_writer import ArtifactWriter
+
+# Allocation sites listed per stage in memory-profiling mode
+TOP_ALLOCATION_SITES = 10
+# The profiler's own allocations are left out of the allocation sites
+_UNTRACKED_FILES = {tracemalloc.__file__, __file__}
+
+class RunMetrics:
+    """Timing spans and counters collected over one run
+
+    A span times one stage or one item of a stage (a diagram, a file). Spans
+    opened inside another span record it as their parent; stage totals add up
+    the top-level spans of each name, so nested detail is never counted twice.
+
+    Once trace_memory() is called, top-level spans also record the peak traced
+    memory while they ran and the memory they left allocated, and each stage
+    keeps the source lines responsible for most of that retained memory.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now().astimezone()
+        self.origin = time.perf_counter()
+        self.spans = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.memory = False
+        self.peak_bytes = 0
+        self.allocation_sites = {}
+
+    def trace_memory(self, frames=1):
+        """Start tracemalloc so top-level spans report their memory use"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.memory = True
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Time the enclosed block as a span called name"""
+        stack = self.local.__dict__.setdefault('stack', [])
+        parent = stack[-1] if stack else None
+        measure = self.memory and parent is None
+        if measure:
+            # Peaks are only reset at the top level, so nested spans never hide a stage's peak
+            before = tracemalloc.take_snapshot()
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            if measure:
+                attributes.update(self._measure_memory(name, before, baseline))
+            self._add(name, start, seconds, parent, attributes)
+
+    def _measure_memory(self, name, before, baseline):
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        with self.lock:
+            self.peak_bytes = max(self.peak_bytes, peak)
+            sites = self.allocation_sites.setdefault(name, {})
+            # Filtering the grouped statistics is far cheaper than Snapshot.filter_traces over every trace
+            for stat in after.compare_to(before, 'lineno'):
+                frame = stat.traceback[0]
+                if stat.size_diff <= 0 or frame.filename in _UNTRACKED_FILES:
+                    continue
+                site = sites.setdefault(f"{frame.filename}:{frame.lineno}", {'bytes': 0, 'blocks': 0})
+                site['bytes'] += stat.size_diff
+                site['blocks'] += stat.count_diff
+        return {'peak_bytes': peak, 'retained_bytes': current - baseline}
+
+    def record_span(self, name, seconds, parent=None, **attributes):
+        """Record a span timed elsewhere, e.g. one render of a batch"""
+        self._add(name, time.perf_counter() - seconds, seconds, parent, attributes)
+
+    def _add(self, name, start, seconds, parent, attributes):
+        entry = {'name': name, 'start': start - self.origin, 'seconds': seconds}
+        if parent:
+            entry['parent'] = parent
+        entry.update(attributes)
+        with self.lock:
+            self.spans.append(entry)
+
+    def count(self, name, amount=1):
+        """Add amount to counter name"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        """Set counter name to value"""
+        with self.lock:
+            self.counters[name] = value
+
+    def stage_totals(self):
+        """Return {stage: {'seconds', 'spans'[, 'peak_bytes', 'retained_bytes']}} over top-level spans, in order of first appearance"""
+        stages = {}
+        first_start = {}
+        with self.lock:
+            for span in self.spans:
+                if 'parent' in span:
+                    continue
+                stage = stages.setdefault(span['name'], {'seconds': 0.0, 'spans': 0})
+                stage['seconds'] += span['seconds']
+                stage['spans'] += 1
+                if 'peak_bytes' in span:
+                    stage['peak_bytes'] = max(stage.get('peak_bytes', 0), span['peak_bytes'])
+                    stage['retained_bytes'] = stage.get('retained_bytes', 0) + span['retained_bytes']
+                first_start[span['name']] = min(first_start.get(span['name'], span['start']), span['start'])
+        return dict(sorted(stages.items(), key=lambda item: first_start[item[0]]))
+
+    def to_dict(self):
+        """Return the run's metrics as JSON-serializable data"""
+        stages = self.stage_totals()
+        with self.lock:
+            data = {
+                'run': self.name,
+                'started': self.started.isoformat(timespec='seconds'),
+                'seconds': time.perf_counter() - self.origin,
+                'stages': stages,
+                'counters': dict(sorted(self.counters.items())),
+                'spans': sorted(self.spans, key=lambda span: span['start'])
+            }
+            if self.memory:
+                data['memory'] = self._memory_report()
+        return data
+
+    def _memory_report(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        top_sites = {}
+        for name, sites in self.allocation_sites.items():
+            ranked = sorted(sites.items(), key=lambda item: item[1]['bytes'], reverse=True)[:TOP_ALLOCATION_SITES]
+            top_sites[name] = [dict(site=site, **totals) for site, totals in ranked]
+        return {
+            'peak_bytes': max(self.peak_bytes, peak),
+            'current_bytes': current,
+            'top_allocation_sites': top_sites
+        }
+
+    def summary(self):
+        """Return a one-line summary of the time (and peak memory, when traced) per stage"""
+        parts = []
+        for name, stage in self.stage_totals().items():
+            part = f"{name} {stage['seconds']:.2f}s"
+            if 'peak_bytes' in stage:
+                part += f" (peak {stage['peak_bytes'] / 1024 / 1024:.1f} MB)"
+            parts.append(part)
+        return ', '.join(parts) or 'no stages recorded'
+
+    def write_json(self, file_path):
+        """Save the metrics as JSON"""
+        writer = ArtifactWriter()
+        writer.write_json(file_path, self.to_dict())
+        writer.sync()
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics(name=None):
+    """Return the shared metrics of this run, created on first use"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = RunMetrics(name or os.path.basename(sys.argv[0]) or 'run')
+        return _metrics
+
+def count_requirement_matches(metrics, requirements):
+    """Record the number of matches per category (before deduplication) as matches.<category> counters"""
+    matches = requirements.get('matches', {})
+    for category, values in requirements.items():
+        if isinstance(values, list):
+            metrics.set(f"matches.{category}", matches.get(category, len(values)))
+
+def record_render_results(metrics, results, cached=0):
+    """Record per-diagram render spans and the attempted, failed and cached render counters"""
+    for result in results:
+        metrics.record_span('render_diagram', result['seconds'], parent='render',
+                            diagram=os.path.basename(result['file']), success=result['success'])
+    metrics.count('renders.attempted', len(results))
+    metrics.count('renders.failed', sum(1 for result in results if not result['success']))
+    metrics.count('renders.cached', cached)
+
+def record_writer(metrics, writer):
+    """Record the artifact writer's file and byte counters"""
+    metrics.set('files.written', writer.written)
+    metrics.set('files.unchanged', writer.unchanged)
+    metrics.set('bytes.written', writer.bytes_written)
+
+def write_metrics_at_exit(file_path, writer=None):
+    """Save the run's metrics to file_path when the process exits (after early returns too)"""
+    metrics = get_metrics()
+
+    def write():
+        if writer is not None:
+            record_writer(metrics, writer)
+        metrics.write_json(file_path)
+        print(f"📈 Metrics saved to: {file_path}")
+
+    atexit.register(write)
+
+def profile_memory_to_file_at_exit(file_path, writer=None, frames=1):
+    """Trace allocations per stage and save the metrics, memory report included, to file_path at exit
+
+    Only allocations made by Python code in this process are traced; mmdc and
+    worker processes are not included.
+    """
+    get_metrics().trace_memory(frames)
+    write_metrics_at_exit(file_path, writer)
+
+def profile_to_file_at_exit(file_path):
+    """Profile the rest of the run with cProfile and dump the stats to file_path at exit
+
+    Inspect the output with python -m pstats or a viewer such as snakeviz.
+    """
+    profiler = cProfile.Profile()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(file_path)
+        print(f"🔬 Profile saved to: {file_path}")
+
+    atexit.register(dump)
+    profiler.enable()
+    return profiler
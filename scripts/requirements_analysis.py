@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+# requirements_analysis.py
+# Shared single-pass requirements extraction engine for the Mermaid generators
+
+import heapq
+import mmap
+import os
+import re
+import time
+
+# Extraction rules shared by every generator. Each rule starts with literal
+# keywords and has exactly one capture group.
+USER_ACTION_RULE = r'user\s+(?:can\s+)?(?:should\s+)?(?:must\s+)?(\w+)'
+DECISION_POINT_RULE = r'(?:if|when|whether)\s+([^,\.]+)'
+VALIDATION_RULE_RULE = r'(?:validate|check|ensure)\s+([^,\.]+)'
+SYSTEM_INTERACTION_RULE = r'(?:system|application|app)\s+(?:should|must|can)\s+([^,\.]+)'
+DATA_ENTITY_RULE = r'(?:create|store|save|update|delete)\s+([^,\.]+)'
+BUSINESS_PROCESS_RULE = r'(?:process|workflow|step)\s+([^,\.]+)'
+INTEGRATION_RULE = r'(?:integrate|connect|api|service)\s+([^,\.]+)'
+
+# Rule set used by generate-mermaid-diagrams.py
+BASIC_RULES = {
+    'user_actions': USER_ACTION_RULE,
+    'decision_points': DECISION_POINT_RULE,
+    'validation_rules': VALIDATION_RULE_RULE,
+    'system_interactions': SYSTEM_INTERACTION_RULE,
+    'data_entities': DATA_ENTITY_RULE
+}
+
+# Rule set used by enhanced-mermaid-generator.py (decisions stop at line ends)
+ENHANCED_RULES = dict(BASIC_RULES, decision_points=r'(?:if|when|whether)\s+([^,\.\n]+)')
+
+# Rule set used by enhanced-iterative-mermaid-generator.py
+ITERATIVE_RULES = dict(
+    BASIC_RULES,
+    business_processes=BUSINESS_PROCESS_RULE,
+    integrations=INTEGRATION_RULE
+)
+
+# Default window for streaming analysis; peak memory stays around this size
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Most frequent distinct captures kept per category; None keeps every distinct capture
+DEFAULT_TOP_K = 20
+
+# Stripped from both ends of a capture before counting
+CAPTURE_TRIM = " \t\r\n'\"`-:;()[]"
+
+# No rule can match across these characters, so chunks may safely end after them.
+# Line ends alone are not safe: captures such as [^,.]+ run across newlines.
+CHUNK_BOUNDARIES = (b'.', b',')
+
+_scanner_cache = {}
+
+def _leading_keywords(rule):
+    """Return the literal keywords a rule starts with, or None if it has none"""
+    match = re.match(r'\(\?:([\w|]+)\)|(\w+)', rule)
+    if not match:
+        return None
+    keywords = [keyword.lower() for keyword in (match.group(1) or match.group(2)).split('|')]
+    return keywords if all(keywords) else None
+
+class RequirementsScanner:
+    """Compile a set of category rules into one scanner that tags every match"""
+
+    def __init__(self, rules, flags=re.IGNORECASE):
+        self.categories = list(rules)
+        self.rule_patterns = {}
+        keyword_categories = {}
+
+        for category, rule in rules.items():
+            compiled = re.compile(rule, flags)
+            if compiled.groups != 1:
+                raise ValueError(f"Rule for '{category}' must have exactly one capture group")
+            self.rule_patterns[category] = compiled
+
+            keywords = _leading_keywords(rule)
+            if keywords is None:
+                raise ValueError(f"Rule for '{category}' must start with literal keywords")
+            for keyword in keywords:
+                keyword_categories.setdefault(keyword, []).append(category)
+
+        # Longest keywords first, so a hit always reports the longest keyword at that position
+        keywords = sorted(keyword_categories, key=len, reverse=True)
+        # Every category owning a keyword that is a prefix of the reported one is a candidate
+        self.candidates = {
+            keyword: [
+                category for category in self.categories
+                if any(keyword.startswith(other) and category in keyword_categories[other]
+                       for other in keywords)
+            ]
+            for keyword in keywords
+        }
+        alternation = '|'.join(re.escape(keyword) for keyword in keywords)
+        # Zero-width so overlapping keywords of different categories are all seen
+        self.keyword_pattern = re.compile(f"(?=({alternation}))")
+        self.keyword_pattern_ignorecase = re.compile(f"(?=({alternation}))", re.IGNORECASE)
+
+    def scan(self, text, start=0, end=None):
+        """Yield (category, capture, position) for every match in one pass over text"""
+        if end is None:
+            end = len(text)
+
+        # Keyword search is much faster case-sensitively on a lowered copy; that is only
+        # position-compatible when lowering does not change the text length
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            hits = self.keyword_pattern.finditer(lowered, start, end)
+        else:
+            hits = self.keyword_pattern_ignorecase.finditer(text, start, end)
+
+        # Next allowed start per category, mirroring re.findall's non-overlapping scan
+        resume_at = dict.fromkeys(self.categories, start)
+        rule_patterns = self.rule_patterns
+        candidates = self.candidates
+
+        for hit in hits:
+            position = hit.start()
+            for category in candidates[hit.group(1).lower()]:
+                if position < resume_at[category]:
+                    continue
+                match = rule_patterns[category].match(text, position, end)
+                if match:
+                    resume_at[category] = match.end()
+                    yield category, match.group(1), position
+
+    def extract(self, text, start=0, end=None):
+        """Return {category: [captures]} in document order, like one re.findall per rule"""
+        results = {category: [] for category in self.categories}
+        for category, capture, _ in self.scan(text, start, end):
+            results[category].append(capture)
+        return results
+
+    def tally(self, text, tally=None, start=0, end=None, source=None):
+        """Count the normalized captures of every category into tally (a new CaptureTally if None)"""
+        tally = tally if tally is not None else CaptureTally(self.categories)
+        add = tally.add
+        for category, capture, _ in self.scan(text, start, end):
+            add(category, capture, source)
+        return tally
+
+def normalize_capture(capture):
+    """Return (key, label): the capture with whitespace collapsed and ends trimmed, and its case-folded key"""
+    label = ' '.join(capture.split()).strip(CAPTURE_TRIM)
+    return label.casefold(), label
+
+class CaptureTally:
+    """Per-category counts of distinct captures, in order of first appearance
+
+    Each distinct capture is stored once as [count, label, source] where label
+    is its first spelling and source the document it was first seen in, so
+    memory grows with the vocabulary of a document rather than its length.
+    """
+
+    __slots__ = ('categories', 'entries', 'matches')
+
+    def __init__(self, categories):
+        self.categories = list(categories)
+        self.entries = {category: {} for category in self.categories}
+        self.matches = dict.fromkeys(self.categories, 0)
+
+    def add(self, category, capture, source=None, count=1):
+        """Count one capture (or count of them) of category; return its entry if it is a new distinct item
+
+        Blank captures are ignored.
+        """
+        key, label = normalize_capture(capture)
+        if not key:
+            return None
+        self.matches[category] += count
+        entry = self.entries[category].get(key)
+        if entry is None:
+            entry = self.entries[category][key] = [count, label, source]
+            return entry
+        entry[0] += count
+        return None
+
+    def update(self, other):
+        """Add the counts of another tally, whose items are taken to come later in the documents"""
+        for category in other.categories:
+            entries = self.entries.setdefault(category, {})
+            if category not in self.matches:
+                self.categories.append(category)
+                self.matches[category] = 0
+            self.matches[category] += other.matches[category]
+            for key, (count, label, source) in other.entries[category].items():
+                entry = entries.get(key)
+                if entry is None:
+                    entries[key] = [count, label, source]
+                else:
+                    entry[0] += count
+
+    def subtract(self, other):
+        """Remove the counts of a tally added earlier; items whose count drops to zero are dropped"""
+        for category in other.categories:
+            entries = self.entries[category]
+            self.matches[category] -= other.matches[category]
+            for key, (count, _, _) in other.entries[category].items():
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                entry[0] -= count
+                if entry[0] <= 0:
+                    del entries[key]
+
+    def top(self, category, k=DEFAULT_TOP_K):
+        """Return the k most frequent [count, label, source] entries; ties keep first-appearance order
+
+        A bounded heap keeps this O(n log k), so the full list is never sorted.
+        """
+        entries = self.entries[category].values()
+        if k is None:
+            return sorted(entries, key=lambda entry: entry[0], reverse=True)
+        return heapq.nlargest(k, entries, key=lambda entry: entry[0])
+
+    def ranked(self, top_k=DEFAULT_TOP_K, sources=False):
+        """Return {category: [labels]} ranked by frequency, with 'counts' and 'matches' (and 'sources')
+
+        counts maps each listed label to its number of occurrences and matches
+        holds the total number of captures per category before deduplication.
+        """
+        results = {}
+        counts = {}
+        first_sources = {}
+        for category in self.categories:
+            top = self.top(category, top_k)
+            results[category] = [label for _, label, _ in top]
+            counts[category] = {label: count for count, label, _ in top}
+            first_sources[category] = [source for _, _, source in top]
+        results['counts'] = counts
+        results['matches'] = dict(self.matches)
+        if sources:
+            results['sources'] = first_sources
+        return results
+
+class LazyRequirements:
+    """Requirements extracted on demand, scanning only as far as the categories are read
+
+    One shared pass over the text feeds every category, so whatever was
+    scanned for one category is cached for the others and never rescanned.
+    Categories list distinct items in document order; reading a prefix such
+    as requirements['decision_points'][:4] stops the scan as soon as four are
+    found, while to_dict() or ranked() drain the rest of the text. A category
+    still empty once the text is exhausted reads as its entry in defaults.
+    """
+
+    def __init__(self, scanner, chunks, defaults=None):
+        self.categories = scanner.categories
+        self.defaults = defaults or {}
+        self.tally = CaptureTally(self.categories)
+        self.seen = {category: [] for category in self.categories}
+        self.exhausted = False
+        self._matches = self._scan(scanner, chunks)
+
+    @staticmethod
+    def _scan(scanner, chunks):
+        for chunk in chunks:
+            for category, capture, _ in scanner.scan(chunk):
+                yield category, capture
+
+    def _advance(self):
+        """Consume one more match; return False once the text is exhausted"""
+        for category, capture in self._matches:
+            entry = self.tally.add(category, capture)
+            if entry is not None:
+                self.seen[category].append(entry[1])
+            return True
+        self.exhausted = True
+        return False
+
+    def items(self, category):
+        """Return the distinct items of category found so far (its defaults if it ended up empty)"""
+        seen = self.seen[category]
+        if not seen and self.exhausted:
+            return self.defaults.get(category, seen)
+        return seen
+
+    def head(self, category, n):
+        """Return the first n distinct items of category, scanning no further than needed"""
+        seen = self.seen[category]
+        while len(seen) < n and self._advance():
+            pass
+        return self.items(category)[:n]
+
+    def complete(self):
+        """Scan the rest of the text"""
+        while self._advance():
+            pass
+
+    def __getitem__(self, category):
+        if category not in self.seen:
+            raise KeyError(category)
+        return LazyCategory(self, category)
+
+    def __contains__(self, category):
+        return category in self.seen
+
+    def to_dict(self):
+        """Return every distinct item per category in document order, with 'counts' and 'matches'"""
+        self.complete()
+        results = {category: list(self.seen[category]) for category in self.categories}
+        results['counts'] = {
+            category: {label: count for count, label, _ in self.tally.entries[category].values()}
+            for category in self.categories
+        }
+        results['matches'] = dict(self.tally.matches)
+        return results
+
+    def ranked(self, top_k=DEFAULT_TOP_K):
+        """Return the results ranked by frequency, as extract_requirements does"""
+        self.complete()
+        return self.tally.ranked(top_k)
+
+class LazyCategory:
+    """Read-only sequence view of one category of a LazyRequirements"""
+
+    __slots__ = ('model', 'category')
+
+    def __init__(self, model, category):
+        self.model = model
+        self.category = category
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.stop is not None and index.stop >= 0 and (index.start or 0) >= 0:
+                self.model.head(self.category, index.stop)
+            else:
+                self.model.complete()
+        elif index >= 0:
+            self.model.head(self.category, index + 1)
+        else:
+            self.model.complete()
+        return self.model.items(self.category)[index]
+
+    def __iter__(self):
+        seen = self.model.seen[self.category]
+        position = 0
+        while True:
+            if position < len(seen):
+                yield seen[position]
+                position += 1
+            elif not self.model._advance():
+                break
+        if not seen:
+            yield from self.model.items(self.category)
+
+    def __len__(self):
+        self.model.complete()
+        return len(self.model.items(self.category))
+
+    def __bool__(self):
+        return bool(self.model.head(self.category, 1))
+
+    def __repr__(self):
+        state = 'complete' if self.model.exhausted else 'partial'
+        return f"LazyCategory({self.category!r}, {self.model.seen[self.category]!r}, {state})"
+
+def resolve_requirements(requirements):
+    """Return requirements with every lazy category completed into a list, adding its counts and matches"""
+    resolved = {}
+    model = None
+    for key, value in requirements.items():
+        if isinstance(value, LazyCategory):
+            model = value.model
+            value = list(value)
+        resolved[key] = value
+    if model is not None:
+        complete = model.to_dict()
+        resolved.setdefault('counts', complete['counts'])
+        resolved.setdefault('matches', complete['matches'])
+    return resolved
+
+def get_scanner(rules):
+    """Return a cached scanner for a rule set so patterns are compiled once per process"""
+    key = tuple(rules.items())
+    scanner = _scanner_cache.get(key)
+    if scanner is None:
+        scanner = _scanner_cache[key] = RequirementsScanner(rules)
+    return scanner
+
+def extract_requirements(text, rules=ITERATIVE_RULES, top_k=DEFAULT_TOP_K):
+    """Extract every rule category from text in a single pass, deduplicated and ranked by frequency"""
+    return get_scanner(rules).tally(text).ranked(top_k)
+
+def extract_requirements_lazy(text, rules=ITERATIVE_RULES, defaults=None):
+    """Return a LazyRequirements over text; categories are scanned only as far as they are read"""
+    return LazyRequirements(get_scanner(rules), [text], defaults)
+
+def extract_requirements_multipass(text, rules=ITERATIVE_RULES):
+    """Reference implementation: one re.findall pass per category"""
+    return {
+        category: re.findall(rule, text, re.IGNORECASE)
+        for category, rule in rules.items()
+    }
+
+def _find_chunk_end(buffer, start, limit, size):
+    """Return the end of the chunk starting at start, cut after a sentence boundary"""
+    if limit >= size:
+        return size
+
+    while True:
+        cut = max(buffer.rfind(boundary, start, limit) for boundary in CHUNK_BOUNDARIES)
+        if cut != -1:
+            return cut + 1
+        # No boundary in the window yet: widen it rather than cut through a match
+        if limit >= size:
+            return size
+        start, limit = limit, min(size, limit + (limit - start))
+
+def iter_requirement_chunks(file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield decoded chunks of a requirements file via mmap, split on sentence boundaries"""
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return
+
+    with open(file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            start = 0
+            while start < size:
+                end = _find_chunk_end(buffer, start, start + chunk_size, size)
+                # Boundary bytes are ASCII, so a cut never splits a UTF-8 sequence
+                yield buffer[start:end].decode('utf-8', errors='replace')
+                start = end
+
+def extract_requirements_streaming(file_path, rules=ITERATIVE_RULES, chunk_size=DEFAULT_CHUNK_SIZE,
+                                   top_k=DEFAULT_TOP_K):
+    """Extract every rule category from a file chunk by chunk; returns (ranked results, stats)
+
+    Only the counts of distinct captures are kept between chunks, never the raw captures.
+    """
+    scanner = get_scanner(rules)
+    tally = CaptureTally(scanner.categories)
+    started = time.perf_counter()
+    chunks = 0
+
+    for chunk in iter_requirement_chunks(file_path, chunk_size):
+        chunks += 1
+        scanner.tally(chunk, tally)
+    results = tally.ranked(top_k)
+
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(file_path)
+    stats = {
+        'bytes': size,
+        'chunks': chunks,
+        'seconds': elapsed,
+        'bytes_per_second': size / elapsed if elapsed > 0 else 0.0
+    }
+    return results, stats
+
+def extract_requirements_streaming_lazy(file_path, rules=ITERATIVE_RULES, chunk_size=DEFAULT_CHUNK_SIZE,
+                                        defaults=None):
+    """Return a LazyRequirements over a file; chunks past the last one a reader needed are never read"""
+    return LazyRequirements(get_scanner(rules), iter_requirement_chunks(file_path, chunk_size), defaults)
+
+def format_throughput(stats):
+    """Return a human readable throughput line for streaming stats"""
+    return (
+        f"{stats['bytes'] / (1024 * 1024):.1f} MB in {stats['seconds']:.2f}s "
+        f"({stats['bytes_per_second'] / (1024 * 1024):.1f} MB/s, {stats['chunks']} chunks)"
+    )
+
+def plan_corpus_tasks(file_paths, task_size=DEFAULT_CHUNK_SIZE):
+    """Split every document into (document_index, path, start, end) byte ranges"""
+    tasks = []
+    for index, file_path in enumerate(file_paths):
+        size = os.path.getsize(file_path)
+        if size == 0:
+            continue
+        with open(file_path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                start = 0
+                while start < size:
+                    end = _find_chunk_end(buffer, start, start + task_size, size)
+                    tasks.append((index, file_path, start, end))
+                    start = end
+    return tasks
+
+def _analyze_corpus_task(task, rules):
+    """Tally one byte range of one document (runs inside a worker process)"""
+    index, file_path, start, end = task
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8', errors='replace')
+    return index, start, get_scanner(rules).tally(text, source=index)
+
+def merge_requirement_results(documents, tallies, categories, top_k=DEFAULT_TOP_K):
+    """Merge tallies given in document order into ranked results with the source document of every item"""
+    merged = CaptureTally(categories)
+    for tally in tallies:
+        merged.update(tally)
+
+    results = merged.ranked(top_k, sources=True)
+    results['documents'] = list(documents)
+    return results
+
+def extract_requirements_corpus(file_paths, rules=ITERATIVE_RULES, workers=None, task_size=DEFAULT_CHUNK_SIZE,
+                                top_k=DEFAULT_TOP_K):
+    """Extract every document of a corpus on a process pool; returns (merged, stats)
+
+    Large documents are split into independent byte ranges so a single big
+    file does not serialize the pool. Workers send back only their tallies,
+    which are merged in document and offset order so ties rank by first appearance.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+
+    started = time.perf_counter()
+    tasks = plan_corpus_tasks(file_paths, task_size)
+    workers = workers or os.cpu_count() or 1
+    analyze = partial(_analyze_corpus_task, rules=rules)
+
+    if workers == 1 or len(tasks) <= 1:
+        results = [analyze(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            results = list(pool.map(analyze, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+
+    # Merge the ranges in file order
+    tallies = [tally for _, _, tally in sorted(results, key=lambda result: (result[0], result[1]))]
+    merged = merge_requirement_results(file_paths, tallies, list(rules), top_k)
+
+    elapsed = time.perf_counter() - started
+    size = sum(os.path.getsize(file_path) for file_path in file_paths)
+    stats = {
+        'bytes': size,
+        'chunks': len(tasks),
+        'documents': len(file_paths),
+        'workers': workers,
+        'seconds': elapsed,
+        'bytes_per_second': size / elapsed if elapsed > 0 else 0.0
+    }
+    return merged, stats
@@ -120,6 +120,8 @@ ls -la Stage1_Mermaid_Generation/diagrams/images/*.png 2>/dev/null || echo "   N
 
 # Step 8: Generate summary report
 print_status "Generating summary report..."
+# Replace the report rather than truncate it: published files may be hardlinked into other runs
+rm -f Stage1_Mermaid_Generation/diagrams/generation_report.md
 cat > Stage1_Mermaid_Generation/diagrams/generation_report.md << EOF
 # Stage 1 Mermaid Generation Report
 
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# stage1_manifest.py
+# Input-to-diagram dependency manifest for incremental Stage 1 regeneration
+
+import hashlib
+import json
+import os
+
+from artifact_writer import get_artifact_writer
+
+MANIFEST_FILENAME = 'stage1_manifest.json'
+MANIFEST_VERSION = 1
+
+def hash_bytes(data):
+    """Return the SHA-256 hex digest of bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+def hash_text(text):
+    """Return the SHA-256 hex digest of text"""
+    return hash_bytes(text.encode('utf-8'))
+
+def hash_value(value):
+    """Return a stable hash of any JSON-serializable value"""
+    return hash_text(json.dumps(value, sort_keys=True, ensure_ascii=False))
+
+def hash_file(file_path):
+    """Return the SHA-256 hex digest of a file, or None if it does not exist"""
+    digest = hashlib.sha256()
+    try:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+class DiagramManifest:
+    """Records, per output file, the inputs it was built from and the hash of what was written
+
+    An output is current when its input hash matches the recorded one and the
+    file on disk still has the recorded output hash.
+    """
+
+    def __init__(self, directory, filename=MANIFEST_FILENAME):
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """Load the manifest, starting empty if it is missing or unreadable"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('outputs', {})
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def save(self):
+        """Write the manifest next to the outputs it describes"""
+        data = {'version': MANIFEST_VERSION, 'outputs': self.entries}
+        get_artifact_writer().write_text(self.path, json.dumps(data, indent=2, sort_keys=True))
+
+    def is_current(self, name, input_hash):
+        """Whether output name was built from input_hash and is unchanged on disk"""
+        entry = self.entries.get(name)
+        if not entry or entry.get('input_hash') != input_hash:
+            return False
+        return hash_file(os.path.join(self.directory, name)) == entry.get('output_hash')
+
+    def record(self, name, depends_on, input_hash, output_hash):
+        """Remember what output name was built from"""
+        self.entries[name] = {
+            'depends_on': list(depends_on),
+            'input_hash': input_hash,
+            'output_hash': output_hash
+        }
+
+    def dependents(self, name, suffix=''):
+        """Return the recorded outputs built directly from output name (optionally only those ending in suffix)"""
+        return sorted(
+            output for output, entry in self.entries.items()
+            if entry.get('depends_on') == [name] and output.endswith(suffix)
+        )
+
+    def forget(self, name):
+        """Drop the entry for an output that is no longer produced"""
+        self.entries.pop(name, None)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# stage1_staging.py
+# Per-run staging directories published atomically under an advisory lock
+
+import contextlib
+import os
+import secrets
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Staging directories of runs that crashed are removed once they are this old
+STALE_STAGING_SECONDS = 24 * 60 * 60
+STAGING_SUFFIX = '.staging'
+
+@contextlib.contextmanager
+def advisory_lock(lock_path):
+    """Hold an exclusive advisory lock on lock_path (blocking)"""
+    with open(lock_path, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _link_or_copy(source, destination):
+    """Hardlink source to destination, copying where the filesystem has no hardlinks"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+def _list_files(root):
+    """Return the paths, relative to root, of every file and symlink below root"""
+    files = set()
+    pending = ['']
+    while pending:
+        relative = pending.pop()
+        for entry in os.scandir(os.path.join(root, relative)):
+            path = os.path.join(relative, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                pending.append(path)
+            else:
+                files.add(path)
+    return files
+
+def _same_file(source, destination):
+    """Whether both paths name the same inode (an output the run left unchanged)"""
+    try:
+        return os.path.samefile(source, destination)
+    except OSError:
+        return False
+
+class StagedRun:
+    """Builds one run's outputs in a private directory and publishes them into target_dir
+
+    The staging directory lives in <parent>/.<name>.runs/ and is seeded with
+    hardlinks to the published outputs, so incremental regeneration and
+    user-edited files carry over without copying them; every writer replaces
+    files by rename rather than writing into them, so a published file is
+    never modified through its link. Publishing renames each new or changed
+    file into target_dir, so readers never see a partly written file, and
+    deletes the files the run removed; target_dir stays a plain directory,
+    tracked files included. Seeding and publishing take <parent>/.<name>.lock;
+    the build itself runs unlocked, so any number of runs can build in
+    parallel and the last to publish wins. With enabled=False the run writes
+    straight into target_dir.
+    """
+
+    def __init__(self, target_dir, enabled=True):
+        self.target = target_dir
+        self.target_dir = os.path.abspath(target_dir)
+        self.enabled = enabled
+        parent, name = os.path.split(self.target_dir)
+        self.runs_dir = os.path.join(parent, f".{name}.runs")
+        self.lock_path = os.path.join(parent, f".{name}.lock")
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{secrets.token_hex(3)}"
+        self.staging_dir = None
+        self.seeded = set()
+        self.published = False
+
+    def open(self):
+        """Create and seed the staging directory; return the directory to write into"""
+        if not self.enabled:
+            os.makedirs(self.target_dir, exist_ok=True)
+            return self.target
+
+        self.staging_dir = os.path.join(self.runs_dir, self.run_id + STAGING_SUFFIX)
+        with advisory_lock(self.lock_path):
+            if os.path.isdir(self.target_dir):
+                shutil.copytree(os.path.realpath(self.target_dir), self.staging_dir, symlinks=True,
+                                copy_function=_link_or_copy)
+                self.seeded = _list_files(self.staging_dir)
+            else:
+                os.makedirs(self.staging_dir)
+        return self.staging_dir
+
+    def publish(self):
+        """Move the staged outputs into target_dir; return target_dir as given"""
+        if not self.enabled or self.published:
+            return self.target
+
+        with advisory_lock(self.lock_path):
+            if os.path.islink(self.target_dir):
+                # Published as a symlink to a run directory by earlier versions: make it a plain directory again
+                os.unlink(self.target_dir)
+            for directory, _, _ in os.walk(self.staging_dir):
+                os.makedirs(os.path.join(self.target_dir, os.path.relpath(directory, self.staging_dir)), exist_ok=True)
+            staged = _list_files(self.staging_dir)
+            for relative in sorted(staged):
+                source = os.path.join(self.staging_dir, relative)
+                destination = os.path.join(self.target_dir, relative)
+                if not _same_file(source, destination):
+                    os.replace(source, destination)
+            for relative in self.seeded - staged:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.target_dir, relative))
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self._remove_stale_runs()
+        self.published = True
+        return self.target
+
+    def discard(self):
+        """Delete the staging directory of a run that will not be published"""
+        if self.enabled and not self.published and self.staging_dir:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _remove_stale_runs(self):
+        """Delete staging directories of crashed runs and run directories left by earlier versions"""
+        now = time.time()
+        for entry in os.scandir(self.runs_dir):
+            if entry.name.endswith(STAGING_SUFFIX):
+                try:
+                    if now - entry.stat(follow_symlinks=False).st_mtime <= STALE_STAGING_SECONDS:
+                        continue
+                except FileNotFoundError:
+                    continue
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(entry.path)
+        with contextlib.suppress(OSError):
+            os.rmdir(self.runs_dir)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.publish()
+        else:
+            self.discard()
+        return False
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# synthetic_corpus.py
+# Synthetic requirements documents of any size with a tunable density of extractable phrases
+
+import random
+import re
+
+# Fraction of lines carrying each phrase kind; the remaining lines are filler no rule extracts
+DEFAULT_DENSITY = {'user_can': 0.2, 'conditional': 0.15, 'system_should': 0.2}
+
+PHRASE_TEMPLATES = {
+    'user_can': (
+        "User can {verb} the {noun} from the {place}.",
+        "User should {verb} each {noun} before the deadline.",
+        "User must {verb} a {noun} for every {period}."
+    ),
+    'conditional': (
+        "If the {noun} is {state}, the {place} shows a warning.",
+        "When a {noun} is {state}, the {noun2} is flagged for review.",
+        "Whether the {noun} is {state} depends on the {noun2}."
+    ),
+    'system_should': (
+        "The system should {verb} the {noun} within one {period}.",
+        "The application must {verb} every {noun} in the {place}.",
+        "The app can {verb} the {noun} on request."
+    )
+}
+# Filler avoids every rule keyword, so it only adds bytes to scan
+FILLER_TEMPLATES = (
+    "The {noun} belongs to the {team} team and is reviewed each {period}.",
+    "Each {noun} carries a {state} label on the {place}.",
+    "Reports list the {noun} next to the {noun2} for the {team} team."
+)
+VOCABULARY = {
+    'verb': ('submit', 'approve', 'review', 'export', 'upload', 'archive', 'reject', 'assign', 'download', 'edit'),
+    'noun': ('timesheet', 'expense report', 'leave request', 'project code', 'invoice', 'shift', 'entry',
+             'attachment', 'comment', 'budget'),
+    'noun2': ('manager', 'payroll run', 'audit log', 'cost centre', 'calendar', 'team lead'),
+    'place': ('dashboard', 'review page', 'mobile view', 'summary table', 'inbox'),
+    'state': ('missing', 'overdue', 'incomplete', 'duplicated', 'locked', 'rejected'),
+    'period': ('day', 'week', 'month', 'quarter'),
+    'team': ('finance', 'operations', 'engineering', 'sales', 'support')
+}
+FIELD_PATTERN = re.compile(r"\{(\w+)\}")
+
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+SIZE_PATTERN = re.compile(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*$", re.IGNORECASE)
+
+# Distinct blocks generated per corpus; larger corpora repeat them in random order
+BLOCK_SIZE = 1024 * 1024
+MAX_DISTINCT_BLOCKS = 16
+
+def parse_size(text):
+    """Parse '512', '1KB', '10 MB' or '1GB' (binary units) into bytes"""
+    match = SIZE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid size: {text!r} (expected e.g. 1KB, 10MB, 1GB)")
+    unit = match.group(2).upper()
+    if unit and not unit.endswith('B'):
+        unit += 'B'
+    return int(float(match.group(1)) * SIZE_UNITS[unit])
+
+def format_size(size):
+    """Return a short binary-unit size such as 1KB or 1.5MB"""
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= SIZE_UNITS[unit]:
+            return f"{size / SIZE_UNITS[unit]:g}{unit}"
+    return f"{size}B"
+
+def parse_density(text):
+    """Parse 'user_can=0.3,conditional=0.1' into a density dict over DEFAULT_DENSITY"""
+    density = dict(DEFAULT_DENSITY)
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        kind, _, value = item.partition('=')
+        if kind not in DEFAULT_DENSITY:
+            raise ValueError(f"Unknown phrase kind {kind!r} (expected one of {', '.join(DEFAULT_DENSITY)})")
+        density[kind] = float(value)
+    if any(value < 0 for value in density.values()) or sum(density.values()) > 1:
+        raise ValueError("Phrase densities must be non-negative and sum to at most 1")
+    return density
+
+def _fill(template, rng):
+    return FIELD_PATTERN.sub(lambda match: rng.choice(VOCABULARY[match.group(1)]), template)
+
+def generate_lines(rng, size, density):
+    """Return ([(kind, line)], bytes) for about size bytes of requirement lines; kind is None for filler"""
+    kinds = list(density)
+    thresholds = []
+    total = 0.0
+    for kind in kinds:
+        total += density[kind]
+        thresholds.append(total)
+
+    lines = []
+    produced = 0
+    while produced < size:
+        roll = rng.random()
+        kind = next((kind for kind, threshold in zip(kinds, thresholds) if roll < threshold), None)
+        templates = PHRASE_TEMPLATES[kind] if kind else FILLER_TEMPLATES
+        line = _fill(rng.choice(templates), rng) + "\n"
+        lines.append((kind, line))
+        produced += len(line)
+    return lines, produced
+
+def write_requirements_corpus(file_path, size, density=None, seed=0):
+    """Write a synthetic requirements document of exactly size bytes; return its stats
+
+    Up to MAX_DISTINCT_BLOCKS blocks of BLOCK_SIZE are generated and written in
+    seeded random order, so a 1 GB corpus costs as much to build as a 16 MB one
+    and memory stays around that size. Stats count the lines of each kind.
+    """
+    density = density or DEFAULT_DENSITY
+    rng = random.Random(seed)
+    blocks = []
+    counts = dict.fromkeys(density, 0)
+    counts['filler'] = 0
+    written = 0
+
+    with open(file_path, 'w', encoding='utf-8', newline='\n') as f:
+        while written < size:
+            if len(blocks) < MAX_DISTINCT_BLOCKS:
+                lines, _ = generate_lines(rng, min(BLOCK_SIZE, size - written), density)
+                block_counts = dict.fromkeys(counts, 0)
+                for kind, _ in lines:
+                    block_counts[kind or 'filler'] += 1
+                blocks.append((lines, ''.join(line for _, line in lines), block_counts))
+                lines, text, block_counts = blocks[-1]
+            else:
+                lines, text, block_counts = rng.choice(blocks)
+
+            if written + len(text) <= size:
+                f.write(text)
+                written += len(text)
+                for kind, count in block_counts.items():
+                    counts[kind] += count
+                continue
+
+            # Last block: whole lines while they fit, then pad the remainder with spaces
+            for kind, line in lines:
+                if written + len(line) > size:
+                    break
+                f.write(line)
+                written += len(line)
+                counts[kind or 'filler'] += 1
+            f.write(' ' * (size - written))
+            written = size
+
+    return {'bytes': written, 'seed': seed, 'density': density, 'lines': counts}